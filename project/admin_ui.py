@@ -2,7 +2,7 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                             QPushButton, QTableWidget, QTableWidgetItem, QMessageBox)
 from PyQt5.QtGui import QFont
 from PyQt5.QtCore import Qt
-import requests
+import conditional_get
 import matplotlib.pyplot as plt
 
 API = "http://127.0.0.1:5001"
@@ -106,7 +106,7 @@ class AdminTab(QWidget):
     def show_weekly_stats(self):
         try:
             headers = {"Authorization": f"Bearer {self.token}"}
-            data = requests.get(f"{API}/analytics/ride_counts", headers=headers).json()
+            data = conditional_get.get(f"{API}/analytics/ride_counts", headers=headers).json()
             
             days = [d["day"] for d in data]
             cnts = [d["count"] for d in data]
@@ -126,7 +126,7 @@ class AdminTab(QWidget):
     def show_user_stats(self):
         try:
             headers = {"Authorization": f"Bearer {self.token}"}
-            data = requests.get(f"{API}/analytics/user_rides", headers=headers).json()
+            data = conditional_get.get(f"{API}/analytics/user_rides", headers=headers).json()
             
             users = [d["rider_name"] for d in data]
             cnts = [d["count"] for d in data]
@@ -146,7 +146,7 @@ class AdminTab(QWidget):
     def load_recent_rides(self):
         try:
             headers = {"Authorization": f"Bearer {self.token}"}
-            resp = requests.get(f"{API}/analytics/recent_rides", headers=headers)
+            resp = conditional_get.get(f"{API}/analytics/recent_rides", headers=headers)
             
             if resp.ok:
                 rides = resp.json()
@@ -0,0 +1,198 @@
+"""Ride summary tables kept current in the same transaction as ride writes.
+
+The dashboard endpoints read these instead of grouping the whole rides table.
+If they ever drift (for example after editing rides by hand), rebuild them:
+
+    python analytics.py rebuild
+"""
+import sys
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, Tuple
+
+from sqlalchemy import (
+    Column, Date, DateTime, Index, Integer, MetaData, String, Table, cast, column, delete, extract, func,
+    insert, select, table, text,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+metadata = MetaData()
+
+# Bumps the rides change counter behind the dashboards' ETags; the rides
+# triggers run it on every write, and rebuild() runs it once
+RIDES_COUNTER_SQL = "UPDATE change_counters SET counter = counter + 1 WHERE name = 'rides'"
+
+# The rides columns rebuild() reads, without importing the backend's models
+rides = table(
+    "rides",
+    column("created_at", DateTime), column("user_id", Integer),
+    column("rider_name", String), column("status", String),
+)
+
+ride_daily_counts = Table(
+    "ride_daily_counts", metadata,
+    Column("day", String, primary_key=True),
+    Column("count", Integer, nullable=False, default=0),
+)
+
+# Weekdays as SQLite's strftime('%w') and PostgreSQL's extract(dow) number them: 0 is Sunday
+ride_weekday_counts = Table(
+    "ride_weekday_counts", metadata,
+    Column("weekday", Integer, primary_key=True),
+    Column("count", Integer, nullable=False, default=0),
+)
+
+ride_user_counts = Table(
+    "ride_user_counts", metadata,
+    Column("user_id", Integer, primary_key=True),
+    Column("rider_name", String, nullable=False),
+    Column("count", Integer, nullable=False, default=0),
+    Index("ix_ride_user_counts_count", "count"),
+)
+
+ride_status_counts = Table(
+    "ride_status_counts", metadata,
+    Column("status", String, primary_key=True),
+    Column("count", Integer, nullable=False, default=0),
+)
+
+
+def _insert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise NotImplementedError(f"summary upserts are not implemented for {dialect}")
+
+
+def _day(db: Session, created_at):
+    """``created_at`` as a ``YYYY-MM-DD`` string, the key of ride_daily_counts."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return cast(cast(created_at, Date), String)
+    if dialect == "sqlite":
+        return func.date(created_at)
+    raise NotImplementedError(f"summary rebuilds are not implemented for {dialect}")
+
+
+def _bump(db: Session, table, key: dict, delta: int, **extra):
+    if not delta:
+        return
+    stmt = _insert(db)(table).values(**key, **extra, count=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key),
+        set_={"count": table.c.count + stmt.excluded.count, **{k: stmt.excluded[k] for k in extra}},
+    )
+    db.execute(stmt)
+
+
+def weekday_of(created_at: datetime) -> int:
+    return (created_at.weekday() + 1) % 7
+
+
+def record_rides_created(db: Session, rides: Iterable[Tuple[datetime, int, str, str]]):
+    """Count new rides given as ``(created_at, user_id, rider_name, status)``.
+
+    Call inside the transaction that inserts the rides, before committing.
+    """
+    days, weekdays, users, statuses = Counter(), Counter(), Counter(), Counter()
+    names = {}
+    for created_at, user_id, rider_name, ride_status in rides:
+        days[created_at.date().isoformat()] += 1
+        weekdays[weekday_of(created_at)] += 1
+        users[user_id] += 1
+        names[user_id] = rider_name
+        statuses[ride_status] += 1
+
+    for day, n in days.items():
+        _bump(db, ride_daily_counts, {"day": day}, n)
+    for weekday, n in weekdays.items():
+        _bump(db, ride_weekday_counts, {"weekday": weekday}, n)
+    for user_id, n in users.items():
+        _bump(db, ride_user_counts, {"user_id": user_id}, n, rider_name=names[user_id])
+    for ride_status, n in statuses.items():
+        _bump(db, ride_status_counts, {"status": ride_status}, n)
+
+
+def record_status_change(db: Session, old_status: str, new_status: str, count: int = 1):
+    """Move ``count`` rides between status buckets, inside the writing transaction."""
+    if old_status == new_status:
+        return
+    _bump(db, ride_status_counts, {"status": old_status}, -count)
+    _bump(db, ride_status_counts, {"status": new_status}, count)
+
+
+def rebuild(db: Session):
+    """Recompute every summary table from the rides table, in one transaction."""
+    for summary in (ride_daily_counts, ride_weekday_counts, ride_user_counts, ride_status_counts):
+        db.execute(delete(summary))
+    day = _day(db, rides.c.created_at)
+    weekday = cast(extract("dow", rides.c.created_at), Integer)
+    db.execute(insert(ride_daily_counts).from_select(
+        ["day", "count"], select(day, func.count()).group_by(day)
+    ))
+    db.execute(insert(ride_weekday_counts).from_select(
+        ["weekday", "count"], select(weekday, func.count()).group_by(weekday)
+    ))
+    db.execute(insert(ride_user_counts).from_select(
+        ["user_id", "rider_name", "count"],
+        select(rides.c.user_id, func.max(rides.c.rider_name), func.count())
+        .where(rides.c.user_id.is_not(None)).group_by(rides.c.user_id)
+    ))
+    db.execute(insert(ride_status_counts).from_select(
+        ["status", "count"], select(rides.c.status, func.count()).group_by(rides.c.status)
+    ))
+    # The rides triggers do not see this, but the dashboards' ETags must change
+    db.execute(text(RIDES_COUNTER_SQL))
+    db.commit()
+
+
+def is_empty(db: Session) -> bool:
+    return db.execute(select(func.count()).select_from(ride_status_counts)).scalar() == 0
+
+
+def weekday_counts(db: Session):
+    return db.execute(
+        select(ride_weekday_counts.c.weekday, ride_weekday_counts.c.count)
+        .where(ride_weekday_counts.c.count > 0)
+        .order_by(ride_weekday_counts.c.weekday)
+    ).all()
+
+
+def top_riders(db: Session, limit: int = 10):
+    return db.execute(
+        select(ride_user_counts.c.rider_name, ride_user_counts.c.count)
+        .order_by(ride_user_counts.c.count.desc())
+        .limit(limit)
+    ).all()
+
+
+def daily_counts(db: Session, limit: int = 30):
+    return db.execute(
+        select(ride_daily_counts.c.day, ride_daily_counts.c.count)
+        .order_by(ride_daily_counts.c.day.desc())
+        .limit(limit)
+    ).all()
+
+
+def status_counts(db: Session):
+    return db.execute(
+        select(ride_status_counts.c.status, ride_status_counts.c.count)
+        .where(ride_status_counts.c.count > 0)
+        .order_by(ride_status_counts.c.status)
+    ).all()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print("usage: python analytics.py rebuild")
+        sys.exit(2)
+    from backend import SessionLocal
+    session = SessionLocal()
+    try:
+        rebuild(session)
+    finally:
+        session.close()
+    print("Ride summary tables rebuilt")
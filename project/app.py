@@ -1,16 +1,16 @@
+import argparse
 import multiprocessing
 import time
-import uvicorn
 import subprocess
 import sys
 import requests
 import os
+import launcher
 
-def run_backend():
-    """Run the FastAPI backend server"""
+def run_backend(workers=launcher.BACKEND_WORKERS):
+    """Run the FastAPI backend server as supervised worker processes"""
     try:
-        import backend
-        uvicorn.run("backend:app", host="0.0.0.0", port=5000, reload=False)
+        launcher.serve(workers, host="0.0.0.0", port=5000)
     except Exception as e:
         print(f"Error starting backend: {e}")
 
@@ -32,12 +32,17 @@ def check_backend_health():
         return False
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the CommunityConnect backend and frontend")
+    parser.add_argument("--workers", type=int, default=launcher.BACKEND_WORKERS,
+                        help="backend worker processes, e.g. one per core")
+    args = parser.parse_args()
+
     print("Starting CommunityConnect Application...")
     print("=" * 50)
     
     # Start backend process
-    print("🚀 Starting backend server...")
-    backend_process = multiprocessing.Process(target=run_backend)
+    print(f"🚀 Starting backend server with {args.workers} worker(s)...")
+    backend_process = multiprocessing.Process(target=run_backend, args=(args.workers,))
     backend_process.start()
     
     # Wait for backend to be ready
@@ -92,7 +97,8 @@ if __name__ == "__main__":
     if frontend_process.is_alive():
         frontend_process.terminate()
     
-    backend_process.join(timeout=5)
+    # The backend finishes the requests it is serving before it exits
+    backend_process.join(timeout=launcher.DRAIN_TIMEOUT_S + 10)
     frontend_process.join(timeout=5)
     
     print("👋 CommunityConnect has been stopped. Goodbye!")
\ No newline at end of file
@@ -0,0 +1,123 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+# --- CONFIG ---
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL_S = float(os.getenv("AUTH_CACHE_TTL_S", "300"))
+# --------------
+
+
+class UserIdentity(NamedTuple):
+    """The parts of a user that authenticated endpoints need."""
+    id: int
+    name: str
+    email: str
+    is_admin: bool
+
+
+class IdentityCache:
+    """TTL-bounded LRU of user identities keyed by email.
+
+    Tokens carrying the identity claims need no lookup at all and are only
+    counted, through ``claims_hit``; the cache serves tokens that carry just
+    the email, as issued before those claims existed.
+    """
+
+    def __init__(self, max_entries: int = AUTH_CACHE_SIZE, ttl_s: float = AUTH_CACHE_TTL_S):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._emails: Dict[int, str] = {}
+        self.claims_served = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def claims_hit(self):
+        """Count a request whose identity came from the token's claims."""
+        self.claims_served += 1
+
+    def get(self, email: str) -> Optional[UserIdentity]:
+        entry = self._entries.get(email)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._drop(email)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(email)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, identity: UserIdentity):
+        self._entries[identity.email] = (time.monotonic() + self.ttl_s, identity)
+        self._entries.move_to_end(identity.email)
+        self._emails[identity.id] = identity.email
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def invalidate(self, user_id: int):
+        """Drop a user so the next request reloads them from the database."""
+        email = self._emails.get(user_id)
+        if email is not None and self._drop(email):
+            self.invalidations += 1
+
+    def _drop(self, email: str) -> bool:
+        entry = self._entries.pop(email, None)
+        if entry is None:
+            return False
+        self._emails.pop(entry[1].id, None)
+        return True
+
+    def clear(self):
+        self._entries.clear()
+        self._emails.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "claims_served": self.claims_served,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "db_queries_saved": self.claims_served + self.hits,
+            "invalidations": self.invalidations,
+        }
+
+
+class RevocationList:
+    """Revoked token ids, plus per-user cut-offs revoking every older token.
+
+    Entries are kept only until the tokens they revoke would have expired.
+    """
+
+    def __init__(self, token_lifetime_s: float):
+        self.token_lifetime_s = token_lifetime_s
+        self._tokens: Dict[str, float] = {}
+        self._users: Dict[int, float] = {}
+
+    def revoke_token(self, jti: str, expires_at: float):
+        self._tokens[jti] = expires_at
+        self._prune()
+
+    def revoke_user(self, user_id: int, cutoff: Optional[float] = None):
+        """Revoke every token issued to ``user_id`` up to ``cutoff``, by default now."""
+        cutoff = time.time() if cutoff is None else cutoff
+        self._users[user_id] = max(cutoff, self._users.get(user_id, cutoff))
+        self._prune()
+
+    def is_revoked(self, jti: Optional[str], user_id: Optional[int], issued_at: Optional[float]) -> bool:
+        if jti is not None and jti in self._tokens:
+            return True
+        cutoff = self._users.get(user_id)
+        return cutoff is not None and (issued_at is None or issued_at <= cutoff)
+
+    def _prune(self):
+        now = time.time()
+        self._tokens = {jti: exp for jti, exp in self._tokens.items() if exp > now}
+        self._users = {uid: cut for uid, cut in self._users.items() if cut + self.token_lifetime_s > now}
+
+    def stats(self) -> dict:
+        return {"revoked_tokens": len(self._tokens), "revoked_users": len(self._users)}
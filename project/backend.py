@@ -1,25 +1,56 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse  
-from pydantic import BaseModel
-from datetime import datetime, timedelta
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, TypeAdapter
+from datetime import datetime
+import asyncio
 import bcrypt
+from contextlib import asynccontextmanager
 import jwt
-import requests
+import math
 import os
-from typing import Optional, List
+import time
+import uuid
+from typing import Literal, Optional, List, Tuple
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy import create_engine, Column, String, Integer, Boolean, DateTime, ForeignKey
+from sqlalchemy import bindparam, inspect, insert, select, text, update, Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Index, Table
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.orm import declarative_base, sessionmaker, Session, relationship
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from routing import get_router, close_router, RoutingError, RoutingUnavailable, RouteNotFound
+from route_cache import get_route_cache, close_route_cache
+from pagination import keyset_query, split_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from password_pool import get_password_pool, close_password_pool, PoolSaturated
+from ratelimit import get_rate_limiter, close_rate_limiter, RateLimited
+from auth_cache import UserIdentity, IdentityCache, RevocationList
+import analytics
+import shared_state
+from shared_state import SHARED_STATE_POLL_S, SHARED_STATE_PRUNE_S
+import metrics
+import query_log
+from routing_guard import RoutingShed
+from routing_jobs import RoutingJob, RoutingJobQueue, RIDE_ROUTING_MODE
+from dispatch import plan_assignments, AvailableDriver, DISPATCH_INTERVAL_S, DISPATCH_MAX_RIDES, DRIVER_AVAILABILITY_TTL_S
+from geo import parse_coordinates, band_of, bounding_box, lon_scale, distance_m, METERS_PER_DEG
+from events import get_broadcaster, format_sse, EVENT_KEEPALIVE_S, RIDE_CREATED, RIDE_ACCEPTED, RIDE_COMPLETED
+from database import make_engine, make_async_engine, file_lock, init_lock_path, BlockingAsyncSession, DB_SESSION_MODE
 
 # --- CONFIG ---
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./communityconnect.db")
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-here-change-in-production")
 ALGORITHM = "HS256"
+ACCESS_TOKEN_LIFETIME_S = 24 * 3600
 ADMIN_EMAIL = "admin@example.com"
 ADMIN_PASSWORD = "Admin123"
 ADMIN_NAME = "Admin"
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "100"))
+# Queue a worker's SQLite write transactions in front of the database lock
+SQLITE_WRITE_GATE = os.getenv("SQLITE_WRITE_GATE", "1") == "1"
+# Further tries at SQLite's write lock after one busy timeout has run out
+WRITE_LOCK_RETRIES = int(os.getenv("WRITE_LOCK_RETRIES", "2"))
 # -------------- 
 
 Base = declarative_base()
@@ -50,42 +81,137 @@ class Ride(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     driver_id = Column(Integer, nullable=True)
     driver_name = Column(String, nullable=True)
+    # Bumped by every status change; lets clients accept only the state they saw
+    version = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    # Parsed from the location strings; NULL when those are not "lon,lat"
+    pickup_lon = Column(Float)
+    pickup_lat = Column(Float)
+    dropoff_lon = Column(Float)
+    dropoff_lat = Column(Float)
+    pickup_band = Column(Integer)  # latitude band, see geo.py
     
     user = relationship("User", back_populates="rides")
 
-# Database setup
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    __table_args__ = (
+        # recent_rides: newest first, keyset on (created_at, id)
+        Index("ix_rides_created_id", "created_at", "id"),
+        # pending list and recent_rides?status=
+        Index("ix_rides_status_created_id", "status", "created_at", "id"),
+        Index("ix_rides_user_created_id", "user_id", "created_at", "id"),
+        Index("ix_rides_driver_status", "driver_id", "status"),
+        # /rides/pending?near=: one seek per latitude band over a longitude range
+        Index("ix_rides_status_band_lon", "status", "pickup_band", "pickup_lon", "pickup_lat"),
+    )
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# One row per watched table, bumped by triggers on every write to it. The
+# counter only goes up, so it doubles as an ETag for anything built from rides.
+change_counters = Table(
+    "change_counters", Base.metadata,
+    Column("name", String, primary_key=True),
+    Column("counter", Integer, nullable=False, server_default=text("0")),
+)
 
-app = FastAPI(title="CommunityConnect API")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+RIDE_IS_PENDING = Ride.status == "pending"
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+def ensure_columns(bind):
+    """Add columns introduced after the rides table was first created."""
+    existing = {c["name"] for c in inspect(bind).get_columns(Ride.__tablename__)}
+    with bind.begin() as conn:
+        for column in Ride.__table__.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                conn.execute(text(f"ALTER TABLE {Ride.__tablename__} ADD COLUMN {ddl}"))
 
-# Mount static files (commented out for Flet desktop mode)
-# app.mount("/static", StaticFiles(directory="static"), name="static")
+def ride_coordinates(pickup: str, dropoff: str) -> dict:
+    """Numeric coordinate columns for a ride's pickup and dropoff strings."""
+    pickup_point = parse_coordinates(pickup)
+    dropoff_point = parse_coordinates(dropoff)
+    return {
+        "pickup_lon": pickup_point[0] if pickup_point else None,
+        "pickup_lat": pickup_point[1] if pickup_point else None,
+        "dropoff_lon": dropoff_point[0] if dropoff_point else None,
+        "dropoff_lat": dropoff_point[1] if dropoff_point else None,
+        "pickup_band": band_of(pickup_point[1]) if pickup_point else None,
+    }
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def backfill_coordinates(bind):
+    """Fill the coordinate columns of rides stored before they existed."""
+    rides = Ride.__table__
+    with bind.begin() as conn:
+        rows = conn.execute(
+            select(rides.c.id, rides.c.pickup_location, rides.c.dropoff_location)
+            .where(rides.c.pickup_lat.is_(None))
+        ).all()
+        updates = [{"rid": rid, **ride_coordinates(pickup, dropoff)} for rid, pickup, dropoff in rows]
+        updates = [u for u in updates if u["pickup_lat"] is not None or u["dropoff_lat"] is not None]
+        if updates:
+            conn.execute(update(rides).where(rides.c.id == bindparam("rid")), updates)
 
-# Create admin user on startup
-@app.on_event("startup")
-async def startup():
+def ensure_change_triggers(bind):
+    """Count every insert, update and delete on rides in change_counters.
+
+    SQLite bumps the counter once per row, PostgreSQL once per statement.
+    """
+    dialect = bind.dialect.name
+    if dialect not in ("sqlite", "postgresql"):
+        raise NotImplementedError(f"change triggers are not implemented for {dialect}")
+    with bind.begin() as conn:
+        # Starts from the clock, so a recreated database does not reuse old ETags
+        conn.execute(
+            text("INSERT INTO change_counters (name, counter) VALUES ('rides', :start) "
+                 "ON CONFLICT (name) DO NOTHING"),
+            {"start": int(time.time() * 1000)}
+        )
+        if dialect == "sqlite":
+            for op in ("INSERT", "UPDATE", "DELETE"):
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS rides_count_{op.lower()} AFTER {op} ON rides "
+                    f"BEGIN {analytics.RIDES_COUNTER_SQL}; END"
+                ))
+        else:
+            conn.execute(text(
+                "CREATE OR REPLACE FUNCTION rides_count() RETURNS trigger AS $$ "
+                f"BEGIN {analytics.RIDES_COUNTER_SQL}; RETURN NULL; END $$ LANGUAGE plpgsql"
+            ))
+            conn.execute(text("DROP TRIGGER IF EXISTS rides_count ON rides"))
+            conn.execute(text(
+                "CREATE TRIGGER rides_count AFTER INSERT OR UPDATE OR DELETE ON rides "
+                "FOR EACH STATEMENT EXECUTE PROCEDURE rides_count()"
+            ))
+
+def ensure_indexes(bind):
+    """Create indexes added after the rides table was first created."""
+    for index in Ride.__table__.indexes:
+        index.create(bind=bind, checkfirst=True)
+
+# Database setup. Endpoints use the async engine, so a query does not block
+# the event loop; startup, dispatch rounds and scripts use the sync one.
+engine = make_engine(DATABASE_URL)
+async_engine = make_async_engine(DATABASE_URL)
+for instrumented in (engine, async_engine.sync_engine):
+    metrics.instrument_engine(instrumented)
+    query_log.instrument_engine(instrumented)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay readable after commit, as an AsyncSession cannot lazy-load them
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=query_log.TracedAsyncSession, autoflush=False, expire_on_commit=False
+)
+if DB_SESSION_MODE == "sync":
+    # Blocking sessions behind the same interface, to measure what the async engine buys
+    BlockingSessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    AsyncSessionLocal = lambda: BlockingAsyncSession(BlockingSessionLocal())
+
+def create_schema(bind):
+    Base.metadata.create_all(bind=bind)
+    analytics.metadata.create_all(bind=bind)
+    shared_state.metadata.create_all(bind=bind)
+    ensure_columns(bind)
+    backfill_coordinates(bind)
+    ensure_indexes(bind)
+    ensure_change_triggers(bind)
+
+def seed_database():
+    """Create the admin user, and fill the summary tables if they are empty."""
     db = SessionLocal()
     try:
         admin_exists = db.query(User).filter(User.email == ADMIN_EMAIL).first()
@@ -102,15 +228,81 @@ async def startup():
             db.add(admin_user)
             db.commit()
             print("Admin user created successfully")
+
+        if analytics.is_empty(db) and db.query(Ride.id).first() is not None:
+            analytics.rebuild(db)
+            print("Ride summary tables rebuilt")
     finally:
         db.close()
 
+# Create tables. Every worker runs this on import, one at a time under the
+# lock, so only the first one to get it changes anything.
+with file_lock(init_lock_path(DATABASE_URL)):
+    create_schema(engine)
+
+app = FastAPI(title="CommunityConnect API")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+# Add CORS middleware
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
+)
+app.add_middleware(query_log.QueryLogMiddleware)
+# Added last so it is outermost and times the whole request
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Mount static files (commented out for Flet desktop mode)
+# app.mount("/static", StaticFiles(directory="static"), name="static")
+
+# Dependency to get DB session
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Create admin user on startup
+@app.on_event("startup")
+async def startup():
+    with file_lock(init_lock_path(DATABASE_URL)):
+        seed_database()
+
+    global dispatch_task, routing_queue, shared_state_task
+    await load_shared_state()
+    shared_state_task = asyncio.create_task(shared_state_loop())
+    if DISPATCH_INTERVAL_S > 0:
+        dispatch_task = asyncio.create_task(dispatch_loop())
+    if RIDE_ROUTING_MODE == "background":
+        routing_queue = RoutingJobQueue(lookup_route, store_route, mark_route_failed)
+        routing_queue.start()
+        await requeue_routing_rides()
+
+@app.on_event("shutdown")
+async def shutdown():
+    if shared_state_task is not None:
+        shared_state_task.cancel()
+    if dispatch_task is not None:
+        dispatch_task.cancel()
+    if routing_queue is not None:
+        await routing_queue.stop()
+    await close_router()
+    close_route_cache()
+    close_password_pool()
+    close_rate_limiter()
+    await async_engine.dispose()
+
 # Pydantic models
 class RideRequest(BaseModel):
     pickup_location: str
     dropoff_location: str
     requested_time: str
 
+class DriverLocation(BaseModel):
+    location: str
+
 class UserRegister(BaseModel):
     name: str
     email: str
@@ -142,27 +334,218 @@ class RideOut(BaseModel):
     user_id: int
     driver_id: Optional[int] = None
     driver_name: Optional[str] = None
+    version: int = 0
+
+class NearbyRideOut(RideOut):
+    pickup_distance_m: int
+
+# Only the columns RideOut needs, so list endpoints skip building ORM objects
+RIDE_OUT_COLUMNS = tuple(getattr(Ride, name) for name in RideOut.model_fields)
+RIDE_LIST = TypeAdapter(List[RideOut])
+NEARBY_RIDE_LIST = TypeAdapter(List[NearbyRideOut])
+
+def rides_json(rides: List[dict], next_cursor: Optional[str] = None, adapter: TypeAdapter = RIDE_LIST, etag: Optional[str] = None) -> Response:
+    """Validate and encode ride dicts in one pass through pydantic-core.
+
+    Returning the Response directly skips FastAPI's jsonable_encoder walk.
+    Dicts validate about three times faster than reading Row attributes.
+    """
+    body = adapter.dump_json(adapter.validate_python(rides))
+    headers = validator_headers(etag) if etag is not None else {}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = next_cursor
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def rides_etag(db: AsyncSession) -> str:
+    """ETag for anything built from rides, read first so it is never newer than the data."""
+    counter = await db.scalar(select(change_counters.c.counter).where(change_counters.c.name == "rides"))
+    return f'W/"rides-{counter}"'
+
+def validator_headers(etag: str) -> dict:
+    # no-cache: clients may keep the body, but must revalidate before using it
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """A 304 if the client's If-None-Match already names ``etag``, else None."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    # Weak comparison, as If-None-Match calls for
+    tags = {tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip() for tag in header.split(",")}
+    if "*" in tags or etag[2:] in tags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validator_headers(etag))
+    return None
 
 # Helper functions
+@metrics.timed(metrics.BCRYPT_LATENCY, "hash")
 def hash_password(password: str) -> str:
     return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
 
+@metrics.timed(metrics.BCRYPT_LATENCY, "verify")
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
 
-def create_access_token(email: str) -> str:
-    payload = {"sub": email, "exp": datetime.utcnow() + timedelta(hours=24)}
+async def fetch_route(pickup: str, dropoff: str):
+    """Ask the router, timing only lookups the route cache could not answer."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        route = await get_router().route(pickup, dropoff)
+        outcome = "ok"
+        return route
+    except RouteNotFound:
+        outcome = "not_found"
+        raise
+    except RoutingShed:
+        outcome = "shed"
+        raise
+    finally:
+        metrics.ROUTING_LATENCY.observe(time.perf_counter() - start, outcome)
+
+async def lookup_route(pickup: str, dropoff: str):
+    return await get_route_cache().get_or_fetch(pickup, dropoff, fetch_route)
+
+async def resolve_route(pickup: str, dropoff: str):
+    try:
+        return await lookup_route(pickup, dropoff)
+    except RouteNotFound:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid coordinates or routing failed"
+        )
+    except RoutingShed as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Routing service busy, please retry: {str(e)}",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+    except RoutingUnavailable:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Routing service unavailable"
+        )
+    except RoutingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Routing service error: {str(e)}"
+        )
+
+def filter_rides(query, since: Optional[datetime], until: Optional[datetime], user_id: Optional[int], ride_status: Optional[str] = None):
+    if since is not None:
+        query = query.filter(Ride.created_at >= since)
+    if until is not None:
+        query = query.filter(Ride.created_at < until)
+    if user_id is not None:
+        query = query.filter(Ride.user_id == user_id)
+    if ride_status is not None:
+        query = query.filter(Ride.status == ride_status)
+    return query
+
+async def paginate_rides(db: AsyncSession, query, limit: int, cursor: Optional[str], descending: bool = False):
+    """One keyset page of ``query`` as ``(rows, next_cursor)``."""
+    try:
+        query = keyset_query(query, Ride.created_at, Ride.id, limit, cursor, descending)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return split_page((await db.execute(query)).all(), limit)
+
+identity_cache = IdentityCache()
+revocations = RevocationList(ACCESS_TOKEN_LIFETIME_S)
+
+def identity_of(user: User) -> UserIdentity:
+    return UserIdentity(user.id, user.name, user.email, bool(user.is_admin))
+
+def create_access_token(user: User) -> str:
+    now = time.time()
+    payload = {
+        "sub": user.email,
+        "uid": user.id,
+        "name": user.name,
+        "adm": bool(user.is_admin),
+        "jti": uuid.uuid4().hex,
+        "iat": now,
+        "exp": int(now + ACCESS_TOKEN_LIFETIME_S)
+    }
     return jwt.encode(payload, JWT_SECRET, algorithm=ALGORITHM)
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
-    user = db.query(User).filter(User.email == email).first()
+async def run_password_job(fn, *args):
+    try:
+        return await get_password_pool().run(fn, *args)
+    except PoolSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+            headers={"Retry-After": "1"}
+        )
+
+async def check_rate_limit(limit_class: str, key, cost: int = 1):
+    try:
+        await get_rate_limiter().hit(limit_class, str(key), cost)
+    except RateLimited as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, please slow down",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+
+def client_address(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+write_gate: Optional[asyncio.Lock] = None
+
+@asynccontextmanager
+async def writer(db: AsyncSession):
+    """Run a write transaction on ``db``; on SQLite, one at a time.
+
+    SQLite has one writer at a time. Within a worker, writers queue on an
+    asyncio lock without holding a connection, where SQLite's busy handler
+    would sleep while holding one. BEGIN IMMEDIATE then takes the database
+    lock from the start, so writers in other workers wait under the busy
+    timeout rather than fail on their first write. Other databases need
+    neither.
+    """
+    if db.bind.dialect.name != "sqlite":
+        yield
+        return
+    if not SQLITE_WRITE_GATE:
+        await begin_immediate(db)
+        yield
+        return
+    global write_gate
+    if write_gate is None:
+        write_gate = asyncio.Lock()
+    async with write_gate:
+        await begin_immediate(db)
+        yield
+
+async def begin_immediate(db: AsyncSession):
+    """Start ``db``'s transaction with SQLite's write lock, or answer 503 if it stays busy."""
+    for attempt in range(WRITE_LOCK_RETRIES + 1):
+        try:
+            await db.execute(text("BEGIN IMMEDIATE"))
+            return
+        except OperationalError as e:
+            await db.rollback()
+            if "locked" not in str(e.orig):
+                raise
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Database busy, please retry",
+        headers={"Retry-After": "1"}
+    )
+
+async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[User]:
+    user = await db.scalar(select(User).where(User.email == email))
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    # Don't hold a pooled connection while bcrypt runs
+    db.expunge(user)
+    await db.rollback()
+    if not await run_password_job(verify_password, password, user.hashed_password):
         return None
     return user
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
         email = payload.get("sub")
@@ -181,14 +564,32 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token"
         )
-    
-    user = db.query(User).filter(User.email == email).first()
+    if revocations.is_revoked(payload.get("jti"), payload.get("uid"), payload.get("iat")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revoked"
+        )
+    return payload
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> UserIdentity:
+    payload = decode_token(token)
+    # Current tokens carry the whole identity; revoking the user cuts off stale claims
+    if "uid" in payload:
+        identity_cache.claims_hit()
+        return UserIdentity(payload["uid"], payload["name"], payload["sub"], bool(payload["adm"]))
+    # Tokens issued before the claims existed carry only the email
+    identity = identity_cache.get(payload["sub"])
+    if identity is not None:
+        return identity
+    user = await db.scalar(select(User).where(User.email == payload["sub"]))
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
-    return user
+    identity = identity_of(user)
+    identity_cache.put(identity)
+    return identity
 
 # API Endpoints
 @app.get("/")
@@ -204,12 +605,14 @@ async def read_root():
     }
 
 @app.post("/register", status_code=status.HTTP_201_CREATED)
-async def register_user(user: UserRegister, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.email == user.email).first()
+async def register_user(user: UserRegister, request: Request, db: AsyncSession = Depends(get_db)):
+    await check_rate_limit("auth", client_address(request))
+    existing_user = await db.scalar(select(User.id).where(User.email == user.email))
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = hash_password(user.password)
+    await db.rollback()
+    hashed_password = await run_password_job(hash_password, user.password)
     new_user = User(
         name=user.name,
         email=user.email,
@@ -217,202 +620,651 @@ async def register_user(user: UserRegister, db: Session = Depends(get_db)):
         is_admin=False,
         created_at=datetime.utcnow()
     )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    async with writer(db):
+        db.add(new_user)
+        await db.commit()
     return {"message": "User created successfully", "user_id": new_user.id}
 
 @app.post("/token", response_model=Token)
-async def login_user(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    authenticated_user = authenticate_user(db, form_data.username, form_data.password)
+async def login_user(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    await check_rate_limit("auth", client_address(request))
+    authenticated_user = await authenticate_user(db, form_data.username, form_data.password)
     if not authenticated_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
     
-    access_token = create_access_token(authenticated_user.email)
+    access_token = create_access_token(authenticated_user)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/login", response_model=Token)
-async def login_for_frontend(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    return await login_user(form_data, db)
+async def login_for_frontend(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    return await login_user(request, form_data, db)
 
 @app.get("/user/me", response_model=UserOut)
-async def get_current_user_details(current_user: User = Depends(get_current_user)):
+async def get_current_user_details(current_user: UserIdentity = Depends(get_current_user)):
     return UserOut(
         name=current_user.name,
         email=current_user.email,
         is_admin=current_user.is_admin
     )
 
-@app.post("/rides/request")
-async def request_ride(r: RideRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    try:
-        response = requests.get(
-            f"http://router.project-osrm.org/route/v1/driving/{r.pickup_location};{r.dropoff_location}?overview=false",
-            timeout=10
-        )
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Routing service unavailable"
-            )
-            
-        data = response.json()
-        if data.get('code') != 'Ok':
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid coordinates or routing failed"
-            )
-            
-        route = data['routes'][0]
-        dist = route['distance']
-        dur = route['duration']
-    except requests.RequestException as e:
+@app.post("/logout")
+async def logout(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    payload = decode_token(token)
+    if "jti" in payload:
+        # Stored for the other workers, which pick it up on their next poll
+        async with writer(db):
+            await db.run_sync(shared_state.record_token_revocation, payload["jti"], payload["exp"])
+            await db.commit()
+        revocations.revoke_token(payload["jti"], payload["exp"])
+    return {"message": "logged out"}
+
+@app.post("/admin/users/{user_id}/revoke")
+async def revoke_user_tokens(user_id: int, current_user: UserIdentity = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+    cutoff = time.time()
+    async with writer(db):
+        await db.run_sync(shared_state.record_user_revocation, user_id, cutoff, ACCESS_TOKEN_LIFETIME_S)
+        await db.commit()
+    revocations.revoke_user(user_id, cutoff)
+    identity_cache.invalidate(user_id)
+    return {"message": "revoked"}
+
+def pending_ride_dict(ride_id: int, values: dict) -> dict:
+    """A ride as /rides/pending and ride-created events show it."""
+    return {
+        "id": ride_id,
+        "rider_name": values["rider_name"],
+        "pickup_location": values["pickup_location"],
+        "dropoff_location": values["dropoff_location"],
+        "requested_time": values["requested_time"],
+        "distance_m": values["distance_m"],
+        "duration_s": values["duration_s"],
+        "status": values["status"],
+        "created_at": values["created_at"],
+        "user_id": values["user_id"],
+        "version": values.get("version", 0)
+    }
+
+async def stage_ride_events(db: AsyncSession, events: List[Tuple[str, dict]]) -> List[Tuple[str, dict]]:
+    """Store ride events in ``db``'s transaction for the other workers; publish them here after commit."""
+    events = [(event_type, jsonable_encoder(data)) for event_type, data in events]
+    await db.run_sync(shared_state.record_events, get_broadcaster().boot, events)
+    return events
+
+def publish_ride_events(events: List[Tuple[str, dict]]):
+    broadcaster = get_broadcaster()
+    for event_type, data in events:
+        broadcaster.publish(event_type, data)
+
+def new_ride_values(r: RideRequest, current_user: UserIdentity, created_at: datetime, route=None) -> dict:
+    """Columns of a new ride; without a route it waits in "routing" for the routing queue."""
+    return {
+        "rider_name": current_user.name,
+        "pickup_location": r.pickup_location,
+        "dropoff_location": r.dropoff_location,
+        "requested_time": r.requested_time,
+        "distance_m": int(route[0]) if route else None,
+        "duration_s": int(route[1]) if route else None,
+        "status": "pending" if route else "routing",
+        "created_at": created_at,
+        "user_id": current_user.id,
+        **ride_coordinates(r.pickup_location, r.dropoff_location)
+    }
+
+def check_routing_room(count: int = 1):
+    if not routing_queue.has_room(count):
+        routing_queue.rejected += 1
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Routing service error: {str(e)}"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many rides waiting for a route, please retry",
+            headers={"Retry-After": "5"}
         )
-    except Exception as e:
+
+@app.post("/rides/request")
+async def request_ride(r: RideRequest, response: Response, current_user: UserIdentity = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    await check_rate_limit("rides", current_user.id)
+    if routing_queue is not None:
+        # Stored now and routed by the queue, so the rider does not wait for the router
+        check_routing_room()
+        dist = dur = None
+        values = new_ride_values(r, current_user, datetime.utcnow())
+    else:
+        # Hand the connection back to the pool while the route lookup is in flight
+        await db.rollback()
+        dist, dur = await resolve_route(r.pickup_location, r.dropoff_location)
+        values = new_ride_values(r, current_user, datetime.utcnow(), (dist, dur))
+    new_ride = Ride(**values)
+    
+    async with writer(db):
+        db.add(new_ride)
+        await db.flush()
+        ride_id = new_ride.id
+        await db.run_sync(analytics.record_rides_created, [(new_ride.created_at, current_user.id, current_user.name, values["status"])])
+        # A ride waiting for its route is announced once it has one
+        events = [] if routing_queue is not None else await stage_ride_events(db, [(RIDE_CREATED, pending_ride_dict(ride_id, values))])
+        await db.commit()
+
+    if routing_queue is not None:
+        routing_queue.submit(RoutingJob(ride_id, r.pickup_location, r.dropoff_location))
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"request_id": ride_id, "status": "routing", "distance_m": None, "duration_s": None}
+
+    publish_ride_events(events)
+    return {"request_id": ride_id, "status": "pending", "distance_m": dist, "duration_s": dur}
+
+@app.post("/rides/request/batch")
+async def request_ride_batch(rides: List[RideRequest], response: Response, current_user: UserIdentity = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    if len(rides) > MAX_BATCH_SIZE:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Routing error: {str(e)}"
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {MAX_BATCH_SIZE} rides per batch"
         )
+    await check_rate_limit("rides", current_user.id, len(rides))
+
+    if routing_queue is not None:
+        response.status_code = status.HTTP_202_ACCEPTED
+        return await request_ride_batch_background(rides, current_user, db)
 
-    new_ride = Ride(
-        rider_name=current_user.name,
-        pickup_location=r.pickup_location,
-        dropoff_location=r.dropoff_location,
-        requested_time=r.requested_time,
-        distance_m=int(dist),
-        duration_s=int(dur),
-        status="pending",
-        created_at=datetime.utcnow(),
-        user_id=current_user.id
+    await db.rollback()
+
+    # Each distinct pickup/dropoff pair is routed once, all pairs concurrently
+    pairs = list({(r.pickup_location, r.dropoff_location) for r in rides})
+    lookups = await asyncio.gather(
+        *(resolve_route(pickup, dropoff) for pickup, dropoff in pairs),
+        return_exceptions=True
     )
-    
-    db.add(new_ride)
-    db.commit()
-    db.refresh(new_ride)
-    
-    return {"request_id": new_ride.id, "distance_m": dist, "duration_s": dur}
+    routes = dict(zip(pairs, lookups))
+
+    now = datetime.utcnow()
+    results, rows = [], []
+    for index, r in enumerate(rides):
+        route = routes[(r.pickup_location, r.dropoff_location)]
+        if isinstance(route, HTTPException):
+            results.append({"index": index, "error": route.detail, "status_code": route.status_code})
+            continue
+        if isinstance(route, BaseException):
+            raise route
+        dist, dur = route
+        results.append({"index": index, "request_id": None, "distance_m": dist, "duration_s": dur})
+        rows.append(new_ride_values(r, current_user, now, route))
+
+    if rows:
+        async with writer(db):
+            ride_ids = (await db.scalars(
+                insert(Ride).returning(Ride.id, sort_by_parameter_order=True),
+                rows
+            )).all()
+            await db.run_sync(analytics.record_rides_created, [(now, current_user.id, current_user.name, "pending")] * len(rows))
+            events = await stage_ride_events(db, [
+                (RIDE_CREATED, pending_ride_dict(ride_id, row)) for ride_id, row in zip(ride_ids, rows)
+            ])
+            await db.commit()
+        created = iter(ride_ids)
+        for result in results:
+            if "error" not in result:
+                result["request_id"] = next(created)
+        publish_ride_events(events)
+
+    return results
 
-@app.get("/rides/pending")
-async def list_pending(db: Session = Depends(get_db)):
-    rides = db.query(Ride).filter(Ride.status == "pending").all()
+async def request_ride_batch_background(rides: List[RideRequest], current_user: UserIdentity, db: AsyncSession):
+    if not rides:
+        return []
+    check_routing_room(len(rides))
+    now = datetime.utcnow()
+    async with writer(db):
+        ride_ids = (await db.scalars(
+            insert(Ride).returning(Ride.id, sort_by_parameter_order=True),
+            [new_ride_values(r, current_user, now) for r in rides]
+        )).all()
+        await db.run_sync(analytics.record_rides_created, [(now, current_user.id, current_user.name, "routing")] * len(rides))
+        await db.commit()
+    # Rides with the same pair share one lookup through the route cache
+    for ride_id, r in zip(ride_ids, rides):
+        routing_queue.submit(RoutingJob(ride_id, r.pickup_location, r.dropoff_location))
     return [
-        {
-            "id": ride.id,
-            "rider_name": ride.rider_name,
-            "pickup_location": ride.pickup_location,
-            "dropoff_location": ride.dropoff_location,
-            "requested_time": ride.requested_time,
-            "distance_m": ride.distance_m,
-            "duration_s": ride.duration_s,
-            "status": ride.status,
-            "created_at": ride.created_at,
-            "user_id": ride.user_id
-        }
-        for ride in rides
+        {"index": index, "request_id": ride_id, "status": "routing", "distance_m": None, "duration_s": None}
+        for index, ride_id in enumerate(ride_ids)
     ]
 
-@app.get("/rides/{ride_id}")
-async def get_ride(ride_id: int, db: Session = Depends(get_db)):
-    ride = db.query(Ride).filter(Ride.id == ride_id).first()
+routing_queue: Optional[RoutingJobQueue] = None
+
+async def store_route(job: RoutingJob, route):
+    """Fill in a routed ride and make it pending; a ride routed already is left alone."""
+    async with AsyncSessionLocal() as db:
+        async with writer(db):
+            routed = await transition_ride_async(db, job.ride_id, "routing", None, {
+                "status": "pending",
+                "distance_m": int(route[0]),
+                "duration_s": int(route[1]),
+            })
+            if not routed:
+                await db.rollback()
+                return
+            await db.run_sync(analytics.record_status_change, "routing", "pending")
+            ride = (await db.execute(select(*RIDE_OUT_COLUMNS).where(Ride.id == job.ride_id))).one()
+            events = await stage_ride_events(db, [(RIDE_CREATED, pending_ride_dict(ride.id, ride._asdict()))])
+            await db.commit()
+    publish_ride_events(events)
+
+async def mark_route_failed(job: RoutingJob, reason: str):
+    print(f"Routing ride {job.ride_id} failed: {reason}")
+    async with AsyncSessionLocal() as db:
+        async with writer(db):
+            if not await transition_ride_async(db, job.ride_id, "routing", None, {"status": "routing_failed"}):
+                await db.rollback()
+                return
+            await db.run_sync(analytics.record_status_change, "routing", "routing_failed")
+            await db.commit()
+
+async def requeue_routing_rides():
+    """Queue rides left in "routing" by a restart.
+
+    Every worker does this at startup. Two workers routing the same ride is
+    harmless, as only the first one to store it changes the ride.
+    """
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(Ride.id, Ride.pickup_location, Ride.dropoff_location)
+            .where(Ride.status == "routing")
+            .order_by(Ride.created_at, Ride.id)
+        )).all()
+    for ride_id, pickup, dropoff in rows:
+        routing_queue.submit(RoutingJob(ride_id, pickup, dropoff))
+
+def nearest_rides(query, lon: float, lat: float, radius_m: float, limit: int):
+    """``query`` narrowed to pickups within ``radius_m`` of a point, nearest first."""
+    bands, (west, east), (south, north) = bounding_box(lon, lat, radius_m)
+    dx = (Ride.pickup_lon - lon) * lon_scale(lat)
+    dy = Ride.pickup_lat - lat
+    dist2 = dx * dx + dy * dy
+    radius_deg = radius_m / METERS_PER_DEG
+    return query.filter(
+        Ride.pickup_band.in_(bands),
+        Ride.pickup_lon.between(west, east),
+        Ride.pickup_lat.between(south, north),
+        dist2 <= radius_deg * radius_deg
+    ).order_by(dist2, Ride.id).limit(limit)
+
+@app.get("/rides/pending", response_model=List[RideOut])
+async def list_pending(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    user_id: Optional[int] = None,
+    near: Optional[str] = Query(None, description="lon,lat; return rides with pickups nearest this point first"),
+    radius_m: float = Query(5000, gt=0, le=50000),
+    db: AsyncSession = Depends(get_db)
+):
+    etag = await rides_etag(db)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    if near is None:
+        query = filter_rides(select(*RIDE_OUT_COLUMNS).where(RIDE_IS_PENDING), since, until, user_id)
+        rows, next_cursor = await paginate_rides(db, query, limit, cursor)
+        return rides_json([row._asdict() for row in rows], next_cursor, etag=etag)
+    point = parse_coordinates(near)
+    if point is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid near; expected lon,lat")
+    if cursor is not None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="cursor cannot be combined with near")
+    query = select(*RIDE_OUT_COLUMNS, Ride.pickup_lon, Ride.pickup_lat).where(RIDE_IS_PENDING)
+    query = nearest_rides(filter_rides(query, since, until, user_id), point[0], point[1], radius_m, limit)
+    rows = (await db.execute(query)).all()
+    return rides_json([
+        {**row._asdict(), "pickup_distance_m": round(distance_m(point[0], point[1], row.pickup_lon, row.pickup_lat))}
+        for row in rows
+    ], adapter=NEARBY_RIDE_LIST, etag=etag)
+
+async def ride_event_stream(request: Request, sub):
+    try:
+        yield "retry: 3000\n\n"
+        while not (sub.overflowed and sub.queue.empty()):
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), EVENT_KEEPALIVE_S)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
+        # A subscriber that fell behind is cut off here and resumes on reconnect
+    finally:
+        get_broadcaster().unsubscribe(sub)
+
+@app.get("/rides/stream")
+async def ride_stream(request: Request, last_event_id: Optional[str] = Header(None)):
+    """Server-sent ride-created, ride-accepted and ride-completed events.
+
+    Reconnect with ``Last-Event-ID`` to resume; a ``resync`` event means the
+    client must reload ``/rides/pending`` first.
+    """
+    sub = get_broadcaster().subscribe(last_event_id)
+    return StreamingResponse(
+        ride_event_stream(request, sub),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/rides/{ride_id}", response_model=RideOut)
+async def get_ride(ride_id: int, db: AsyncSession = Depends(get_db)):
+    ride = (await db.execute(select(*RIDE_OUT_COLUMNS).where(Ride.id == ride_id))).first()
     if not ride:
         raise HTTPException(404, "Ride not found")
-    return {
-        "id": ride.id,
-        "rider_name": ride.rider_name,
-        "pickup_location": ride.pickup_location,
-        "dropoff_location": ride.dropoff_location,
-        "requested_time": ride.requested_time,
-        "distance_m": ride.distance_m,
-        "duration_s": ride.duration_s,
-        "status": ride.status,
-        "created_at": ride.created_at,
-        "user_id": ride.user_id,
-        "driver_id": ride.driver_id,
-        "driver_name": ride.driver_name
-    }
+    return Response(content=RideOut.model_validate(ride._asdict()).model_dump_json(), media_type="application/json")
+
+def transition_statement(rid: int, from_status: str, version: Optional[int], values: dict, *conditions):
+    """One conditional UPDATE that moves a ride out of ``from_status``.
+
+    It matches no row if the ride is missing, another request changed it
+    first, or it no longer has the expected ``version``.
+    """
+    stmt = update(Ride).where(Ride.id == rid, Ride.status == from_status, *conditions)
+    if version is not None:
+        stmt = stmt.where(Ride.version == version)
+    return stmt.values(version=Ride.version + 1, **values).execution_options(synchronize_session=False)
+
+def transition_ride(db: Session, rid: int, from_status: str, version: Optional[int], values: dict, *conditions) -> bool:
+    return db.execute(transition_statement(rid, from_status, version, values, *conditions)).rowcount == 1
+
+async def transition_ride_async(db: AsyncSession, rid: int, from_status: str, version: Optional[int], values: dict, *conditions) -> bool:
+    return (await db.execute(transition_statement(rid, from_status, version, values, *conditions))).rowcount == 1
 
 @app.post("/rides/accept/{rid}")
-async def accept_ride(rid: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    ride = db.query(Ride).filter(Ride.id == rid, Ride.status == "pending").first()
-    
-    if not ride:
-        raise HTTPException(404, "Ride not found or already accepted")
-    
-    ride.status = "accepted"
-    ride.driver_id = current_user.id
-    ride.driver_name = current_user.name
-    
-    db.commit()
+async def accept_ride(rid: int, version: Optional[int] = None, current_user: UserIdentity = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    async with writer(db):
+        accepted = await transition_ride_async(db, rid, "pending", version, {
+            "status": "accepted",
+            "driver_id": current_user.id,
+            "driver_name": current_user.name,
+        })
+        if not accepted:
+            await db.rollback()
+            raise HTTPException(404, "Ride not found or already accepted")
+        
+        # A driver with a ride is no longer offered to the dispatcher
+        await db.run_sync(shared_state.remove_driver, current_user.id)
+        await db.run_sync(analytics.record_status_change, "pending", "accepted")
+        events = await stage_ride_events(db, [
+            (RIDE_ACCEPTED, {"id": rid, "driver_id": current_user.id, "driver_name": current_user.name})
+        ])
+        await db.commit()
+    publish_ride_events(events)
     return {"message": "accepted"}
 
 @app.post("/rides/complete/{rid}")
-async def complete_ride(rid: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    ride = db.query(Ride).filter(Ride.id == rid, Ride.driver_id == current_user.id).first()
-    if not ride:
-        raise HTTPException(404, "Ride not found or you are not the driver")
-    ride.status = "completed"
-    db.commit()
+async def complete_ride(rid: int, version: Optional[int] = None, current_user: UserIdentity = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    async with writer(db):
+        completed = await transition_ride_async(db, rid, "accepted", version, {"status": "completed"}, Ride.driver_id == current_user.id)
+        if not completed:
+            await db.rollback()
+            raise HTTPException(404, "Ride not found or you are not the driver")
+        await db.run_sync(analytics.record_status_change, "accepted", "completed")
+        events = await stage_ride_events(db, [(RIDE_COMPLETED, {"id": rid, "driver_id": current_user.id})])
+        await db.commit()
+    publish_ride_events(events)
     return {"message": "completed"}
 
+@app.post("/drivers/available")
+async def report_available(body: DriverLocation, current_user: UserIdentity = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """Offer to take a ride from the dispatcher; repeat before the availability expires."""
+    point = parse_coordinates(body.location)
+    if point is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid location; expected lon,lat")
+    driver = AvailableDriver(current_user.id, current_user.name, point[0], point[1])
+    async with writer(db):
+        await db.run_sync(shared_state.report_driver, driver, time.time() + DRIVER_AVAILABILITY_TTL_S)
+        await db.commit()
+    return {"message": "available", "expires_in_s": DRIVER_AVAILABILITY_TTL_S}
+
+@app.delete("/drivers/available")
+async def report_unavailable(current_user: UserIdentity = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    async with writer(db):
+        await db.run_sync(shared_state.remove_driver, current_user.id)
+        await db.commit()
+    return {"message": "unavailable"}
+
+shared_state_task: Optional[asyncio.Task] = None
+# Highest revocation and ride event ids this worker has taken in
+shared_cursors = {"revocations": 0, "events": 0}
+
+def apply_revocations(rows):
+    for row in rows:
+        if row.jti is not None:
+            revocations.revoke_token(row.jti, row.expires_at)
+        else:
+            revocations.revoke_user(row.user_id, row.cutoff)
+            identity_cache.invalidate(row.user_id)
+        shared_cursors["revocations"] = row.id
+
+async def load_shared_state():
+    """Take in every revocation still in force, and start the event feed from now."""
+    async with AsyncSessionLocal() as db:
+        apply_revocations(await db.run_sync(shared_state.revocations_after, 0))
+        shared_cursors["events"] = await db.run_sync(shared_state.last_event_id)
+
+async def sync_shared_state():
+    """Take in revocations and ride events written since the last call, by any worker."""
+    async with AsyncSessionLocal() as db:
+        apply_revocations(await db.run_sync(shared_state.revocations_after, shared_cursors["revocations"]))
+        shared_cursors["events"], events = await db.run_sync(
+            shared_state.events_after, shared_cursors["events"], get_broadcaster().boot
+        )
+    publish_ride_events(events)
+
+async def prune_shared_state():
+    async with AsyncSessionLocal() as db:
+        async with writer(db):
+            await db.run_sync(shared_state.prune)
+            await db.commit()
+
+async def shared_state_loop():
+    interval = SHARED_STATE_POLL_S if SHARED_STATE_POLL_S > 0 else SHARED_STATE_PRUNE_S
+    next_prune = time.monotonic() + SHARED_STATE_PRUNE_S
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if SHARED_STATE_POLL_S > 0:
+                await sync_shared_state()
+            if time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + SHARED_STATE_PRUNE_S
+                await prune_shared_state()
+        except Exception as ex:
+            print(f"Shared state sync failed: {ex}")
+
+dispatch_task: Optional[asyncio.Task] = None
+dispatch_lock: Optional[asyncio.Lock] = None
+last_dispatch: dict = {}
+
+def dispatch_round():
+    """Match available drivers to the oldest pending rides and accept them all in one transaction."""
+    db = SessionLocal()
+    try:
+        drivers = shared_state.drivers_available(db)
+        if drivers:
+            # Drivers who re-offered themselves while still on a ride are left out
+            busy = set(db.execute(
+                select(Ride.driver_id).where(Ride.driver_id.in_([d.id for d in drivers]), Ride.status == "accepted")
+            ).scalars())
+            drivers = [d for d in drivers if d.id not in busy]
+        if not drivers:
+            db.rollback()
+            return [], {"drivers": 0, "assigned": 0}
+        rides = db.execute(
+            select(Ride.id, Ride.pickup_lon, Ride.pickup_lat)
+            .where(RIDE_IS_PENDING, Ride.pickup_lon.is_not(None))
+            .order_by(Ride.created_at, Ride.id)
+            .limit(DISPATCH_MAX_RIDES)
+        ).all()
+        db.rollback()
+
+        start = time.perf_counter()
+        assignments, solver = plan_assignments(drivers, rides)
+        solve_s = time.perf_counter() - start
+
+        by_id = {driver.id: driver for driver in drivers}
+        applied = []
+        for a in assignments:
+            # A driver or ride taken since they were read, by hand or by another worker, is skipped
+            expires_at = shared_state.claim_driver(db, a.driver_id)
+            if expires_at is None:
+                continue
+            if transition_ride(db, a.ride_id, "pending", None, {
+                "status": "accepted",
+                "driver_id": a.driver_id,
+                "driver_name": by_id[a.driver_id].name,
+            }):
+                applied.append(a)
+            else:
+                shared_state.report_driver(db, by_id[a.driver_id], expires_at)
+        analytics.record_status_change(db, "pending", "accepted", count=len(applied))
+        events = [(RIDE_ACCEPTED, {
+            "id": a.ride_id, "driver_id": a.driver_id,
+            "driver_name": by_id[a.driver_id].name, "pickup_m": a.pickup_m,
+        }) for a in applied]
+        shared_state.record_events(db, get_broadcaster().boot, events)
+        db.commit()
+    finally:
+        db.close()
+
+    return events, {
+        "drivers": len(drivers),
+        "rides": len(rides),
+        "solver": solver,
+        "solve_ms": round(solve_s * 1000, 1),
+        "planned": len(assignments),
+        "assigned": len(applied),
+        "total_pickup_m": round(sum(a.pickup_m for a in applied)),
+    }
+
+async def run_dispatch() -> dict:
+    global dispatch_lock
+    if dispatch_lock is None:
+        dispatch_lock = asyncio.Lock()
+    async with dispatch_lock:
+        events, stats = await asyncio.get_running_loop().run_in_executor(None, dispatch_round)
+        if not stats["drivers"]:
+            return stats
+        publish_ride_events(events)
+        last_dispatch.clear()
+        last_dispatch.update(stats, finished_at=datetime.utcnow())
+        return dict(last_dispatch)
+
+async def dispatch_loop():
+    while True:
+        await asyncio.sleep(DISPATCH_INTERVAL_S)
+        try:
+            await run_dispatch()
+        except Exception as ex:
+            print(f"Dispatch round failed: {ex}")
+
+@app.post("/dispatch/run")
+async def run_dispatch_now(current_user: UserIdentity = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+    return await run_dispatch()
+
 @app.get("/analytics/ride_counts")
-async def ride_counts(db: Session = Depends(get_db)):
-    # Since we're using SQLAlchemy with SQLite, we need to use raw SQL for date functions
-    with engine.connect() as connection:
-        result = connection.execute("""
-            SELECT 
-                CAST(strftime('%w', created_at) AS INTEGER) AS day_of_week, 
-                COUNT(*) AS count
-            FROM rides
-            GROUP BY day_of_week
-            ORDER BY day_of_week
-        """)
-        results = result.fetchall()
-    
-    return [{"day": int(row[0]) + 1, "count": row[1]} for row in results]
+async def ride_counts(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    etag = await rides_etag(db)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    response.headers.update(validator_headers(etag))
+    return [{"day": weekday + 1, "count": count} for weekday, count in await db.run_sync(analytics.weekday_counts)]
 
 @app.get("/analytics/user_rides")
-async def user_rides(db: Session = Depends(get_db)):
-    with engine.connect() as connection:
-        result = connection.execute("""
-            SELECT 
-                rider_name, 
-                COUNT(*) AS count
-            FROM rides
-            GROUP BY rider_name
-            ORDER BY count DESC
-            LIMIT 10
-        """)
-        results = result.fetchall()
-    
-    return [{"rider_name": row[0], "count": row[1]} for row in results]
+async def user_rides(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    etag = await rides_etag(db)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    response.headers.update(validator_headers(etag))
+    return [{"rider_name": name, "count": count} for name, count in await db.run_sync(analytics.top_riders)]
 
-@app.get("/analytics/recent_rides")
-async def recent_rides(limit: int = 10, db: Session = Depends(get_db)):
-    rides = db.query(Ride).order_by(Ride.created_at.desc()).limit(limit).all()
-    return [
-        {
-            "id": ride.id,
-            "rider_name": ride.rider_name,
-            "pickup_location": ride.pickup_location,
-            "dropoff_location": ride.dropoff_location,
-            "requested_time": ride.requested_time,
-            "distance_m": ride.distance_m,
-            "duration_s": ride.duration_s,
-            "status": ride.status,
-            "created_at": ride.created_at,
-            "user_id": ride.user_id,
-            "driver_id": ride.driver_id,
-            "driver_name": ride.driver_name
-        }
-        for ride in rides
-    ]
+@app.get("/analytics/daily_counts")
+async def daily_counts(days: int = Query(30, ge=1, le=366), db: AsyncSession = Depends(get_db)):
+    return [{"day": day, "count": count} for day, count in await db.run_sync(analytics.daily_counts, days)]
+
+@app.get("/analytics/status_counts")
+async def status_counts(db: AsyncSession = Depends(get_db)):
+    return [{"status": ride_status, "count": count} for ride_status, count in await db.run_sync(analytics.status_counts)]
+
+@app.get("/analytics/auth_cache")
+async def auth_cache_stats():
+    return {**identity_cache.stats(), **revocations.stats()}
+
+@app.get("/analytics/password_pool")
+async def password_pool_stats():
+    return get_password_pool().stats()
+
+@app.get("/analytics/route_cache")
+async def route_cache_stats():
+    return get_route_cache().stats()
+
+@app.get("/analytics/rate_limits")
+async def rate_limit_stats():
+    return get_rate_limiter().stats()
+
+@app.get("/analytics/router")
+async def router_stats():
+    router = get_router()
+    return router.stats() if hasattr(router, "stats") else {"backend": type(router).__name__}
+
+@app.get("/analytics/routing_queue")
+async def routing_queue_stats():
+    return routing_queue.stats() if routing_queue is not None else {"mode": RIDE_ROUTING_MODE}
+
+@app.get("/analytics/ride_stream")
+async def ride_stream_stats():
+    return get_broadcaster().stats()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/slow_queries")
+async def slow_queries(
+    limit: int = Query(20, ge=1, le=500),
+    order: Literal["max", "total", "mean", "count"] = "max",
+    current_user: UserIdentity = Depends(get_current_user)
+):
+    """The statement shapes this worker has run, slowest first."""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+    log = query_log.get_query_log()
+    return {**log.summary(), "statements": log.top(limit, order)}
+
+@app.get("/analytics/dispatch")
+async def dispatch_stats(db: AsyncSession = Depends(get_db)):
+    drivers = await db.run_sync(shared_state.drivers_available)
+    return {"available_drivers": len(drivers), "last_round": last_dispatch or None}
+
+@app.get("/analytics/recent_rides", response_model=List[RideOut])
+async def recent_rides(
+    request: Request,
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    ride_status: Optional[str] = Query(None, alias="status"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    user_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    etag = await rides_etag(db)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    query = filter_rides(select(*RIDE_OUT_COLUMNS), since, until, user_id, ride_status)
+    rows, next_cursor = await paginate_rides(db, query, limit, cursor, descending=True)
+    return rides_json([row._asdict() for row in rows], next_cursor, etag=etag)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,84 @@
+"""Many drivers accepting the same rides at once.
+
+Starts ``--workers`` backend processes under ``launcher.py`` and creates
+``--rides`` pending rides.  For each ride, ``--drivers`` drivers call ``/rides/accept`` at the same
+moment.  Exactly one of them should win.  The script reports rides that were
+handed to more than one driver, accepts whose winner does not match the
+stored driver, and accept latency and throughput.
+
+    python -m benchmarks.bench_accept_race --workers 4 --drivers 16 --rides 100
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.harness import register_and_login, start_backend_workers, start_fake_osrm, stop_server, summarize
+
+RIDE = {"pickup_location": "120.98,14.59", "dropoff_location": "121.04,14.67", "requested_time": "08:00"}
+
+
+async def accept(client, ride_id, driver, latencies):
+    start = time.perf_counter()
+    res = await client.post(f"/rides/accept/{ride_id}", headers=driver)
+    latencies.append(time.perf_counter() - start)
+    return res.status_code
+
+
+async def race(base_url, args):
+    limits = httpx.Limits(max_connections=args.drivers + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        rider = await register_and_login(client, "Race Rider", "race-rider@example.com")
+        drivers = [await register_and_login(client, f"Driver {i}", f"race{i}@example.com") for i in range(args.drivers)]
+        ride_ids = []
+        for _ in range(args.rides):
+            res = await client.post("/rides/request", json=RIDE, headers=rider)
+            res.raise_for_status()
+            ride_ids.append(res.json()["request_id"])
+
+        latencies, outcomes = [], Counter()
+        double_assigned = 0
+        start = time.perf_counter()
+        for ride_id in ride_ids:
+            codes = await asyncio.gather(*(accept(client, ride_id, d, latencies) for d in drivers))
+            outcomes.update(codes)
+            if codes.count(200) > 1:
+                double_assigned += 1
+        elapsed = time.perf_counter() - start
+
+        unaccepted = 0
+        for ride_id in ride_ids:
+            if (await client.get(f"/rides/{ride_id}")).json()["status"] != "accepted":
+                unaccepted += 1
+
+    return {
+        "accept_attempts_per_s": round(len(latencies) / elapsed, 1),
+        "accept": summarize(latencies),
+        "status_codes": {str(code): n for code, n in sorted(outcomes.items())},
+        "rides_double_assigned": double_assigned,
+        "rides_left_unaccepted": unaccepted,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--drivers", type=int, default=16)
+    parser.add_argument("--rides", type=int, default=100)
+    args = parser.parse_args()
+
+    osrm, osrm_url = start_fake_osrm(0)
+    backend, base_url = start_backend_workers(osrm_url, args.workers, {"ROUTE_CACHE_DB_PATH": ""})
+    try:
+        result = asyncio.run(race(base_url, args))
+    finally:
+        stop_server(backend)
+        stop_server(osrm)
+    print(json.dumps({"workers": args.workers, "drivers": args.drivers, "rides": args.rides, **result}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Load test throughput and tail latency, sync sessions versus the async database layer.
+
+Runs ``benchmarks.loadtest`` twice on this tree with the same arguments: once
+with ``DB_SESSION_MODE=sync``, where every query blocks the event loop as the
+endpoints did before the async engine, and once with the async engine. The
+two alternate for ``--rounds`` rounds, and each side keeps its best round by
+throughput. The default mix has no register or login, so bcrypt does not
+drown out the database work. Any other arguments are passed on to the load
+test.
+
+    python -m benchmarks.bench_async_db --rounds 2 -- --clients 50 --duration 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.harness import PROJECT_DIR
+from benchmarks.loadtest import compare
+
+MIX = "request=10,pending=20,accept=8,complete=6"
+
+
+def loadtest(mode, args, extra):
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "result.json")
+        subprocess.run([sys.executable, "-m", "benchmarks.loadtest", "--mix", args.mix, "--output", output,
+                        "--env", f"DB_SESSION_MODE={mode}", *extra],
+                       cwd=PROJECT_DIR, check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            return json.load(f)
+
+
+def brief(result):
+    return {
+        "total": result["total"],
+        "actions": {action: {key: stats[key] for key in ("rps", "p50_ms", "p95_ms", "p99_ms")}
+                    for action, stats in result["actions"].items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--mix", default=MIX)
+    parser.add_argument("loadtest_args", nargs="*", help="passed to benchmarks.loadtest after --")
+    args = parser.parse_args()
+
+    best = {}
+    for i in range(args.rounds):
+        # Swap the order every round so neither side always runs first
+        for mode in ("sync", "async")[::1 if i % 2 == 0 else -1]:
+            result = loadtest(mode, args, args.loadtest_args)
+            if mode not in best or result["total"]["rps"] > best[mode]["total"]["rps"]:
+                best[mode] = result
+
+    print(json.dumps({
+        "mix": args.mix,
+        "sync": brief(best["sync"]),
+        "async": brief(best["async"]),
+        "async_vs_sync": compare(best["async"], best["sync"]),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Ride request latency against routing latency, inline versus background routing.
+
+For each ``--latency-ms`` value, starts a fake OSRM with that latency, then
+the backend with ``RIDE_ROUTING_MODE=inline`` and with ``background``, each
+against a fresh database. ``--clients`` clients request rides with random
+points, so the route cache does not help, for ``--duration`` seconds. Inline
+request latency grows with routing latency; background latency should not.
+For background runs, ``routed_after_s`` is how long after the last request
+the queue took to route every ride. The queue looks up at most
+``ROUTING_WORKERS`` routes at once, so that time grows with routing latency.
+
+    python -m benchmarks.bench_background_routing --latency-ms 50 500 2000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from benchmarks.harness import (
+    register_and_login, start_backend, start_fake_osrm, stop_server, summarize,
+)
+
+CENTER = (120.9842, 14.5995)
+
+
+def random_ride(rng):
+    def point():
+        return "%.5f,%.5f" % (CENTER[0] + rng.uniform(-0.1, 0.1), CENTER[1] + rng.uniform(-0.1, 0.1))
+    return {"pickup_location": point(), "dropoff_location": point(), "requested_time": "08:00"}
+
+
+async def request_rides(client, headers, stop_at, latencies, rng):
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        res = await client.post("/rides/request", json=random_ride(rng), headers=headers)
+        res.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+async def wait_routed(client, created, timeout_s):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout_s:
+        stats = (await client.get("/analytics/routing_queue")).json()
+        if stats["routed"] + stats["failed"] >= created:
+            return round(time.perf_counter() - start, 2), stats
+        await asyncio.sleep(0.1)
+    return None, stats
+
+
+async def run(args, base_url, mode):
+    limits = httpx.Limits(max_connections=args.clients + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        headers = await register_and_login(client, "Bench Rider", "bench@example.com")
+        latencies = []
+        stop_at = time.perf_counter() + args.duration
+        await asyncio.gather(*(request_rides(client, headers, stop_at, latencies, random.Random(i))
+                               for i in range(args.clients)))
+        result = {"rides": len(latencies), "rps": round(len(latencies) / args.duration, 1)}
+        result.update(summarize(latencies))
+        if mode == "background":
+            result["routed_after_s"], stats = await wait_routed(client, len(latencies), args.routed_timeout)
+            result["failed"] = stats["failed"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, nargs="+", default=[50, 500, 2000])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--routed-timeout", type=float, default=300,
+                        help="seconds to wait for the queue to route every ride; null when exceeded")
+    args = parser.parse_args()
+
+    runs = []
+    for latency_ms in args.latency_ms:
+        osrm, osrm_url = start_fake_osrm(latency_ms)
+        try:
+            for mode in ("inline", "background"):
+                backend, base_url = start_backend(osrm_url, {"RIDE_ROUTING_MODE": mode})
+                try:
+                    result = asyncio.run(run(args, base_url, mode))
+                finally:
+                    stop_server(backend)
+                runs.append({"routing_latency_ms": latency_ms, "mode": mode, **result})
+        finally:
+            stop_server(osrm)
+    print(json.dumps({"clients": args.clients, "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Write throughput with several backend workers, stock SQLite versus the production profile.
+
+Starts several backend workers twice under ``launcher.py``: once with
+``DB_PROFILE=default`` (rollback journal, full sync, no busy timeout) and once
+with ``DB_PROFILE=production``.  Riders post ride requests while drivers
+accept pending rides, all at once, and the script reports committed writes
+per second, latency percentiles and how many requests failed.  The databases
+live under the temporary directory, so point ``TMPDIR`` at the disk you
+want to measure.
+
+    python -m benchmarks.bench_concurrent_writes --workers 4 --riders 16 --drivers 4
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.harness import register_and_login, start_backend_workers, start_fake_osrm, stop_server, summarize
+
+RIDE = {"pickup_location": "120.98,14.59", "dropoff_location": "121.04,14.67", "requested_time": "08:00"}
+
+
+async def rider_loop(client, headers, stop_at, latencies, failures):
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        res = await client.post("/rides/request", json=RIDE, headers=headers)
+        if res.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            failures[res.status_code] += 1
+
+
+async def driver_loop(client, headers, stop_at, latencies, failures):
+    while time.perf_counter() < stop_at:
+        pending = (await client.get("/rides/pending", params={"limit": 5})).json()
+        if not pending:
+            await asyncio.sleep(0.01)
+            continue
+        for ride in pending:
+            start = time.perf_counter()
+            res = await client.post(f"/rides/accept/{ride['id']}", headers=headers)
+            if res.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            elif res.status_code != 404:  # another driver accepted it first
+                failures[res.status_code] += 1
+
+
+async def workload(base_url, args):
+    limits = httpx.Limits(max_connections=args.riders + args.drivers + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        riders = [await register_and_login(client, f"Rider {i}", f"writer{i}@example.com") for i in range(args.riders)]
+        drivers = [await register_and_login(client, f"Driver {i}", f"driver{i}@example.com") for i in range(args.drivers)]
+
+        stop_at = time.perf_counter() + args.duration
+        requests, accepts, failures = [], [], Counter()
+        await asyncio.gather(
+            *(rider_loop(client, h, stop_at, requests, failures) for h in riders),
+            *(driver_loop(client, h, stop_at, accepts, failures) for h in drivers),
+        )
+    return {
+        "writes_per_s": round((len(requests) + len(accepts)) / args.duration, 1),
+        "request_ride": summarize(requests),
+        "accept_ride": summarize(accepts),
+        "failures": dict(failures),
+    }
+
+
+def run(profile, osrm_url, args):
+    backend, base_url = start_backend_workers(
+        osrm_url, args.workers, {"DB_PROFILE": profile, "ROUTE_CACHE_DB_PATH": ""}
+    )
+    try:
+        return asyncio.run(workload(base_url, args))
+    finally:
+        stop_server(backend)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--riders", type=int, default=16)
+    parser.add_argument("--drivers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=15)
+    args = parser.parse_args()
+
+    osrm, osrm_url = start_fake_osrm(0)
+    try:
+        print(json.dumps({
+            "workers": args.workers,
+            "riders": args.riders,
+            "drivers": args.drivers,
+            "default": run("default", osrm_url, args),
+            "production": run("production", osrm_url, args),
+        }, indent=2))
+    finally:
+        stop_server(osrm)
+
+
+if __name__ == "__main__":
+    main()
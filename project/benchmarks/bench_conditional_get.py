@@ -0,0 +1,87 @@
+"""Dashboard reads with and without ETag revalidation.
+
+Starts the backend against a fresh database, stores ``--rides`` rides, then
+fetches each dashboard endpoint ``--requests`` times plainly and the same
+number of times with the ETag of its first response in ``If-None-Match``.
+While no ride changes, the second run gets ``304`` with no body, and the
+server reads only the change counter.
+
+    python -m benchmarks.bench_conditional_get --rides 5000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from benchmarks.harness import (
+    register_and_login, start_backend, start_fake_osrm, stop_server, summarize,
+)
+
+ENDPOINTS = (
+    "/rides/pending?limit=200",
+    "/analytics/recent_rides?limit=200",
+    "/analytics/ride_counts",
+    "/analytics/user_rides",
+)
+CENTER = (120.9842, 14.5995)
+BATCH = 100
+
+
+def random_ride(rng):
+    def point():
+        return "%.5f,%.5f" % (CENTER[0] + rng.uniform(-0.1, 0.1), CENTER[1] + rng.uniform(-0.1, 0.1))
+    return {"pickup_location": point(), "dropoff_location": point(), "requested_time": "08:00"}
+
+
+async def timed_gets(client, path, count, headers):
+    latencies, statuses, received = [], {}, 0
+    for _ in range(count):
+        start = time.perf_counter()
+        res = await client.get(path, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        statuses[res.status_code] = statuses.get(res.status_code, 0) + 1
+        received += len(res.content)
+    return {"status": statuses, "bytes_per_response": received // count, **summarize(latencies)}
+
+
+async def run(args, base_url):
+    rng = random.Random(1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        headers = await register_and_login(client, "Bench Rider", "bench@example.com")
+        for start in range(0, args.rides, BATCH):
+            batch = [random_ride(rng) for _ in range(min(BATCH, args.rides - start))]
+            (await client.post("/rides/request/batch", json=batch, headers=headers)).raise_for_status()
+
+        results = {}
+        for path in ENDPOINTS:
+            etag = (await client.get(path)).headers["ETag"]
+            results[path] = {
+                "plain": await timed_gets(client, path, args.requests, {}),
+                "if_none_match": await timed_gets(client, path, args.requests, {"If-None-Match": etag}),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rides", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    osrm, osrm_url = start_fake_osrm(args.latency_ms)
+    try:
+        backend, base_url = start_backend(osrm_url)
+        try:
+            print(json.dumps({"rides": args.rides, "endpoints": asyncio.run(run(args, base_url))}, indent=2))
+        finally:
+            stop_server(backend)
+    finally:
+        stop_server(osrm)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Contraction-hierarchy preprocessing time, file size and query latency.
+
+Builds a synthetic city grid (two-way streets with random speeds, a share of
+one-way streets and fast arterials every few blocks), preprocesses it, and
+compares query latency against the bidirectional Dijkstra of local_router.
+
+    python -m benchmarks.bench_contraction --rows 100 --cols 100
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from contraction import ContractionHierarchy, build_hierarchy, write_hierarchy
+from local_router import RoadGraph, bidirectional_dijkstra, haversine_m
+from benchmarks.harness import summarize
+
+
+def grid_graph(rows, cols, seed=7, spacing_deg=0.001, oneway_share=0.15, arterial_every=10):
+    rng = random.Random(seed)
+    lons, lats = [], []
+    for r in range(rows):
+        for c in range(cols):
+            lons.append(120.95 + c * spacing_deg)
+            lats.append(14.55 + r * spacing_deg)
+    graph = RoadGraph(lons, lats)
+
+    def connect(u, v, arterial):
+        distance = haversine_m(lons[u], lats[u], lons[v], lats[v])
+        speed = rng.uniform(15, 20) if arterial else rng.uniform(6, 12)
+        graph.add_edge(u, v, distance, distance / speed, rng.random() < oneway_share and not arterial)
+
+    for r in range(rows):
+        for c in range(cols):
+            node = r * cols + c
+            if c + 1 < cols:
+                connect(node, node + 1, r % arterial_every == 0)
+            if r + 1 < rows:
+                connect(node, node + cols, c % arterial_every == 0)
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--cols", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    graph = grid_graph(args.rows, args.cols)
+    path = os.path.join(tempfile.mkdtemp(prefix="cc-ch-"), "graph.ch")
+
+    started = time.perf_counter()
+    rank, edges = build_hierarchy(graph)
+    write_hierarchy(path, graph, rank, edges)
+    preprocess_s = time.perf_counter() - started
+
+    hierarchy = ContractionHierarchy(path)
+    rng = random.Random(11)
+    pairs = [(rng.randrange(len(graph)), rng.randrange(len(graph))) for _ in range(args.queries)]
+
+    ch_latency, dijkstra_latency, mismatches = [], [], 0
+    for source, target in pairs:
+        started = time.perf_counter()
+        try:
+            ch = hierarchy.query(source, target)
+        except Exception:
+            ch = None
+        ch_latency.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        try:
+            reference = bidirectional_dijkstra(graph, source, target)
+        except Exception:
+            reference = None
+        dijkstra_latency.append(time.perf_counter() - started)
+
+        if (ch is None) != (reference is None) or (ch and abs(ch[1] - reference[1]) > 1e-6):
+            mismatches += 1
+
+    print(json.dumps({
+        "nodes": len(graph),
+        "edges": graph.edge_count(),
+        "shortcuts": sum(len(e) for e in edges) - graph.edge_count(),
+        "preprocess_s": round(preprocess_s, 2),
+        "file_bytes": os.path.getsize(path),
+        "ch_query": summarize(ch_latency),
+        "bidirectional_dijkstra_query": summarize(dijkstra_latency),
+        "mismatches": mismatches,
+    }, indent=2))
+    hierarchy.close()
+
+
+if __name__ == "__main__":
+    main()
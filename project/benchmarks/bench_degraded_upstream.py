@@ -0,0 +1,119 @@
+"""Ride requests and pending reads while the routing service degrades.
+
+Starts a fake OSRM and the backend, then runs ``--ride-clients`` clients
+requesting rides and ``--pending-clients`` clients reading /rides/pending
+through four phases of ``--phase-s`` seconds each:
+
+* ``healthy``: every lookup takes ``--latency-ms``.
+* ``slow_tail``: ``--tail-fraction`` of lookups take ``--tail-ms``.
+* ``outage``: every lookup takes longer than the routing timeout.
+* ``recovered``: healthy again.
+
+Each phase reports ride request latency and status codes, and pending
+throughput and latency. The run is repeated with the routing guards (circuit
+breaker, hedging and the in-flight limit) turned off for comparison.
+
+    python -m benchmarks.bench_degraded_upstream --phase-s 20
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.harness import (
+    register_and_login, start_backend, start_fake_osrm, stop_server, summarize,
+)
+
+CENTER = (120.9842, 14.5995)
+ROUTING_TIMEOUT_S = 5
+GUARDS_OFF = {"ROUTING_MAX_IN_FLIGHT": "0", "ROUTING_BREAKER_FAILURES": "0", "ROUTING_HEDGE_PERCENTILE": "0"}
+
+
+def random_ride(rng):
+    def point():
+        return "%.5f,%.5f" % (CENTER[0] + rng.uniform(-0.1, 0.1), CENTER[1] + rng.uniform(-0.1, 0.1))
+    return {"pickup_location": point(), "dropoff_location": point(), "requested_time": "08:00"}
+
+
+async def request_rides(client, headers, stop_at, latencies, statuses, rng):
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        res = await client.post("/rides/request", json=random_ride(rng), headers=headers)
+        latencies.append(time.perf_counter() - start)
+        statuses[res.status_code] += 1
+        if res.status_code == 503:
+            # Honour a short Retry-After, as a well-behaved client would
+            await asyncio.sleep(min(float(res.headers.get("Retry-After", 1)), 1))
+
+
+async def poll_pending(client, headers, stop_at, latencies):
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        res = await client.get("/rides/pending", params={"limit": 20}, headers=headers)
+        res.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+async def phase(client, headers, args, rng):
+    stop_at = time.perf_counter() + args.phase_s
+    ride_latencies, pending_latencies, statuses = [], [], Counter()
+    await asyncio.gather(
+        *(request_rides(client, headers, stop_at, ride_latencies, statuses, rng) for _ in range(args.ride_clients)),
+        *(poll_pending(client, headers, stop_at, pending_latencies) for _ in range(args.pending_clients)),
+    )
+    return {
+        "rides": {"status": dict(statuses), **summarize(ride_latencies)},
+        "pending": {"rps": round(len(pending_latencies) / args.phase_s, 1), **summarize(pending_latencies)},
+    }
+
+
+async def run(args, base_url, osrm_url):
+    phases = (
+        ("healthy", {"latency_ms": args.latency_ms, "slow_fraction": 0}),
+        ("slow_tail", {"slow_fraction": args.tail_fraction, "slow_ms": args.tail_ms}),
+        ("outage", {"slow_fraction": 1, "slow_ms": ROUTING_TIMEOUT_S * 2000}),
+        ("recovered", {"slow_fraction": 0}),
+    )
+    rng = random.Random(1)
+    limits = httpx.Limits(max_connections=args.ride_clients + args.pending_clients + 4)
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        headers = await register_and_login(client, "Bench Rider", "bench@example.com")
+        async with httpx.AsyncClient(base_url=osrm_url) as osrm:
+            for name, settings in phases:
+                (await osrm.post("/_control", json=settings)).raise_for_status()
+                results[name] = await phase(client, headers, args, rng)
+        results["router"] = (await client.get("/analytics/router")).json()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--phase-s", type=float, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--tail-fraction", type=float, default=0.05)
+    parser.add_argument("--tail-ms", type=float, default=2000)
+    parser.add_argument("--ride-clients", type=int, default=20)
+    parser.add_argument("--pending-clients", type=int, default=4)
+    args = parser.parse_args()
+
+    output = {"routing_timeout_s": ROUTING_TIMEOUT_S}
+    for name, env in (("guarded", {}), ("unguarded", GUARDS_OFF)):
+        osrm, osrm_url = start_fake_osrm(args.latency_ms)
+        try:
+            backend, base_url = start_backend(osrm_url, {"ROUTING_TIMEOUT_S": str(ROUTING_TIMEOUT_S), **env})
+            try:
+                output[name] = asyncio.run(run(args, base_url, osrm_url))
+            finally:
+                stop_server(backend)
+        finally:
+            stop_server(osrm)
+    print(json.dumps(output, indent=2))
+
+
+if __name__ == "__main__":
+    main()
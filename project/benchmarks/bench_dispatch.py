@@ -0,0 +1,64 @@
+"""Solve time and match quality of the dispatch planner.
+
+Scatters drivers and ride pickups over ``--span-deg`` degrees around Manila
+and times ``dispatch.plan_assignments`` at each size in ``--sizes`` (drivers
+= rides). Each size runs with the exact Hungarian solver, when it is no larger
+than ``--max-exact``, and with the greedy fallback. The script reports solve
+time, matched pairs and mean pickup distance.
+
+    python -m benchmarks.bench_dispatch --sizes 1000 10000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from dispatch import AvailableDriver, plan_assignments
+
+CENTER = (121.0, 14.6)
+
+
+def scatter(rng, n, span):
+    return CENTER[0] + rng.uniform(-span / 2, span / 2, n), CENTER[1] + rng.uniform(-span / 2, span / 2, n)
+
+
+def run(drivers, rides, max_exact, max_pickup_m):
+    start = time.perf_counter()
+    assignments, solver = plan_assignments(drivers, rides, max_pickup_m=max_pickup_m, max_exact=max_exact)
+    elapsed = time.perf_counter() - start
+    return {
+        "solver": solver,
+        "solve_ms": round(elapsed * 1000, 1),
+        "matched": len(assignments),
+        "mean_pickup_m": round(sum(a.pickup_m for a in assignments) / len(assignments)) if assignments else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--span-deg", type=float, default=0.5)
+    parser.add_argument("--max-pickup-m", type=float, default=10000)
+    parser.add_argument("--max-exact", type=int, default=2000,
+                        help="largest size also solved exactly; the matrix needs 8*n*n bytes")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    results = []
+    for n in args.sizes:
+        dlon, dlat = scatter(rng, n, args.span_deg)
+        rlon, rlat = scatter(rng, n, args.span_deg)
+        drivers = [AvailableDriver(i, f"Driver {i}", float(x), float(y)) for i, (x, y) in enumerate(zip(dlon, dlat))]
+        rides = [(i, float(x), float(y)) for i, (x, y) in enumerate(zip(rlon, rlat))]
+        entry = {"drivers": n, "rides": n}
+        if n <= args.max_exact:
+            entry["hungarian"] = run(drivers, rides, n, args.max_pickup_m)
+        entry["greedy"] = run(drivers, rides, 0, args.max_pickup_m)
+        results.append(entry)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Login latency under a login storm, with bcrypt inline versus pooled.
+
+Starts the backend twice against fresh databases: once with
+``PASSWORD_POOL_WORKERS=0`` (bcrypt on the event loop, the old behaviour) and
+once with the pool.  Each run drives ``--clients`` concurrent login loops
+while one probe client polls ``/rides/pending``, and reports login and probe
+percentiles plus the number of fast-failed (503) logins.
+
+    python -m benchmarks.bench_login --clients 32 --duration 15
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.harness import start_backend, stop_server, summarize
+
+PASSWORD = "Password123"
+
+
+async def login_loop(client, email, stop_at, latencies, rejected):
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        res = await client.post("/token", data={"username": email, "password": PASSWORD})
+        if res.status_code == 503:
+            rejected.append(1)
+            await asyncio.sleep(float(res.headers.get("Retry-After", "1")))
+            continue
+        res.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+async def probe_loop(client, stop_at, latencies):
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        (await client.get("/rides/pending")).raise_for_status()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.05)
+
+
+async def storm(base_url, clients, duration):
+    limits = httpx.Limits(max_connections=clients + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        emails = [f"storm{i}@example.com" for i in range(clients)]
+        for i, email in enumerate(emails):
+            await client.post("/register", json={"name": f"Storm {i}", "email": email, "password": PASSWORD})
+
+        stop_at = time.perf_counter() + duration
+        logins, probes, rejected = [], [], []
+        await asyncio.gather(
+            probe_loop(client, stop_at, probes),
+            *(login_loop(client, email, stop_at, logins, rejected) for email in emails),
+        )
+    return {
+        "logins_per_s": round(len(logins) / duration, 1),
+        "login": summarize(logins),
+        "rejected_503": len(rejected),
+        "probe_pending": summarize(probes),
+    }
+
+
+def run(workers, args):
+    backend, base_url = start_backend("http://127.0.0.1:9", {"PASSWORD_POOL_WORKERS": str(workers)})
+    try:
+        return asyncio.run(storm(base_url, args.clients, args.duration))
+    finally:
+        stop_server(backend)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    print(json.dumps({
+        "clients": args.clients,
+        "inline": run(0, args),
+        f"pool_{args.workers}_workers": run(args.workers, args),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Server-side cost of the metrics middleware and SQL timers.
+
+A few microseconds of extra work per request is far below the run-to-run
+noise of a full request, so the cost is measured in two parts:
+
+* ``fixed_us``: the middleware wrapped around an app that does nothing,
+  minus that app alone.
+* ``per_query_us``: the two SQL timer events fired for one statement.
+
+The backend's ASGI app is then driven in-process, with no socket or HTTP
+client, for a few cheap read endpoints. For each one the script counts its
+SQL statements and reports ``overhead_pct``: the instrumentation cost as a
+share of the endpoint's time with metrics off. ``ab_pct`` is the plain
+on-versus-off comparison of the same runs. It is noisier, and it is there
+as a sanity check.
+
+    python -m benchmarks.bench_metrics_overhead --rounds 20 --requests 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+from benchmarks.harness import fresh_database_url
+
+PATHS = ["/", "/rides/1", "/rides/pending?limit=50", "/analytics/recent_rides?limit=50"]
+
+
+async def call(app, path):
+    """One GET through the full middleware stack; returns the status code."""
+    route, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": route, "raw_path": route.encode(), "query_string": query.encode(),
+        "root_path": "", "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+def best_of(rounds, fn, n):
+    """Fastest per-call time of ``fn`` over ``rounds`` rounds of ``n`` calls."""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(n):
+            fn()
+        best = min(best, (time.perf_counter() - start) / n)
+    return best
+
+
+async def abest_of(rounds, fn, n):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(n):
+            await fn()
+        best = min(best, (time.perf_counter() - start) / n)
+    return best
+
+
+async def middleware_cost(metrics, rounds):
+    class Route:
+        path = "/bench"
+
+    async def noop(scope, receive, send):
+        scope["route"] = Route
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def discard(message):
+        pass
+
+    wrapped = metrics.MetricsMiddleware(noop)
+    scope = {"type": "http", "method": "GET"}
+    bare = await abest_of(rounds, lambda: noop(dict(scope), None, discard), 2000)
+    timed = await abest_of(rounds, lambda: wrapped(dict(scope), None, discard), 2000)
+    return timed - bare
+
+
+def query_cost(metrics, engine, rounds):
+    """Both SQL timer events for one statement, charged to a request.
+
+    With metrics off the timers are never installed, so they cost nothing.
+    """
+    class Context:
+        pass
+
+    dispatch = engine.dispatch
+    token = metrics._request_db.set([0, 0.0])
+
+    def timers():
+        context = Context()
+        dispatch.before_cursor_execute(None, None, "SELECT 1", (), context, False)
+        dispatch.after_cursor_execute(None, None, "SELECT 1", (), context, False)
+    cost = best_of(rounds, timers, 5000) - best_of(rounds, Context, 5000)
+    metrics._request_db.reset(token)
+    return cost
+
+
+async def measure(app, engine, metrics, rounds, requests, fixed, per_query):
+    from sqlalchemy import event
+    results = {}
+    for path in PATHS:
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+        event.listen(engine, "after_cursor_execute", count)
+        assert await call(app, path) == 200, path
+        event.remove(engine, "after_cursor_execute", count)
+
+        timings = {True: float("inf"), False: float("inf")}
+        for i in range(rounds):
+            # Swap the order every round so neither setting always runs warm
+            for enabled in ((True, False) if i % 2 else (False, True)):
+                metrics.METRICS_ENABLED = enabled
+                timings[enabled] = min(timings[enabled], await abest_of(1, lambda: call(app, path), requests))
+        metrics.METRICS_ENABLED = True
+
+        cost = fixed + len(statements) * per_query
+        results[path] = {
+            "queries": len(statements),
+            "metrics_off_us": round(timings[False] * 1e6, 1),
+            "metrics_on_us": round(timings[True] * 1e6, 1),
+            "overhead_us": round(cost * 1e6, 2),
+            "overhead_pct": round(cost / timings[False] * 100, 2),
+            "ab_pct": round((timings[True] / timings[False] - 1) * 100, 2),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=100, help="requests per round")
+    parser.add_argument("--rides", type=int, default=1000)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = fresh_database_url()
+    os.environ.setdefault("ROUTE_CACHE_DB_PATH", "")
+    os.environ["METRICS_ENABLED"] = "1"
+    # Measured alone; the query log has its own listeners
+    os.environ["QUERY_LOG_ENABLED"] = "0"
+    from sqlalchemy import insert
+    import metrics
+    from backend import Ride, SessionLocal, app, async_engine, ride_coordinates
+
+    db = SessionLocal()
+    pickup, dropoff = "120.98,14.59", "121.04,14.67"
+    db.execute(insert(Ride), [{
+        "rider_name": f"Rider {i}", "pickup_location": pickup, "dropoff_location": dropoff,
+        "requested_time": "08:00", "distance_m": 14288, "duration_s": 1786, "status": "pending",
+        "created_at": datetime.utcnow(), "user_id": 1, **ride_coordinates(pickup, dropoff),
+    } for i in range(args.rides)])
+    db.commit()
+    db.close()
+
+    fixed = asyncio.run(middleware_cost(metrics, args.rounds))
+    # Endpoints run their SQL on the async engine, whose events fire on the engine it wraps
+    engine = async_engine.sync_engine
+    per_query = query_cost(metrics, engine, args.rounds)
+
+    async def measure_paths():
+        try:
+            return await measure(app, engine, metrics, args.rounds, args.requests, fixed, per_query)
+        finally:
+            # Open aiosqlite connections would keep their threads, and the process, alive
+            await async_engine.dispose()
+    results = asyncio.run(measure_paths())
+    print(json.dumps({
+        "fixed_us": round(fixed * 1e6, 2),
+        "per_query_us": round(per_query * 1e6, 2),
+        "paths": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
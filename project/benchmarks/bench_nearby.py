@@ -0,0 +1,115 @@
+"""Nearby pending ride lookup with the pickup band index versus parsing every row.
+
+Fills a scratch database with ``--rides`` pending rides scattered over
+``--span-deg`` degrees around Manila. It then times ``nearest_rides`` (the query
+behind ``/rides/pending?near=``) from random points, both as raw SQL and
+with ORM objects built. It compares these against the old approach of
+loading every pending ride and parsing its pickup string in Python.
+
+    python -m benchmarks.bench_nearby --rides 100000 --radius-m 2000
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime
+
+from benchmarks.harness import fresh_database_url, summarize
+
+CENTER = (121.0, 14.6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rides", type=int, default=100000)
+    parser.add_argument("--span-deg", type=float, default=0.5)
+    parser.add_argument("--radius-m", type=float, default=2000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = fresh_database_url()
+    os.environ.setdefault("ROUTE_CACHE_DB_PATH", "")
+    from sqlalchemy import event, insert
+    from backend import RIDE_IS_PENDING, Ride, SessionLocal, engine, nearest_rides, ride_coordinates
+    from geo import distance_m, parse_coordinates
+
+    rng = random.Random(args.seed)
+
+    def random_point():
+        half = args.span_deg / 2
+        return CENTER[0] + rng.uniform(-half, half), CENTER[1] + rng.uniform(-half, half)
+
+    db = SessionLocal()
+    now = datetime.utcnow()
+    rows = []
+    for i in range(args.rides):
+        pickup = "%.6f,%.6f" % random_point()
+        dropoff = "%.6f,%.6f" % random_point()
+        rows.append({
+            "rider_name": f"Rider {i % 1000}", "pickup_location": pickup, "dropoff_location": dropoff,
+            "requested_time": "08:00", "distance_m": 1000, "duration_s": 100, "status": "pending",
+            "created_at": now, "user_id": 1 + i % 1000, **ride_coordinates(pickup, dropoff),
+        })
+    for start in range(0, len(rows), 10000):
+        db.execute(insert(Ride), rows[start:start + 10000])
+    db.commit()
+
+    points = [random_point() for _ in range(args.queries)]
+    base = db.query(Ride).filter(RIDE_IS_PENDING)
+
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    indexed, found = [], []
+    for lon, lat in points:
+        start = time.perf_counter()
+        rides = nearest_rides(base, lon, lat, args.radius_m, args.limit).all()
+        indexed.append(time.perf_counter() - start)
+        found.append(len(rides))
+        db.expunge_all()
+    event.remove(engine, "before_cursor_execute", record)
+
+    # The same statements without building ORM objects: the index lookup itself
+    conn = db.connection()
+    sql_only = []
+    for statement, parameters in statements:
+        start = time.perf_counter()
+        conn.exec_driver_sql(statement, parameters).fetchall()
+        sql_only.append(time.perf_counter() - start)
+    plan = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statements[0][0], statements[0][1]).fetchall()
+
+    scan = []
+    for lon, lat in points[:max(args.queries // 50, 3)]:
+        start = time.perf_counter()
+        candidates = []
+        for ride_id, pickup in db.query(Ride.id, Ride.pickup_location).filter(RIDE_IS_PENDING):
+            point = parse_coordinates(pickup)
+            if point:
+                d = distance_m(lon, lat, *point)
+                if d <= args.radius_m:
+                    candidates.append((d, ride_id))
+        sorted(candidates)[:args.limit]
+        scan.append(time.perf_counter() - start)
+
+    db.close()
+
+    print(json.dumps({
+        "rides": args.rides,
+        "radius_m": args.radius_m,
+        "limit": args.limit,
+        "mean_rides_returned": round(sum(found) / len(found), 1),
+        "plan": [row[-1] for row in plan],
+        "band_index_sql": summarize(sql_only),
+        "band_index_orm": summarize(indexed),
+        "parse_every_row": summarize(scan),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Throughput of /rides/pending while route lookups are in flight.
+
+Starts a fake OSRM with a fixed latency and the backend against a fresh
+database, then measures /rides/pending requests per second twice: once on an
+idle server and once while ``--ride-clients`` clients keep ride requests (and
+therefore route lookups) in flight.  With a blocking routing call the second
+number collapses; with the async client it should stay close to the first.
+
+    python -m benchmarks.bench_pending_under_routing --latency-ms 500
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.harness import (
+    register_and_login, start_backend, start_fake_osrm, stop_server, summarize,
+)
+
+RIDE = {
+    "pickup_location": "120.9842,14.5995",
+    "dropoff_location": "121.0437,14.6760",
+    "requested_time": "2025-01-01T08:00",
+}
+
+
+async def poll_pending(client, headers, stop_at, latencies):
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        res = await client.get("/rides/pending", headers=headers)
+        res.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+async def request_rides(client, headers, stop_at, counter):
+    while time.perf_counter() < stop_at:
+        res = await client.post("/rides/request", json=RIDE, headers=headers)
+        if res.status_code == 200:
+            counter.append(1)
+
+
+async def phase(base_url, headers, duration, pending_clients, ride_clients):
+    limits = httpx.Limits(max_connections=pending_clients + ride_clients + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        stop_at = time.perf_counter() + duration
+        latencies, rides = [], []
+        tasks = [poll_pending(client, headers, stop_at, latencies) for _ in range(pending_clients)]
+        tasks += [request_rides(client, headers, stop_at, rides) for _ in range(ride_clients)]
+        await asyncio.gather(*tasks)
+    result = {"pending_rps": round(len(latencies) / duration, 1), "rides_created": len(rides)}
+    result.update(summarize(latencies))
+    return result
+
+
+async def run(args, base_url):
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        headers = await register_and_login(client, "Bench Rider", "bench@example.com")
+
+    idle = await phase(base_url, headers, args.duration, args.pending_clients, 0)
+    busy = await phase(base_url, headers, args.duration, args.pending_clients, args.ride_clients)
+    return {
+        "routing_latency_ms": args.latency_ms,
+        "pending_clients": args.pending_clients,
+        "ride_clients": args.ride_clients,
+        "idle": idle,
+        "with_routing_in_flight": busy,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=500)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--pending-clients", type=int, default=8)
+    parser.add_argument("--ride-clients", type=int, default=16)
+    args = parser.parse_args()
+
+    osrm, osrm_url = start_fake_osrm(args.latency_ms)
+    try:
+        backend, base_url = start_backend(osrm_url)
+        try:
+            print(json.dumps(asyncio.run(run(args, base_url)), indent=2))
+        finally:
+            stop_server(backend)
+    finally:
+        stop_server(osrm)
+
+
+if __name__ == "__main__":
+    main()
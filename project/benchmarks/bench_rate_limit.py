@@ -0,0 +1,85 @@
+"""Cost of one rate-limit check, and whether workers share a budget.
+
+Times ``--ops`` bucket takes over ``--keys`` keys with the memory store and
+the SQLite store. Then ``--workers`` processes take from one bucket of
+``--capacity`` tokens as fast as they can for ``--duration`` seconds. With a
+shared store the tokens they get add up to about the capacity; with memory
+stores each process gets a whole bucket of its own.
+
+    python -m benchmarks.bench_rate_limit --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from ratelimit import Limit, MemoryBucketStore, SqliteBucketStore
+
+
+def make_store(kind, path):
+    return MemoryBucketStore() if kind == "memory" else SqliteBucketStore(path)
+
+
+def time_takes(kind, path, ops, keys):
+    store = make_store(kind, path)
+    limit = Limit(1000, 1)
+    names = [f"user:{i}" for i in range(keys)]
+    rng = random.Random(1)
+    start = time.perf_counter()
+    for _ in range(ops):
+        store.take(rng.choice(names), limit, 1)
+    elapsed = time.perf_counter() - start
+    store.close()
+    return round(elapsed / ops * 1e6, 2)
+
+
+def drain_bucket(kind, path, capacity, duration, granted):
+    store = make_store(kind, path)
+    # Refills one token a day, so only the initial capacity is available
+    limit = Limit(capacity, 86400 * capacity)
+    count = 0
+    stop_at = time.perf_counter() + duration
+    while time.perf_counter() < stop_at:
+        if store.take("auth:127.0.0.1", limit, 1) == 0:
+            count += 1
+    store.close()
+    granted.put(count)
+
+
+def shared_budget(kind, path, workers, capacity, duration):
+    granted = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=drain_bucket, args=(kind, path, capacity, duration, granted))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    counts = [granted.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return {"granted": sum(counts), "per_worker": counts}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=50000)
+    parser.add_argument("--keys", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--capacity", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=2)
+    args = parser.parse_args()
+
+    result = {"capacity": args.capacity, "workers": args.workers}
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in ("memory", "sqlite"):
+            result[kind] = {
+                "us_per_take": time_takes(kind, os.path.join(tmp, "timing.db"), args.ops, args.keys),
+                "shared_bucket": shared_budget(kind, os.path.join(tmp, "shared.db"), args.workers,
+                                               args.capacity, args.duration),
+            }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
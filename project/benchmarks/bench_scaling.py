@@ -0,0 +1,49 @@
+"""Load test throughput as the number of backend workers grows.
+
+Runs ``benchmarks.loadtest`` once per ``--workers`` value, each against a
+fresh database, and reports total requests per second. ``speedup`` is that
+throughput over the first run's. ``efficiency`` is speedup divided by the
+worker ratio, so 1.0 is linear scaling. Workers beyond the core count cannot
+scale, and SQLite runs one write at a time, so the default mix is
+``read_heavy``. Any other arguments are passed on to the load test.
+
+    python -m benchmarks.bench_scaling --workers 1 2 4 -- --clients 100 --duration 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.harness import PROJECT_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--mix", default="read_heavy")
+    parser.add_argument("loadtest_args", nargs="*", help="passed to benchmarks.loadtest after --")
+    args = parser.parse_args()
+
+    runs = []
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "result.json")
+            subprocess.run([sys.executable, "-m", "benchmarks.loadtest", "--workers", str(workers),
+                            "--mix", args.mix, "--output", output, *args.loadtest_args],
+                           cwd=PROJECT_DIR, check=True, stdout=subprocess.DEVNULL)
+            with open(output) as f:
+                result = json.load(f)
+        runs.append({"workers": workers, "rps": result["total"]["rps"], "p99_ms": result["total"]["p99_ms"],
+                     "errors": result["total"]["errors"]})
+
+    base = runs[0]
+    for run in runs:
+        run["speedup"] = round(run["rps"] / base["rps"], 2) if base["rps"] else None
+        run["efficiency"] = round(run["speedup"] / (run["workers"] / base["workers"]), 2) if run["speedup"] else None
+    print(json.dumps({"cpu_count": os.cpu_count(), "mix": args.mix, "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
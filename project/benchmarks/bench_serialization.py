@@ -0,0 +1,94 @@
+"""Cost of turning ride rows into a JSON response body.
+
+Fills a scratch database with ``--rows`` rides and times two ways of building
+the body of a ride list response. The old way loads ORM objects, builds a
+dict per ride by hand, and runs FastAPI's ``jsonable_encoder`` and
+``json.dumps``. The new way (``rides_json``) selects only RideOut's columns
+and validates and encodes them in one pass through a pydantic TypeAdapter.
+Fetching and encoding are timed separately.
+
+    python -m benchmarks.bench_serialization --rows 10000
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+from benchmarks.harness import fresh_database_url, summarize
+
+
+def old_dict(ride):
+    return {
+        "id": ride.id,
+        "rider_name": ride.rider_name,
+        "pickup_location": ride.pickup_location,
+        "dropoff_location": ride.dropoff_location,
+        "requested_time": ride.requested_time,
+        "distance_m": ride.distance_m,
+        "duration_s": ride.duration_s,
+        "status": ride.status,
+        "created_at": ride.created_at,
+        "user_id": ride.user_id,
+        "driver_id": ride.driver_id,
+        "driver_name": ride.driver_name,
+        "version": ride.version
+    }
+
+
+def old_body(rides):
+    from fastapi.encoders import jsonable_encoder
+    # What JSONResponse.render does with the encoded content
+    return json.dumps(jsonable_encoder([old_dict(ride) for ride in rides]), ensure_ascii=False,
+                      allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = fresh_database_url()
+    os.environ.setdefault("ROUTE_CACHE_DB_PATH", "")
+    from sqlalchemy import insert
+    from backend import RIDE_OUT_COLUMNS, Ride, SessionLocal, ride_coordinates, rides_json
+
+    db = SessionLocal()
+    now = datetime.utcnow()
+    pickup, dropoff = "120.98,14.59", "121.04,14.67"
+    db.execute(insert(Ride), [{
+        "rider_name": f"Rider {i % 1000}", "pickup_location": pickup, "dropoff_location": dropoff,
+        "requested_time": "08:00", "distance_m": 14288, "duration_s": 1786, "status": "pending",
+        "created_at": now, "user_id": 1 + i % 1000, **ride_coordinates(pickup, dropoff),
+    } for i in range(args.rows)])
+    db.commit()
+
+    timings = {"old_fetch": [], "old_encode": [], "new_fetch": [], "new_encode": []}
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        rides = db.query(Ride).limit(args.rows).all()
+        fetched = time.perf_counter()
+        old = old_body(rides)
+        timings["old_fetch"].append(fetched - start)
+        timings["old_encode"].append(time.perf_counter() - fetched)
+        db.expunge_all()
+
+        start = time.perf_counter()
+        rows = db.query(*RIDE_OUT_COLUMNS).limit(args.rows).all()
+        fetched = time.perf_counter()
+        new = rides_json([row._asdict() for row in rows]).body
+        timings["new_fetch"].append(fetched - start)
+        timings["new_encode"].append(time.perf_counter() - fetched)
+    db.close()
+
+    assert json.loads(old) == json.loads(new), "both paths must produce the same JSON"
+    print(json.dumps({
+        "rows": args.rows,
+        "body_bytes": len(new),
+        **{name: summarize(samples) for name, samples in timings.items()},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Local stand-in for the OSRM route service used by the benchmarks.
+
+Run with ``python -m uvicorn benchmarks.fake_osrm:app --port 5100`` from the
+project directory.  ``FAKE_OSRM_LATENCY_MS`` and ``FAKE_OSRM_JITTER_MS`` control
+how long each route lookup takes.  ``POST /_control`` changes the latency while
+running, and can make a share of lookups slow (``slow_fraction``,
+``slow_ms``) or fail with ``503`` (``error_fraction``).
+"""
+import asyncio
+import math
+import os
+import random
+
+from fastapi import FastAPI, Response
+
+settings = {
+    "latency_ms": float(os.getenv("FAKE_OSRM_LATENCY_MS", "200")),
+    "jitter_ms": float(os.getenv("FAKE_OSRM_JITTER_MS", "0")),
+    "slow_fraction": 0.0,
+    "slow_ms": 0.0,
+    "error_fraction": 0.0,
+}
+
+app = FastAPI(title="fake OSRM")
+
+
+def haversine_m(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(a))
+
+
+@app.get("/route/v1/driving/{coords}")
+async def route(coords: str, response: Response):
+    delay = settings["latency_ms"] + random.uniform(-settings["jitter_ms"], settings["jitter_ms"])
+    if random.random() < settings["slow_fraction"]:
+        delay = settings["slow_ms"]
+    await asyncio.sleep(max(delay, 0) / 1000)
+    if random.random() < settings["error_fraction"]:
+        response.status_code = 503
+        return {"code": "Unavailable"}
+    try:
+        points = [tuple(map(float, p.split(","))) for p in coords.split(";")]
+        (lon1, lat1), (lon2, lat2) = points
+    except ValueError:
+        return {"code": "InvalidQuery", "message": "bad coordinates"}
+
+    distance = haversine_m(lon1, lat1, lon2, lat2) * 1.3
+    return {"code": "Ok", "routes": [{"distance": distance, "duration": distance / 8.0}]}
+
+
+@app.post("/_control")
+async def control(changes: dict):
+    settings.update({key: float(value) for key, value in changes.items() if key in settings})
+    return settings
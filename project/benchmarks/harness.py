@@ -0,0 +1,120 @@
+"""Helpers shared by the benchmark scripts: server processes and percentiles."""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app_path, port, env=None, extra_args=()):
+    """Start ``app_path`` under uvicorn and wait until it answers on ``port``."""
+    return start_process(
+        [sys.executable, "-m", "uvicorn", app_path, "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning", *extra_args],
+        app_path, port, env,
+    )
+
+
+def start_process(command, name, port, env=None):
+    proc = subprocess.Popen(command, cwd=PROJECT_DIR, env={**os.environ, **(env or {})})
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{name} exited with code {proc.returncode}")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"{name} did not start on port {port}")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# Load generators come from one address and a few users, which the limits would throttle
+NO_RATE_LIMITS = {"RATE_LIMIT_RIDES": "0", "RATE_LIMIT_AUTH": "0"}
+
+
+def fresh_database_url():
+    """Return a SQLite URL for an empty database in a temporary directory."""
+    path = os.path.join(tempfile.mkdtemp(prefix="cc-bench-"), "bench.db")
+    return f"sqlite:///{path}"
+
+
+def start_backend(osrm_url, env=None, extra_args=()):
+    """Start ``backend:app`` against a fresh database and the given router."""
+    port = free_port()
+    backend_env = {"DATABASE_URL": fresh_database_url(), "OSRM_URL": osrm_url, **NO_RATE_LIMITS}
+    backend_env.update(env or {})
+    proc = start_server("backend:app", port, backend_env, extra_args)
+    return proc, f"http://127.0.0.1:{port}"
+
+
+def start_backend_workers(osrm_url, workers, env=None):
+    """Start ``workers`` backend processes under ``launcher.py`` against a fresh database."""
+    port = free_port()
+    backend_env = {"DATABASE_URL": fresh_database_url(), "OSRM_URL": osrm_url, **NO_RATE_LIMITS}
+    backend_env.update(env or {})
+    proc = start_process(
+        [sys.executable, "launcher.py", "--workers", str(workers), "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        "launcher.py", port, backend_env,
+    )
+    return proc, f"http://127.0.0.1:{port}"
+
+
+def start_fake_osrm(latency_ms, jitter_ms=0):
+    port = free_port()
+    proc = start_server("benchmarks.fake_osrm:app", port, {
+        "FAKE_OSRM_LATENCY_MS": str(latency_ms),
+        "FAKE_OSRM_JITTER_MS": str(jitter_ms),
+    })
+    return proc, f"http://127.0.0.1:{port}"
+
+
+async def register_and_login(client, name, email, password="Password123"):
+    """Create a user (ignoring "already registered") and return auth headers."""
+    await client.post("/register", json={"name": name, "email": email, "password": password})
+    res = await client.post("/token", data={"username": email, "password": password})
+    res.raise_for_status()
+    return {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples_s):
+    """Summarize latencies (seconds) as milliseconds."""
+    return {
+        "count": len(samples_s),
+        "p50_ms": _ms(percentile(samples_s, 50)),
+        "p95_ms": _ms(percentile(samples_s, 95)),
+        "p99_ms": _ms(percentile(samples_s, 99)),
+    }
+
+
+def _ms(value):
+    return None if value is None else round(value * 1000, 3)
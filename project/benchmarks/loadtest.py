@@ -0,0 +1,307 @@
+"""Whole-backend load test with a scripted mix of user actions.
+
+Starts a fake OSRM with ``--latency-ms`` of route latency and ``backend:app``
+against a fresh database. ``--workers`` above 1 runs that many backend
+processes under ``launcher.py``. Every user is registered and logged in before the clock starts.
+Then ``--clients`` concurrent async clients each pick their next action at
+random, weighted by the mix, until ``--duration`` seconds are up:
+
+* ``register``: a new account, so it pays for a bcrypt hash.
+* ``login``: ``POST /token`` again for the client's own account.
+* ``request``: ``POST /rides/request`` with random points around Manila.
+  Pass ``--env RIDE_ROUTING_MODE=background`` to time it without the route.
+* ``pending``: ``GET /rides/pending``.
+* ``accept``: accept a ride another client requested.
+* ``complete``: complete a ride this client accepted.
+
+An action with nothing to act on, such as accept with no known pending
+ride, falls back to ``pending``. A ``404`` on accept means another client
+got the ride first, and is counted as a conflict rather than an error.
+
+The result is one JSON document with the configuration, the commit, and per
+action throughput and p50/p95/p99. Write it with ``--output``. Pass an
+earlier result to ``--compare`` to add the change against it.
+
+    python -m benchmarks.loadtest --mix default --clients 50 --duration 30 --output run.json
+    python -m benchmarks.loadtest --mix "request=2,pending=8,accept=1,complete=1" --compare run.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.harness import (
+    PROJECT_DIR, percentile, register_and_login, start_backend, start_backend_workers,
+    start_fake_osrm, stop_server, summarize,
+)
+
+ACTIONS = ("register", "login", "request", "pending", "accept", "complete")
+MIXES = {
+    # Riders post and poll, drivers take and finish rides, a few people sign in
+    "default": {"register": 1, "login": 2, "request": 10, "pending": 20, "accept": 8, "complete": 6},
+    "read_heavy": {"login": 1, "request": 2, "pending": 40, "accept": 1, "complete": 1},
+    "write_heavy": {"request": 20, "pending": 5, "accept": 15, "complete": 12},
+    "auth_storm": {"register": 5, "login": 15, "pending": 5},
+}
+CENTER = (120.9842, 14.5995)
+PASSWORD = "Password123"
+
+
+def parse_mix(value):
+    if value in MIXES:
+        return dict(MIXES[value])
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ACTIONS:
+            raise argparse.ArgumentTypeError(f"unknown action {name!r}; expected one of {', '.join(ACTIONS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Shared:
+    """State the clients hand each other: rides waiting for a driver."""
+
+    def __init__(self):
+        self.pending = []
+        self.registered = 0
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.conflicts = defaultdict(int)
+        self.errors = defaultdict(int)
+
+    def record(self, action, elapsed, status):
+        self.latencies[action].append(elapsed)
+        self.statuses[action][str(status)] += 1
+
+
+def random_point(rng):
+    return "%.5f,%.5f" % (CENTER[0] + rng.uniform(-0.1, 0.1), CENTER[1] + rng.uniform(-0.1, 0.1))
+
+
+class VirtualUser:
+    def __init__(self, client, shared, recorder, email, headers, rng):
+        self.client = client
+        self.shared = shared
+        self.recorder = recorder
+        self.email = email
+        self.headers = headers
+        self.rng = rng
+        self.accepted = []
+
+    def runnable(self, action):
+        if action == "accept":
+            return bool(self.shared.pending)
+        if action == "complete":
+            return bool(self.accepted)
+        return True
+
+    async def timed(self, action, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            res = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.errors[f"{action}: {type(e).__name__}"] += 1
+            return None
+        self.recorder.record(action, time.perf_counter() - start, res.status_code)
+        return res
+
+    async def register(self):
+        self.shared.registered += 1
+        email = f"load{self.shared.registered}-{self.rng.getrandbits(32):x}@example.com"
+        await self.timed("register", "POST", "/register",
+                         json={"name": "Load Rider", "email": email, "password": PASSWORD})
+
+    async def login(self):
+        # Signs in again as the same account, so rides it accepted stay its own
+        res = await self.timed("login", "POST", "/token", data={"username": self.email, "password": PASSWORD})
+        if res is not None and res.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+    async def request(self):
+        ride = {"pickup_location": random_point(self.rng), "dropoff_location": random_point(self.rng),
+                "requested_time": "08:00"}
+        res = await self.timed("request", "POST", "/rides/request", json=ride, headers=self.headers)
+        # 202 when RIDE_ROUTING_MODE=background; accept 404s until the route is in
+        if res is not None and res.status_code in (200, 202):
+            self.shared.pending.append(res.json()["request_id"])
+
+    async def pending(self):
+        await self.timed("pending", "GET", "/rides/pending", params={"limit": 50}, headers=self.headers)
+
+    async def accept(self):
+        pending = self.shared.pending
+        # Take a random ride, so clients do not all race for the newest one
+        ride_id = pending.pop(self.rng.randrange(len(pending)))
+        res = await self.timed("accept", "POST", f"/rides/accept/{ride_id}", headers=self.headers)
+        if res is None:
+            return
+        if res.status_code == 200:
+            self.accepted.append(ride_id)
+        elif res.status_code == 404:
+            self.recorder.conflicts["accept"] += 1
+
+    async def complete(self):
+        ride_id = self.accepted.pop(0)
+        await self.timed("complete", "POST", f"/rides/complete/{ride_id}", headers=self.headers)
+
+    async def run(self, mix, stop_at, think_s):
+        actions, weights = zip(*mix.items())
+        while time.perf_counter() < stop_at:
+            action = self.rng.choices(actions, weights)[0]
+            if not self.runnable(action):
+                action = "pending"
+            await getattr(self, action)()
+            if think_s:
+                await asyncio.sleep(self.rng.expovariate(1 / think_s))
+
+
+async def setup_users(base_url, count, concurrency):
+    """Register and log in ``count`` accounts; bcrypt makes this the slow part."""
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with gate:
+            email = f"seed{i}@example.com"
+            headers = await register_and_login(client, f"Seed {i}", email, PASSWORD)
+            return email, headers
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        return await asyncio.gather(*(one(i) for i in range(count)))
+
+
+async def run(args, base_url):
+    seeded = await setup_users(base_url, args.clients, args.setup_concurrency)
+    rng = random.Random(args.seed)
+    shared = Shared()
+    recorder = Recorder()
+
+    limits = httpx.Limits(max_connections=args.clients + 4, max_keepalive_connections=args.clients + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        users = [VirtualUser(client, shared, recorder, email, headers, random.Random(rng.random()))
+                 for email, headers in seeded]
+        if args.warmup:
+            warm_until = time.perf_counter() + args.warmup
+            await asyncio.gather(*(u.run(args.mix, warm_until, args.think_ms / 1000) for u in users))
+            recorder.__init__()
+        start = time.perf_counter()
+        await asyncio.gather(*(u.run(args.mix, start + args.duration, args.think_ms / 1000) for u in users))
+        elapsed = time.perf_counter() - start
+
+    actions = {}
+    for action in ACTIONS:
+        samples = recorder.latencies.get(action)
+        if not samples:
+            continue
+        actions[action] = {
+            "rps": round(len(samples) / elapsed, 1),
+            **summarize(samples),
+            "max_ms": round(max(samples) * 1000, 3),
+            "status": dict(recorder.statuses[action]),
+        }
+        if action in recorder.conflicts:
+            actions[action]["conflicts"] = recorder.conflicts[action]
+    everything = [s for samples in recorder.latencies.values() for s in samples]
+    return {
+        "commit": git_commit(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "mix": args.mix, "clients": args.clients, "duration_s": args.duration, "warmup_s": args.warmup,
+            "think_ms": args.think_ms, "workers": args.workers, "routing_latency_ms": args.latency_ms,
+            "routing_jitter_ms": args.jitter_ms, "seed": args.seed,
+        },
+        "total": {
+            "requests": len(everything),
+            "rps": round(len(everything) / elapsed, 1),
+            "p50_ms": round(percentile(everything, 50) * 1000, 3) if everything else None,
+            "p99_ms": round(percentile(everything, 99) * 1000, 3) if everything else None,
+            "errors": dict(recorder.errors),
+        },
+        "actions": actions,
+    }
+
+
+def compare(result, baseline):
+    """Relative change of throughput and latency against an earlier run."""
+    def change(new, old):
+        return None if not old or new is None else round((new - old) / old * 100, 1)
+
+    diff = {
+        "baseline_commit": baseline.get("commit"),
+        # Numbers from runs with different settings are not comparable
+        "config_changed": sorted(k for k in result["config"] if result["config"][k] != baseline.get("config", {}).get(k)),
+        "total_rps_pct": change(result["total"]["rps"], baseline["total"]["rps"]),
+    }
+    for action, now in result["actions"].items():
+        before = baseline.get("actions", {}).get(action)
+        if before:
+            diff[action] = {f"{key}_pct": change(now[key], before[key]) for key in ("rps", "p50_ms", "p95_ms", "p99_ms")}
+    return diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mix", type=parse_mix, default="default",
+                        help=f"one of {', '.join(MIXES)}, or weights like 'request=2,pending=8'")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of load before measuring")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a client's actions")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--setup-concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    parser.add_argument("--compare", help="an earlier --output file to compare against")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra backend environment, e.g. --env DB_PROFILE=default")
+    args = parser.parse_args()
+
+    env = {"ROUTE_CACHE_DB_PATH": ""}
+    env.update(item.split("=", 1) for item in args.env)
+    osrm, osrm_url = start_fake_osrm(args.latency_ms, args.jitter_ms)
+    try:
+        if args.workers > 1:
+            backend, base_url = start_backend_workers(osrm_url, args.workers, env)
+        else:
+            backend, base_url = start_backend(osrm_url, env)
+        try:
+            result = asyncio.run(run(args, base_url))
+        finally:
+            stop_server(backend)
+    finally:
+        stop_server(osrm)
+
+    if args.env:
+        result["config"]["env"] = dict(item.split("=", 1) for item in args.env)
+    if args.compare:
+        with open(args.compare) as f:
+            result["compare"] = compare(result, json.load(f))
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Fail if any query issued by a backend endpoint full-scans the rides table.
+
+Runs every endpoint against a scratch SQLite database, records each statement
+that reaches the driver, then replays it through EXPLAIN QUERY PLAN.  Exits
+non-zero and lists the offenders if a plan contains a bare ``SCAN rides``.
+
+    python check_query_plans.py
+"""
+import os
+import re
+import sys
+import tempfile
+from collections import defaultdict
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="cc-plan-"), "plan.db")
+os.environ.setdefault("ROUTE_CACHE_DB_PATH", "")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import backend
+import routing
+
+FULL_SCAN = re.compile(r"^SCAN rides(?! USING)")
+
+current_endpoint = None
+statements = defaultdict(list)
+
+
+@event.listens_for(backend.async_engine.sync_engine, "before_cursor_execute")
+@event.listens_for(backend.engine, "before_cursor_execute")
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    if current_endpoint and not executemany and re.search(r"\brides\b", statement):
+        statements[current_endpoint].append((statement, parameters))
+
+
+class FixedRouter(routing.Router):
+    async def route(self, pickup, dropoff):
+        return 1500.0, 300.0
+
+
+def call(client, method, path, **kwargs):
+    global current_endpoint
+    template = kwargs.pop("template", path)
+    current_endpoint = f"{method} {template}"
+    try:
+        res = client.request(method, path, **kwargs)
+    finally:
+        current_endpoint = None
+    if res.status_code >= 500:
+        raise RuntimeError(f"{method} {path} failed: {res.status_code} {res.text}")
+    return res
+
+
+def exercise(client):
+    call(client, "POST", "/register", json={"name": "Plan Rider", "email": "plan@example.com", "password": "Password123"})
+    token = call(client, "POST", "/token", data={"username": "plan@example.com", "password": "Password123"}).json()["access_token"]
+    auth = {"Authorization": f"Bearer {token}"}
+    ride = {"pickup_location": "120.98,14.59", "dropoff_location": "121.04,14.67", "requested_time": "08:00"}
+
+    call(client, "GET", "/user/me", headers=auth)
+    for _ in range(20):
+        call(client, "POST", "/rides/request", json=ride, headers=auth)
+    call(client, "POST", "/rides/request/batch", json=[ride] * 20, headers=auth)
+
+    pending = call(client, "GET", "/rides/pending", params={"limit": 5})
+    call(client, "GET", "/rides/pending", params={"limit": 5, "cursor": pending.headers["X-Next-Cursor"]})
+    call(client, "GET", "/rides/pending", params={"user_id": 2, "since": "2000-01-01T00:00:00", "until": "2100-01-01T00:00:00"})
+    call(client, "GET", "/rides/pending", params={"near": "120.99,14.60", "radius_m": 3000})
+
+    admin_token = call(client, "POST", "/token", data={"username": backend.ADMIN_EMAIL, "password": backend.ADMIN_PASSWORD}).json()["access_token"]
+    call(client, "POST", "/drivers/available", json={"location": "121.00,14.60"}, headers=auth)
+    call(client, "POST", "/dispatch/run", headers={"Authorization": f"Bearer {admin_token}"})
+
+    ride_id = pending.json()[0]["id"]
+    call(client, "GET", f"/rides/{ride_id}", template="/rides/{ride_id}")
+    call(client, "POST", f"/rides/accept/{ride_id}", headers=auth, template="/rides/accept/{rid}")
+    call(client, "POST", f"/rides/complete/{ride_id}", headers=auth, template="/rides/complete/{rid}")
+
+    call(client, "GET", "/analytics/ride_counts")
+    call(client, "GET", "/analytics/user_rides")
+    call(client, "GET", "/analytics/daily_counts")
+    call(client, "GET", "/analytics/status_counts")
+    recent = call(client, "GET", "/analytics/recent_rides", params={"limit": 5})
+    call(client, "GET", "/analytics/recent_rides", params={"limit": 5, "cursor": recent.headers["X-Next-Cursor"]})
+    for params in ({"status": "completed"}, {"user_id": 2}, {"since": "2000-01-01T00:00:00"}):
+        call(client, "GET", "/analytics/recent_rides", params=params)
+
+
+def main():
+    routing._router = FixedRouter()
+    with TestClient(backend.app) as client:
+        exercise(client)
+
+    failures = 0
+    with backend.engine.connect() as conn:
+        for endpoint, recorded in sorted(statements.items()):
+            seen = set()
+            for statement, parameters in recorded:
+                if statement in seen or not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                    continue
+                seen.add(statement)
+                plan = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+                scans = [row[-1] for row in plan if FULL_SCAN.match(row[-1])]
+                if not scans:
+                    status = "ok"
+                else:
+                    status = "FULL SCAN"
+                    failures += 1
+                print(f"[{status}] {endpoint}: {' | '.join(row[-1] for row in plan)}")
+                if status == "FULL SCAN":
+                    print("    " + " ".join(statement.split()))
+
+    if failures:
+        print(f"\n{failures} statement(s) fall back to a full scan of rides")
+        sys.exit(1)
+    print("\nNo endpoint query full-scans rides")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""GET with ETag revalidation for the dashboards.
+
+The backend tags the ride lists and analytics with an ``ETag`` that changes
+whenever a ride does. ``get`` remembers the last response for each URL and
+sends its ETag back as ``If-None-Match``; on ``304 Not Modified`` it returns
+the remembered response, so callers read ``.json()`` and headers as usual
+while the server skips the query.
+"""
+import threading
+from collections import OrderedDict
+
+import requests
+
+# Responses remembered; the least recently used is dropped beyond this
+MAX_ENTRIES = 64
+
+
+class ValidatorCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._responses: "OrderedDict[str, requests.Response]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, headers=None, **kwargs) -> requests.Response:
+        # The prepared URL includes the query string, so each page and filter is its own entry
+        key = requests.Request("GET", url, params=params).prepare().url
+        with self._lock:
+            cached = self._responses.get(key)
+        headers = dict(headers or {})
+        if cached is not None:
+            headers["If-None-Match"] = cached.headers["ETag"]
+        resp = requests.get(url, params=params, headers=headers, **kwargs)
+        if resp.status_code == 304 and cached is not None:
+            resp = cached
+        with self._lock:
+            if resp.status_code == 200 and "ETag" in resp.headers:
+                self._responses[key] = resp
+                self._responses.move_to_end(key)
+                while len(self._responses) > self.max_entries:
+                    self._responses.popitem(last=False)
+            elif resp is not cached:
+                self._responses.pop(key, None)
+        return resp
+
+
+_cache = ValidatorCache()
+
+
+def get(url, params=None, headers=None, **kwargs) -> requests.Response:
+    """``requests.get`` that revalidates with the process-wide ValidatorCache."""
+    return _cache.get(url, params=params, headers=headers, **kwargs)
@@ -0,0 +1,281 @@
+"""Contraction-hierarchy preprocessing and queries for the local road graph.
+
+Build a hierarchy once from the JSON road graph used by ``local_router``::
+
+    python contraction.py road_graph.json road_graph.ch
+
+and start the backend with ``ROUTER_BACKEND=ch`` and ``CH_PATH=road_graph.ch``.
+The ``.ch`` file is a header followed by flat little-endian arrays, so it is
+memory-mapped rather than parsed and many workers share one copy in the page
+cache.
+"""
+import heapq
+import mmap
+import struct
+import sys
+import time
+from array import array
+from typing import Dict, List, Tuple
+
+from local_router import NodeLocator, RoadGraph
+from routing import Router, RouteNotFound, parse_point
+
+# Nodes settled by one witness search before giving up and adding the shortcut
+WITNESS_SETTLE_LIMIT = 60
+
+MAGIC = b"CCCH\x00\x01\x00\x00"
+HEADER = struct.Struct("<8sqqq")
+INF = float("inf")
+
+
+def _witness_costs(out_adj, source, skip, limit, settle_limit):
+    """Travel times from ``source`` avoiding ``skip``, up to ``limit`` seconds."""
+    costs = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = 0
+    while heap and settled < settle_limit:
+        t, node = heapq.heappop(heap)
+        if t > limit:
+            break
+        if t > costs[node]:
+            continue
+        settled += 1
+        for neighbour, (duration, _) in out_adj[node].items():
+            if neighbour == skip:
+                continue
+            nt = t + duration
+            if nt < costs.get(neighbour, INF):
+                costs[neighbour] = nt
+                heapq.heappush(heap, (nt, neighbour))
+    return costs
+
+
+def _shortcuts_for(out_adj, in_adj, node, settle_limit):
+    """Shortcuts needed to contract ``node`` as ``(from, to, duration, distance)``."""
+    outs = out_adj[node]
+    if not outs or not in_adj[node]:
+        return []
+    max_out = max(duration for duration, _ in outs.values())
+    shortcuts = []
+    for u, (t_in, d_in) in in_adj[node].items():
+        witness = _witness_costs(out_adj, u, node, t_in + max_out, settle_limit)
+        for x, (t_out, d_out) in outs.items():
+            if x != u and witness.get(x, INF) > t_in + t_out:
+                shortcuts.append((u, x, t_in + t_out, d_in + d_out))
+    return shortcuts
+
+
+def build_hierarchy(graph: RoadGraph, settle_limit: int = WITNESS_SETTLE_LIMIT):
+    """Contract every node of ``graph`` and return ``(rank, edges)``.
+
+    ``edges[u]`` maps each head ``x`` to ``(duration_s, distance_m)`` for the
+    original edges plus all shortcuts.  Nodes are contracted in order of
+    edge difference, with a lazy re-check of the priority on every pop.
+    """
+    n = len(graph)
+    out_adj: List[Dict[int, Tuple[float, float]]] = [{} for _ in range(n)]
+    in_adj: List[Dict[int, Tuple[float, float]]] = [{} for _ in range(n)]
+    for u in range(n):
+        for v, duration, distance in graph.forward[u]:
+            if u != v and duration < out_adj[u].get(v, (INF,))[0]:
+                out_adj[u][v] = (duration, distance)
+                in_adj[v][u] = (duration, distance)
+    edges = [dict(adj) for adj in out_adj]
+    deleted_neighbours = [0] * n
+
+    def priority(node):
+        added = len(_shortcuts_for(out_adj, in_adj, node, settle_limit))
+        return added - len(in_adj[node]) - len(out_adj[node]) + deleted_neighbours[node]
+
+    heap = [(priority(node), node) for node in range(n)]
+    heapq.heapify(heap)
+    rank = [0] * n
+    level = 0
+    while heap:
+        _, node = heapq.heappop(heap)
+        current = priority(node)
+        if heap and current > heap[0][0]:
+            heapq.heappush(heap, (current, node))
+            continue
+
+        for u, x, duration, distance in _shortcuts_for(out_adj, in_adj, node, settle_limit):
+            if duration < out_adj[u].get(x, (INF,))[0]:
+                out_adj[u][x] = (duration, distance)
+                in_adj[x][u] = (duration, distance)
+                edges[u][x] = (duration, distance)
+        for u in in_adj[node]:
+            del out_adj[u][node]
+            deleted_neighbours[u] += 1
+        for x in out_adj[node]:
+            del in_adj[x][node]
+            deleted_neighbours[x] += 1
+        out_adj[node] = {}
+        in_adj[node] = {}
+        rank[node] = level
+        level += 1
+    return rank, edges
+
+
+def _csr(n, adjacency):
+    first, head, duration, distance = array("i", [0]), array("i"), array("d"), array("d")
+    for node in range(n):
+        for neighbour, (t, d) in adjacency[node]:
+            head.append(neighbour)
+            duration.append(t)
+            distance.append(d)
+        first.append(len(head))
+    return first, head, duration, distance
+
+
+def _pad(size):
+    return (size + 7) & ~7
+
+
+def write_hierarchy(path: str, graph: RoadGraph, rank, edges):
+    """Write the upward forward and backward graphs as flat arrays."""
+    n = len(graph)
+    up = [[] for _ in range(n)]
+    down = [[] for _ in range(n)]
+    for u in range(n):
+        for x, weights in edges[u].items():
+            if rank[x] > rank[u]:
+                up[u].append((x, weights))
+            else:
+                # Searched backwards from x, climbing to the higher-ranked u
+                down[x].append((u, weights))
+
+    forward, backward = _csr(n, up), _csr(n, down)
+    sections = [array("d", graph.lons), array("d", graph.lats), *forward, *backward]
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, n, len(forward[1]), len(backward[1])))
+        for section in sections:
+            data = section.tobytes()
+            f.write(data)
+            f.write(b"\0" * (_pad(len(data)) - len(data)))
+
+
+class ContractionHierarchy:
+    """Memory-mapped contraction hierarchy answering fastest-route queries."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, n, forward_edges, backward_edges = HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a contraction hierarchy file")
+        self._views = [view]
+        self._offset = HEADER.size
+
+        self.node_count = n
+        self.lons = self._take(view, "d", n)
+        self.lats = self._take(view, "d", n)
+        self.forward = self._take_csr(view, n, forward_edges)
+        self.backward = self._take_csr(view, n, backward_edges)
+
+    def _take(self, view, fmt, count):
+        size = count * struct.calcsize(fmt)
+        section = view[self._offset:self._offset + size].cast(fmt)
+        self._offset += _pad(size)
+        self._views.append(section)
+        return section
+
+    def _take_csr(self, view, n, m):
+        return (self._take(view, "i", n + 1), self._take(view, "i", m),
+                self._take(view, "d", m), self._take(view, "d", m))
+
+    def query(self, source: int, target: int) -> Tuple[float, float]:
+        """Return ``(distance_m, duration_s)`` of the fastest route."""
+        if source == target:
+            return 0.0, 0.0
+
+        labels = ({source: (0.0, 0.0)}, {target: (0.0, 0.0)})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        graphs = (self.forward, self.backward)
+        best_time, best_dist = INF, INF
+
+        side = 0
+        while heaps[0] or heaps[1]:
+            # Alternate, but never expand a side that can no longer improve
+            if not heaps[side] or heaps[side][0][0] >= best_time:
+                side ^= 1
+                if not heaps[side] or heaps[side][0][0] >= best_time:
+                    break
+
+            t, node = heapq.heappop(heaps[side])
+            own, other = labels[side], labels[side ^ 1]
+            node_time, node_dist = own[node]
+            if t > node_time:
+                side ^= 1
+                continue
+            if node in other:
+                other_time, other_dist = other[node]
+                if node_time + other_time < best_time:
+                    best_time = node_time + other_time
+                    best_dist = node_dist + other_dist
+
+            # Stall-on-demand: a higher node already reaches this one faster,
+            # so nothing found from here can be on a shortest route
+            first, head, duration, _ = graphs[side ^ 1]
+            if any(own.get(head[i], (INF,))[0] + duration[i] < node_time
+                   for i in range(first[node], first[node + 1])):
+                side ^= 1
+                continue
+
+            first, head, duration, distance = graphs[side]
+            for i in range(first[node], first[node + 1]):
+                neighbour = head[i]
+                nt = node_time + duration[i]
+                if nt < own.get(neighbour, (INF,))[0]:
+                    own[neighbour] = (nt, node_dist + distance[i])
+                    heapq.heappush(heaps[side], (nt, neighbour))
+            side ^= 1
+
+        if best_time == INF:
+            raise RouteNotFound("no route between the given points")
+        return best_dist, best_time
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+
+class CHRouter(Router):
+    """Router answering from a memory-mapped contraction hierarchy."""
+
+    def __init__(self, hierarchy: ContractionHierarchy):
+        self.hierarchy = hierarchy
+        self.locator = NodeLocator(hierarchy.lons, hierarchy.lats)
+
+    @classmethod
+    def from_file(cls, path: str) -> "CHRouter":
+        return cls(ContractionHierarchy(path))
+
+    def route_sync(self, pickup: str, dropoff: str) -> Tuple[float, float]:
+        source = self.locator.nearest(*parse_point(pickup))
+        target = self.locator.nearest(*parse_point(dropoff))
+        return self.hierarchy.query(source, target)
+
+    async def route(self, pickup: str, dropoff: str) -> Tuple[float, float]:
+        # Queries settle a few hundred nodes at most; not worth a thread hop
+        return self.route_sync(pickup, dropoff)
+
+    async def aclose(self):
+        self.hierarchy.close()
+
+
+def preprocess(graph_path: str, ch_path: str, settle_limit: int = WITNESS_SETTLE_LIMIT):
+    graph = RoadGraph.load(graph_path)
+    rank, edges = build_hierarchy(graph, settle_limit)
+    write_hierarchy(ch_path, graph, rank, edges)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: python contraction.py ROAD_GRAPH.json OUTPUT.ch")
+        sys.exit(2)
+    started = time.perf_counter()
+    preprocess(sys.argv[1], sys.argv[2])
+    print(f"Wrote {sys.argv[2]} in {time.perf_counter() - started:.1f} s")
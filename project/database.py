@@ -1,11 +1,178 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 import os
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./communityconnect.db")
+# "production" tunes SQLite for concurrent readers and writers; "default" leaves it stock
+DB_PROFILE = os.getenv("DB_PROFILE", "production")
+# "async" serves endpoints through aiosqlite; "sync" through blocking sessions, for comparison
+DB_SESSION_MODE = os.getenv("DB_SESSION_MODE", "async")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT_S = float(os.getenv("DB_POOL_TIMEOUT_S", "10"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# Serializes schema creation and seeding when several workers start at once
+DB_INIT_LOCK_PATH = os.getenv("DB_INIT_LOCK_PATH", "")
+
+SQLITE_PRAGMAS = {
+    # Readers no longer block the writer, and commits append to the WAL
+    "journal_mode": "WAL",
+    # Durable at checkpoints instead of at every commit; safe with WAL
+    "synchronous": "NORMAL",
+    "busy_timeout": DB_BUSY_TIMEOUT_MS,
+    "mmap_size": 256 * 1024 * 1024,
+    # Negative values are KiB: 16 MiB of page cache per connection
+    "cache_size": -16 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+def make_engine(url=DATABASE_URL, profile=DB_PROFILE, create=create_engine, **engine_args):
+    """Create an engine, applying the storage profile to SQLite databases."""
+    if "sqlite" not in str(url):
+        return create(url, **engine_args)
+
+    if profile != "production":
+        return create(url, connect_args={"check_same_thread": False}, **engine_args)
+
+    in_memory = make_url(url).database in (None, "", ":memory:")
+    engine = create(
+        url,
+        connect_args={"check_same_thread": False, "timeout": DB_BUSY_TIMEOUT_MS / 1000},
+        **({} if in_memory else {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT_S,
+        }),
+        **engine_args
+    )
+
+    # An AsyncEngine takes its events through the engine it wraps
+    @event.listens_for(getattr(engine, "sync_engine", engine), "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            if in_memory and name in ("journal_mode", "mmap_size"):
+                continue
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+
+def make_async_engine(url=DATABASE_URL, profile=DB_PROFILE):
+    """Like make_engine, but an AsyncEngine; SQLite goes through aiosqlite.
+
+    An in-memory database is private to its connection, so it is not shared
+    with a sync engine on the same URL.
+    """
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        return create_async_engine(url)
+    in_memory = url.database in (None, "", ":memory:")
+    # aiosqlite would otherwise open a connection, and its thread, per checkout
+    return make_engine(url.set(drivername="sqlite+aiosqlite"), profile, create=create_async_engine,
+                       poolclass=StaticPool if in_memory else AsyncAdaptedQueuePool)
+
+
+class BlockingAsyncSession:
+    """The parts of AsyncSession the backend uses, over a plain Session.
+
+    Every query runs on the calling thread, so on the event loop it blocks
+    like the endpoints did before the async engine. ``DB_SESSION_MODE=sync``
+    serves the backend through it, so the two can be measured on one tree.
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+        self.bind = session.get_bind()
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def expunge(self, instance):
+        self.sync_session.expunge(instance)
+
+    async def execute(self, *args, **kwargs):
+        return self.sync_session.execute(*args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return self.sync_session.scalar(*args, **kwargs)
+
+    async def scalars(self, *args, **kwargs):
+        return self.sync_session.scalars(*args, **kwargs)
+
+    async def flush(self):
+        self.sync_session.flush()
+
+    async def commit(self):
+        self.sync_session.commit()
+
+    async def rollback(self):
+        self.sync_session.rollback()
+
+    async def close(self):
+        self.sync_session.close()
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return fn(self.sync_session, *args, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+def init_lock_path(url=DATABASE_URL):
+    """Lock file next to a SQLite database, or in the temp directory otherwise."""
+    if DB_INIT_LOCK_PATH:
+        return DB_INIT_LOCK_PATH
+    database = make_url(url).database
+    if make_url(url).get_backend_name() == "sqlite" and database and database != ":memory:":
+        return os.path.abspath(database) + ".init.lock"
+    return os.path.join(tempfile.gettempdir(), "communityconnect-init.lock")
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on ``path`` across processes until the block ends."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            # LK_LOCK gives up after ten one-second retries, so keep asking
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
 
 Base = declarative_base()
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
@@ -13,4 +180,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -0,0 +1,159 @@
+"""Batch matching of available drivers to pending rides.
+
+Every round takes the drivers who reported themselves available and the
+pending rides with known pickup coordinates. It assigns drivers to rides so
+that the total pickup distance is minimal. Pairs further apart than
+``DISPATCH_MAX_PICKUP_M`` are never matched. Up to ``DISPATCH_MAX_EXACT``
+drivers or rides are solved exactly with the Hungarian method
+(``scipy.optimize.linear_sum_assignment``). Larger rounds, or rounds where
+scipy is missing, use a greedy matcher. That matcher only looks at each
+driver's ``DISPATCH_CANDIDATES`` nearest rides, found with a k-d tree or in
+row chunks, so it never materialises the full distance matrix.
+
+This module only plans. Available drivers are kept in the database by
+shared_state.py, and backend.py writes the assignments.
+"""
+import os
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+    from scipy.spatial import cKDTree
+except ImportError:  # pragma: no cover - scipy is optional
+    linear_sum_assignment = None
+    cKDTree = None
+
+from geo import METERS_PER_DEG
+
+# --- CONFIG ---
+# Seconds between dispatch rounds; 0 disables the background loop
+DISPATCH_INTERVAL_S = float(os.getenv("DISPATCH_INTERVAL_S", "0"))
+DISPATCH_MAX_PICKUP_M = float(os.getenv("DISPATCH_MAX_PICKUP_M", "10000"))
+DISPATCH_MAX_EXACT = int(os.getenv("DISPATCH_MAX_EXACT", "2000"))
+DISPATCH_CANDIDATES = int(os.getenv("DISPATCH_CANDIDATES", "8"))
+DISPATCH_MAX_RIDES = int(os.getenv("DISPATCH_MAX_RIDES", "20000"))
+DRIVER_AVAILABILITY_TTL_S = float(os.getenv("DRIVER_AVAILABILITY_TTL_S", "120"))
+# --------------
+
+# Rows of the distance matrix computed at once when scipy is missing
+GREEDY_CHUNK = 1024
+
+
+class AvailableDriver(NamedTuple):
+    id: int
+    name: str
+    lon: float
+    lat: float
+
+
+class Assignment(NamedTuple):
+    driver_id: int
+    ride_id: int
+    pickup_m: float
+
+
+def project(lonlat: np.ndarray, ref_lat: float) -> np.ndarray:
+    """Equirectangular projection to planar metres around ``ref_lat``; fine at city scale."""
+    scale = np.array([np.cos(np.radians(ref_lat)), 1.0]) * METERS_PER_DEG
+    return np.asarray(lonlat, dtype=np.float64) * scale
+
+
+def distance_matrix(from_xy: np.ndarray, to_xy: np.ndarray) -> np.ndarray:
+    """Distances between every ``from`` point (rows) and ``to`` point (columns), as float32."""
+    dx = from_xy[:, None, 0] - to_xy[None, :, 0]
+    dy = from_xy[:, None, 1] - to_xy[None, :, 1]
+    return np.hypot(dx, dy).astype(np.float32)
+
+
+def nearest_candidates(from_xy: np.ndarray, to_xy: np.ndarray, k: int, max_cost: float):
+    """The ``k`` nearest ``to`` points of every ``from`` point within ``max_cost``.
+
+    Returns ``(columns, distances)``, both shaped ``(len(from_xy), k)``.
+    Missing neighbours have an infinite distance.
+    """
+    if cKDTree is not None:
+        dist, cols = cKDTree(to_xy).query(from_xy, k=k, distance_upper_bound=max_cost)
+        dist, cols = dist.reshape(len(from_xy), k), cols.reshape(len(from_xy), k)
+        return np.minimum(cols, len(to_xy) - 1), dist
+    cols, dist = [], []
+    for start in range(0, len(from_xy), GREEDY_CHUNK):
+        cost = distance_matrix(from_xy[start:start + GREEDY_CHUNK], to_xy)
+        nearest = np.argpartition(cost, k - 1, axis=1)[:, :k] if k < cost.shape[1] else np.tile(np.arange(k), (len(cost), 1))
+        near = np.take_along_axis(cost, nearest, axis=1).astype(np.float64)
+        near[near > max_cost] = np.inf
+        cols.append(nearest)
+        dist.append(near)
+    return np.concatenate(cols), np.concatenate(dist)
+
+
+def solve_exact(cost: np.ndarray, max_cost: float) -> List[Tuple[int, int]]:
+    """Minimum-total-cost matching, dropping pairs costlier than ``max_cost``."""
+    # Infeasible pairs get a cost no feasible matching can beat, then are dropped
+    penalty = max_cost * (min(cost.shape) + 1)
+    padded = np.where(cost <= max_cost, cost, penalty)
+    rows, cols = linear_sum_assignment(padded)
+    keep = cost[rows, cols] <= max_cost
+    return list(zip(rows[keep].tolist(), cols[keep].tolist()))
+
+
+def solve_greedy(from_xy: np.ndarray, to_xy: np.ndarray, max_cost: float,
+                 candidates: int = DISPATCH_CANDIDATES, rounds: int = 10) -> List[Tuple[int, int]]:
+    """Repeatedly match the globally shortest free pair among each row's nearest columns.
+
+    Rows left over because all their candidates were taken get fresh
+    candidates in the next round, up to ``rounds`` rounds.
+    """
+    pairs = []
+    free_rows = np.arange(len(from_xy))
+    free_cols = np.arange(len(to_xy))
+    for _ in range(rounds):
+        if not len(free_rows) or not len(free_cols):
+            break
+        k = min(candidates, len(free_cols))
+        near, dist = nearest_candidates(from_xy[free_rows], to_xy[free_cols], k, max_cost)
+        edge_rows = np.repeat(free_rows, k)
+        edge_cols = free_cols[near.ravel()]
+        edge_cost = dist.ravel()
+        feasible = np.isfinite(edge_cost)
+        order = np.argsort(edge_cost[feasible], kind="stable")
+        taken_rows, taken_cols = set(), set()
+        for r, c in zip(edge_rows[feasible][order].tolist(), edge_cols[feasible][order].tolist()):
+            if r not in taken_rows and c not in taken_cols:
+                taken_rows.add(r)
+                taken_cols.add(c)
+                pairs.append((r, c))
+        if not taken_rows:
+            break
+        free_rows = free_rows[~np.isin(free_rows, list(taken_rows))]
+        free_cols = free_cols[~np.isin(free_cols, list(taken_cols))]
+    return pairs
+
+
+def plan_assignments(drivers: List[AvailableDriver], rides: List[Tuple[int, float, float]],
+                     max_pickup_m: float = DISPATCH_MAX_PICKUP_M, max_exact: int = DISPATCH_MAX_EXACT):
+    """Match drivers to rides given as ``(ride_id, pickup_lon, pickup_lat)``.
+
+    Returns the assignments and the name of the solver used.
+    """
+    if not drivers or not rides:
+        return [], "none"
+    driver_lonlat = np.array([(d.lon, d.lat) for d in drivers], dtype=np.float64)
+    ride_lonlat = np.array([(lon, lat) for _, lon, lat in rides], dtype=np.float64)
+    ref_lat = float(np.concatenate([driver_lonlat[:, 1], ride_lonlat[:, 1]]).mean())
+    driver_xy, ride_xy = project(driver_lonlat, ref_lat), project(ride_lonlat, ref_lat)
+
+    if linear_sum_assignment is not None and max(len(drivers), len(rides)) <= max_exact:
+        pairs, solver = solve_exact(distance_matrix(driver_xy, ride_xy), max_pickup_m), "hungarian"
+    else:
+        pairs, solver = solve_greedy(driver_xy, ride_xy, max_pickup_m), "greedy"
+    if not pairs:
+        return [], solver
+
+    rows, cols = (np.array(a) for a in zip(*pairs))
+    pickup = np.hypot(*(driver_xy[rows] - ride_xy[cols]).T)
+    return [
+        Assignment(drivers[r].id, rides[c][0], round(float(m), 1))
+        for r, c, m in zip(rows.tolist(), cols.tolist(), pickup)
+    ], solver
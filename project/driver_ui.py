@@ -1,19 +1,25 @@
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
                             QPushButton, QTableWidget, QTableWidgetItem)
 from PyQt5.QtGui import QFont
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 import requests
+from pending_rides_view import PendingRidesView
 
 API = "http://127.0.0.1:5001"
 
 class DriverTab(QWidget):
+    # Emitted from the stream thread; Qt delivers it on the GUI thread
+    pending_changed = pyqtSignal()
+
     def __init__(self, token, user_data):
         super().__init__()
         self.token = token
         self.user_data = user_data
         
         self.init_ui()
-        self.load_pending_rides()
+        self.pending_changed.connect(self.show_pending_rides)
+        self.pending_view = PendingRidesView(API, token, on_change=self.pending_changed.emit)
+        self.pending_view.start()
     
     def init_ui(self):
         layout = QVBoxLayout()
@@ -81,14 +87,25 @@ class DriverTab(QWidget):
         
         self.setLayout(layout)
     
+    def closeEvent(self, event):
+        self.pending_view.stop()
+        super().closeEvent(event)
+    
     def load_pending_rides(self):
+        try:
+            self.pending_view.reload()
+        except Exception as ex:
+            self.status_label.setText(f"Failed to load rides: {str(ex)}")
+            self.status_label.setStyleSheet("color: red;")
+    
+    def show_pending_rides(self):
         self.rides_table.setRowCount(0)
         try:
-            headers = {"Authorization": f"Bearer {self.token}"}
-            resp = requests.get(f"{API}/rides/pending", headers=headers)
-            
-            if resp.ok:
-                rides = resp.json()
+            if self.pending_view.error:
+                self.status_label.setText(f"Connection error: {self.pending_view.error}")
+                self.status_label.setStyleSheet("color: red;")
+            else:
+                rides = self.pending_view.rides()
                 
                 if not rides:
                     self.status_label.setText("No pending rides available")
@@ -130,9 +147,6 @@ class DriverTab(QWidget):
                         cell_layout.setContentsMargins(0, 0, 0, 0)
                         
                         self.rides_table.setCellWidget(row, 4, cell_widget)
-            else:
-                self.status_label.setText(f"Failed to load rides: {resp.text}")
-                self.status_label.setStyleSheet("color: red;")
         except Exception as ex:
             self.status_label.setText(f"Connection error: {str(ex)}")
             self.status_label.setStyleSheet("color: red;")
@@ -145,7 +159,7 @@ class DriverTab(QWidget):
             if resp.ok:
                 self.status_label.setText(f"Ride {ride_id} accepted successfully!")
                 self.status_label.setStyleSheet("color: #4caf50;")
-                self.load_pending_rides()
+                # The ride-accepted event removes it from the table
             else:
                 self.status_label.setText(f"Failed to accept ride: {resp.text}")
                 self.status_label.setStyleSheet("color: red;")
@@ -0,0 +1,130 @@
+"""In-process broadcaster of ride events for the ``/rides/stream`` endpoint.
+
+Every event gets an id of the form ``<boot>-<seq>``. ``boot`` is random per
+process, so a client that resumes against a restarted (or different) worker
+is told to resync instead of silently missing events. The last
+``EVENT_HISTORY_SIZE`` events are kept for resuming. Each subscriber has a
+bounded queue. A subscriber that falls further behind than that is cut off
+and resumes from its last event id when it reconnects.
+"""
+import asyncio
+import json
+import os
+import uuid
+from collections import deque
+from typing import Deque, NamedTuple, Optional, Set
+
+# --- CONFIG ---
+EVENT_HISTORY_SIZE = int(os.getenv("EVENT_HISTORY_SIZE", "1000"))
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "256"))
+EVENT_KEEPALIVE_S = float(os.getenv("EVENT_KEEPALIVE_S", "15"))
+# --------------
+
+RIDE_CREATED = "ride-created"
+RIDE_ACCEPTED = "ride-accepted"
+RIDE_COMPLETED = "ride-completed"
+# Sent instead of a replay when the client must reload /rides/pending
+RESYNC = "resync"
+
+
+class RideEvent(NamedTuple):
+    id: str
+    type: str
+    data: dict
+
+
+class Subscription:
+    def __init__(self, queue_size: int):
+        self.queue: "asyncio.Queue[RideEvent]" = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def offer(self, event: RideEvent):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class RideEventBroadcaster:
+    def __init__(self, history_size: int = EVENT_HISTORY_SIZE, queue_size: int = EVENT_QUEUE_SIZE):
+        self.boot = uuid.uuid4().hex[:8]
+        self.queue_size = queue_size
+        self._seq = 0
+        self._history: Deque[RideEvent] = deque(maxlen=history_size)
+        self._subscribers: Set[Subscription] = set()
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    def publish(self, event_type: str, data: dict) -> RideEvent:
+        """Record an event and hand it to every subscriber. Call from the event loop."""
+        self._seq += 1
+        event = RideEvent(f"{self.boot}-{self._seq}", event_type, data)
+        self._history.append(event)
+        self.published += 1
+        for sub in self._subscribers:
+            was_overflowed = sub.overflowed
+            sub.offer(event)
+            if sub.overflowed and not was_overflowed:
+                self.dropped_subscribers += 1
+        return event
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Subscription:
+        """Start a subscription, replaying what the client missed since ``last_event_id``.
+
+        With no id, an id from another process, or one that has aged out of
+        the history, the subscription starts with a ``resync`` event.
+        """
+        sub = Subscription(self.queue_size)
+        missed = self._replay_after(last_event_id)
+        if missed is None or len(missed) >= self.queue_size:
+            sub.offer(RideEvent(self._last_id(), RESYNC, {}))
+        else:
+            for event in missed:
+                sub.offer(event)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self._subscribers.discard(sub)
+
+    def _last_id(self) -> str:
+        return f"{self.boot}-{self._seq}"
+
+    def _replay_after(self, last_event_id: Optional[str]):
+        if not last_event_id:
+            return None
+        boot, _, seq = last_event_id.partition("-")
+        if boot != self.boot or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq == self._seq:
+            return []
+        oldest = self._seq - len(self._history) + 1
+        if seq < oldest - 1 or seq > self._seq:
+            return None
+        return list(self._history)[seq - oldest + 1:]
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "history": len(self._history),
+            "dropped_subscribers": self.dropped_subscribers,
+        }
+
+
+_broadcaster: Optional[RideEventBroadcaster] = None
+
+
+def get_broadcaster() -> RideEventBroadcaster:
+    global _broadcaster
+    if _broadcaster is None:
+        _broadcaster = RideEventBroadcaster()
+    return _broadcaster
+
+
+def format_sse(event: RideEvent) -> str:
+    """Render an event in the text/event-stream wire format."""
+    return f"id: {event.id}\nevent: {event.type}\ndata: {json.dumps(event.data)}\n\n"
@@ -1,5 +1,6 @@
 import flet as ft
 import requests
+import conditional_get
 import json
 from datetime import datetime, timedelta
 import matplotlib.pyplot as plt
@@ -9,6 +10,7 @@ import base64
 import math
 from PIL import Image, ImageDraw
 import time
+from pending_rides_view import PendingRidesView
 
 class CommunityConnectApp:
     def __init__(self, page: ft.Page):
@@ -21,6 +23,7 @@ class CommunityConnectApp:
         self.selected_pickup = None  # (x, y) coordinates on map
         self.selected_dropoff = None  # (x, y) coordinates on map
         self.active_ride = None  # For driver's current ride
+        self.pending_view = None  # Pending rides kept current from /rides/stream
         
         # Setup page
         self.page.title = "CommunityConnect - Ride Sharing"
@@ -207,8 +210,9 @@ class CommunityConnectApp:
         self.page.add(main_container)
         self.page.update()
         
-        # Load initial data
-        self.load_pending_rides()
+        # Load initial data; the stream loads pending rides, then keeps them current
+        self.pending_view = PendingRidesView(self.backend_url, self.token, on_change=self.render_pending_rides)
+        self.pending_view.start()
         if self.current_user.get('is_admin', False):
             self.load_admin_data()
     
@@ -405,9 +409,12 @@ class CommunityConnectApp:
             
             response = requests.post(f"{self.backend_url}/rides/request", json=data, headers=headers)
             
-            if response.status_code == 200:
+            if response.ok:
                 result = response.json()
-                self.ride_status.value = f"Ride requested successfully! Distance: {result.get('distance_m', 0):.0f}m"
+                if result.get('status') == 'routing' or result.get('distance_m') is None:
+                    self.ride_status.value = "Ride requested successfully! Distance will follow shortly."
+                else:
+                    self.ride_status.value = f"Ride requested successfully! Distance: {result['distance_m']:.0f}m"
                 self.ride_status.color = "green"
                 self.clear_route(None)
             else:
@@ -446,48 +453,52 @@ class CommunityConnectApp:
         )
     
     def load_pending_rides(self, e=None):
-        """Load pending rides for driver"""
+        """Reload pending rides for driver"""
         try:
-            headers = {'Authorization': f'Bearer {self.token}'}
-            response = requests.get(f"{self.backend_url}/rides/pending", headers=headers)
+            self.pending_view.reload()
+        except Exception as ex:
+            print(f"Error loading pending rides: {ex}")
+    
+    def render_pending_rides(self):
+        """Show the pending rides held by the stream view"""
+        try:
+            rides = self.pending_view.rides()
+            self.pending_rides_column.controls.clear()
             
-            if response.status_code == 200:
-                rides = response.json()
-                self.pending_rides_column.controls.clear()
-                
-                if not rides:
-                    self.pending_rides_column.controls.append(
-                        ft.Text("No pending rides available", size=16, color="grey")
+            if not rides:
+                self.pending_rides_column.controls.append(
+                    ft.Text("No pending rides available", size=16, color="grey")
+                )
+            else:
+                for ride in rides:
+                    ride_card = ft.Container(
+                        content=ft.Column([
+                            ft.Text(f"Ride #{ride['id']} - {ride['rider_name']}", weight=ft.FontWeight.BOLD),
+                            ft.Text(f"Pickup: {ride['pickup_location']}"),
+                            ft.Text(f"Dropoff: {ride['dropoff_location']}"),
+                            ft.Text(f"Distance: {ride['distance_m']:.0f}m" if ride.get('distance_m') is not None else "Distance: N/A"),
+                            ft.ElevatedButton(
+                                "Accept Ride",
+                                on_click=lambda e, ride_id=ride['id']: self.accept_ride(ride_id),
+                                bgcolor="green",
+                                color="white"
+                            )
+                        ], spacing=5),
+                        bgcolor="white",
+                        padding=15,
+                        border_radius=8,
+                        border=ft.border.all(1, "grey")
                     )
-                else:
-                    for ride in rides:
-                        ride_card = ft.Container(
-                            content=ft.Column([
-                                ft.Text(f"Ride #{ride['id']} - {ride['rider_name']}", weight=ft.FontWeight.BOLD),
-                                ft.Text(f"Pickup: {ride['pickup_location']}"),
-                                ft.Text(f"Dropoff: {ride['dropoff_location']}"),
-                                ft.Text(f"Distance: {ride.get('distance_m', 'N/A')}m"),
-                                ft.ElevatedButton(
-                                    "Accept Ride",
-                                    on_click=lambda e, ride_id=ride['id']: self.accept_ride(ride_id),
-                                    bgcolor="green",
-                                    color="white"
-                                )
-                            ], spacing=5),
-                            bgcolor="white",
-                            padding=15,
-                            border_radius=8,
-                            border=ft.border.all(1, "grey")
-                        )
-                        self.pending_rides_column.controls.append(ride_card)
-                
-                # Show pending rides and hide active ride
+                    self.pending_rides_column.controls.append(ride_card)
+            
+            # Show pending rides and hide active ride, unless a ride is in progress
+            if not self.active_ride:
                 self.active_ride_container.visible = False
                 self.pending_rides_column.visible = True
-                self.page.update()
-                
+            self.page.update()
+            
         except Exception as ex:
-            print(f"Error loading pending rides: {ex}")
+            print(f"Error showing pending rides: {ex}")
     
     def accept_ride(self, ride_id):
         """Accept a ride and show the route"""
@@ -521,7 +532,7 @@ class CommunityConnectApp:
             dropoff_coords = (float(dropoff_parts[0]), float(dropoff_parts[1]))
             
             # Generate route map
-            distance_km = ride.get('distance_m', 0) / 1000
+            distance_km = ride['distance_m'] / 1000 if ride.get('distance_m') is not None else None
             map_image = self.generate_route_map(pickup_coords, dropoff_coords, distance_km)
             
             # Create UI
@@ -590,7 +601,7 @@ class CommunityConnectApp:
             draw.text((dropoff_x + 10, dropoff_y - 15), "Dropoff", fill='red')
             
             # Add distance info
-            draw.text((10, 10), f"Distance: {distance_km:.1f} km", fill='black')
+            draw.text((10, 10), f"Distance: {distance_km:.1f} km" if distance_km is not None else "Distance: N/A", fill='black')
             draw.text((10, 30), f"Route Overview", fill='black')
             
             # Convert to base64 for display
@@ -622,7 +633,7 @@ class CommunityConnectApp:
                 self.active_ride = None
                 self.active_ride_container.visible = False
                 self.pending_rides_column.visible = True
-                self.load_pending_rides()
+                self.render_pending_rides()
                 
                 # Show confirmation
                 self.show_status("Ride completed successfully!")
@@ -708,12 +719,10 @@ class CommunityConnectApp:
             headers = {'Authorization': f'Bearer {self.token}'}
             
             # Get recent rides for analytics
-            recent_response = requests.get(f"{self.backend_url}/analytics/recent_rides", headers=headers)
-            pending_response = requests.get(f"{self.backend_url}/rides/pending", headers=headers)
+            recent_response = conditional_get.get(f"{self.backend_url}/analytics/recent_rides", headers=headers)
             
             if recent_response.status_code == 200:
                 recent_rides = recent_response.json()
-                pending_rides = pending_response.json() if pending_response.status_code == 200 else []
                 
                 # Calculate statistics
                 total_rides = len(recent_rides)
@@ -819,6 +828,9 @@ class CommunityConnectApp:
     
     def logout(self, e):
         """Handle logout"""
+        if self.pending_view:
+            self.pending_view.stop()
+            self.pending_view = None
         self.token = None
         self.current_user = None
         self.init_auth_ui()
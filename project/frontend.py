@@ -1,5 +1,6 @@
 import flet as ft
 import requests
+import conditional_get
 import matplotlib.pyplot as plt
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
@@ -8,6 +9,7 @@ import base64
 from datetime import datetime
 import time
 import json
+from pending_rides_view import PendingRidesView
 
 API = "http://127.0.0.1:5000"
 
@@ -57,6 +59,7 @@ def main(page: ft.Page):
     
     token = None
     current_user = {"name": "", "email": "", "is_admin": False}
+    pending_view = None  # Pending rides kept current from /rides/stream
     
     # Login UI
     login_email = ft.TextField(
@@ -212,7 +215,10 @@ def main(page: ft.Page):
         page.update()
     
     def logout(e):
-        nonlocal token, current_user
+        nonlocal token, current_user, pending_view
+        if pending_view:
+            pending_view.stop()
+            pending_view = None
         token = None
         current_user = {"name": "", "email": "", "is_admin": False}
         show_login()
@@ -349,7 +355,10 @@ def main(page: ft.Page):
                 }, headers=headers)
                 if res.ok:
                     d = res.json()
-                    stat_r.value = f"✅ Ride requested! Distance: {d['distance_m']:.0f}m, Duration: {d['duration_s']:.0f}s"
+                    if d["status"] == "routing":
+                        stat_r.value = "✅ Ride requested! Distance and duration will follow shortly."
+                    else:
+                        stat_r.value = f"✅ Ride requested! Distance: {d['distance_m']:.0f}m, Duration: {d['duration_s']:.0f}s"
                     stat_r.color = ft.Colors.GREEN_400
                     # Clear fields and update map to default after successful booking
                     pickup.value = ""
@@ -435,6 +444,7 @@ def main(page: ft.Page):
         )
     
     def create_driver_tab():
+        nonlocal pending_view
         driver_table_rows = []
         driver_table = ft.DataTable(
             columns=[
@@ -450,13 +460,22 @@ def main(page: ft.Page):
         status_text = ft.Text("Loading pending rides...", color=ft.Colors.BLUE_400)
         
         def load_pending():
+            try:
+                pending_view.reload()
+            except Exception as ex:
+                status_text.value = f"Failed to load rides: {str(ex)}"
+                status_text.color = ft.Colors.RED_400
+                page.update()
+        
+        def show_pending():
             driver_table_rows.clear()
             driver_table.rows.clear()
             try:
-                headers = {"Authorization": f"Bearer {token}"} if token else {}
-                resp = requests.get(f"{API}/rides/pending", headers=headers)
-                if resp.ok:
-                    rides = resp.json()
+                if pending_view.error:
+                    status_text.value = f"Connection error: {pending_view.error}"
+                    status_text.color = ft.Colors.RED_400
+                else:
+                    rides = pending_view.rides()
                     driver_table_rows.extend(rides)
                     
                     if not rides:
@@ -487,9 +506,6 @@ def main(page: ft.Page):
                                     ]
                                 )
                             )
-                else:
-                    status_text.value = f"Failed to load rides: {resp.text}"
-                    status_text.color = ft.Colors.RED_400
             except Exception as ex:
                 status_text.value = f"Connection error: {str(ex)}"
                 status_text.color = ft.Colors.RED_400
@@ -502,7 +518,7 @@ def main(page: ft.Page):
                 if resp.ok:
                     status_text.value = f"✅ Ride {ride_id} accepted successfully!"
                     status_text.color = ft.Colors.GREEN_400
-                    load_pending()  # Refresh the list
+                    # The ride-accepted event removes it from the list
                 else:
                     status_text.value = f"❌ Failed to accept ride: {resp.text}"
                     status_text.color = ft.Colors.RED_400
@@ -511,8 +527,11 @@ def main(page: ft.Page):
                 status_text.color = ft.Colors.RED_400
             page.update()
         
-        # Load pending rides initially
-        load_pending()
+        # Load pending rides, then keep them current from the event stream
+        if pending_view:
+            pending_view.stop()
+        pending_view = PendingRidesView(API, token, on_change=show_pending)
+        pending_view.start()
         
         driver_controls = ft.Container(
             content=ft.Column([
@@ -563,7 +582,7 @@ def main(page: ft.Page):
         def show_stats(e):
             try:
                 headers = {"Authorization": f"Bearer {token}"} if token else {}
-                data = requests.get(f"{API}/analytics/ride_counts", headers=headers).json()
+                data = conditional_get.get(f"{API}/analytics/ride_counts", headers=headers).json()
                 days = [d["day"] for d in data]
                 cnts = [d["count"] for d in data]
                 
@@ -582,7 +601,7 @@ def main(page: ft.Page):
         def show_user_stats(e):
             try:
                 headers = {"Authorization": f"Bearer {token}"} if token else {}
-                data = requests.get(f"{API}/analytics/user_rides", headers=headers).json()
+                data = conditional_get.get(f"{API}/analytics/user_rides", headers=headers).json()
                 users = [d["rider_name"] for d in data]
                 cnts = [d["count"] for d in data]
                 
@@ -601,7 +620,7 @@ def main(page: ft.Page):
         def load_recent_rides():
             try:
                 headers = {"Authorization": f"Bearer {token}"} if token else {}
-                resp = requests.get(f"{API}/analytics/recent_rides", headers=headers)
+                resp = conditional_get.get(f"{API}/analytics/recent_rides", headers=headers)
                 if resp.ok:
                     return resp.json()
                 return []
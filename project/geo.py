@@ -0,0 +1,52 @@
+"""Latitude bands over ride pickups, for finding pending rides near a point.
+
+Pickups are grouped into bands ``GEO_BAND_DEG`` degrees of latitude tall and
+indexed on ``(status, pickup_band, pickup_lon, pickup_lat)``. A circle around
+a point becomes a short IN list of bands with a longitude range in each, so
+every band is one index seek covering the circle's bounding box. Distances
+use the equirectangular approximation. That is exact enough for radii of a
+few tens of kilometres, but it does not wrap across the antimeridian.
+"""
+import math
+import os
+from typing import Optional, Tuple
+
+# --- CONFIG ---
+GEO_BAND_DEG = float(os.getenv("GEO_BAND_DEG", "0.01"))
+# --------------
+
+METERS_PER_DEG = 111320.0
+
+
+def parse_coordinates(point: Optional[str]) -> Optional[Tuple[float, float]]:
+    """Parse ``"lon,lat"``, or return None if it is not a valid coordinate pair."""
+    try:
+        lon, lat = (float(v) for v in point.split(","))
+    except (AttributeError, ValueError):
+        return None
+    if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+        return None
+    return lon, lat
+
+
+def band_of(lat: float, band_deg: float = GEO_BAND_DEG) -> int:
+    return int(math.floor((lat + 90) / band_deg))
+
+
+def lon_scale(lat: float) -> float:
+    """Length of a degree of longitude at ``lat``, relative to a degree of latitude."""
+    return max(math.cos(math.radians(lat)), 1e-6)
+
+
+def bounding_box(lon: float, lat: float, radius_m: float, band_deg: float = GEO_BAND_DEG):
+    """The bands and longitude range covering the circle around a point."""
+    dlat = radius_m / METERS_PER_DEG
+    dlon = dlat / lon_scale(lat)
+    bands = list(range(band_of(max(lat - dlat, -90), band_deg), band_of(min(lat + dlat, 90), band_deg) + 1))
+    return bands, (lon - dlon, lon + dlon), (lat - dlat, lat + dlat)
+
+
+def distance_m(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    dx = (lon2 - lon1) * lon_scale((lat1 + lat2) / 2)
+    dy = lat2 - lat1
+    return math.hypot(dx, dy) * METERS_PER_DEG
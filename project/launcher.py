@@ -0,0 +1,170 @@
+"""Run the backend as several uvicorn worker processes on one socket.
+
+The supervisor binds the listening socket once and hands it to every worker,
+so the kernel spreads new connections across them. A worker that dies is
+started again, after a growing delay if it keeps dying soon after starting.
+SIGTERM or SIGINT drains the workers: each stops accepting, finishes the
+requests it is serving for up to ``DRAIN_TIMEOUT_S``, and exits, and any
+worker still running after that is killed. SIGHUP restarts the workers one
+at a time, so the others keep serving meanwhile.
+
+Each worker imports ``backend`` itself. Schema creation and seeding run under
+a file lock there, so workers starting together do them one after another.
+
+    python launcher.py --workers 4 --port 5000
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+import uvicorn
+
+# --- CONFIG ---
+BACKEND_WORKERS = int(os.getenv("BACKEND_WORKERS", "1"))
+DRAIN_TIMEOUT_S = float(os.getenv("DRAIN_TIMEOUT_S", "30"))
+# A worker that dies sooner than this after starting counts as a crash loop
+RESTART_WINDOW_S = float(os.getenv("RESTART_WINDOW_S", "10"))
+RESTART_BACKOFF_MAX_S = float(os.getenv("RESTART_BACKOFF_MAX_S", "30"))
+# --------------
+
+APP = "backend:app"
+CHECK_INTERVAL_S = 0.5
+
+logger = logging.getLogger("uvicorn.error")
+
+# Workers are spawned, not forked, so none inherits the supervisor's state
+spawn = multiprocessing.get_context("spawn")
+
+
+def run_worker(config_kwargs, sock):
+    config = uvicorn.Config(APP, **config_kwargs)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Worker:
+    def __init__(self, slot: int, process, failures: int = 0):
+        self.slot = slot
+        self.process = process
+        self.started_at = time.monotonic()
+        # Deaths in a row soon after starting, which sets the restart delay
+        self.failures = failures
+
+
+class Supervisor:
+    def __init__(self, workers: int, config_kwargs: dict, drain_timeout_s: float = DRAIN_TIMEOUT_S):
+        self.workers = workers
+        self.config_kwargs = {**config_kwargs, "timeout_graceful_shutdown": drain_timeout_s}
+        self.drain_timeout_s = drain_timeout_s
+        self.sock = None
+        self.running = {}
+        # slot -> (monotonic time to start it, consecutive quick deaths)
+        self.waiting = {}
+        self.should_exit = threading.Event()
+        self.should_restart = False
+
+    def start_worker(self, slot: int, failures: int = 0):
+        process = spawn.Process(target=run_worker, args=(self.config_kwargs, self.sock), name=f"worker-{slot}")
+        process.start()
+        self.running[slot] = Worker(slot, process, failures)
+        logger.info("Started worker %d [%d]", slot, process.pid)
+
+    def stop_worker(self, worker: Worker):
+        """Ask a worker to drain; uvicorn treats SIGTERM as a graceful shutdown."""
+        if worker.process.is_alive():
+            worker.process.terminate()
+
+    def reap(self):
+        now = time.monotonic()
+        for slot, worker in list(self.running.items()):
+            if worker.process.is_alive():
+                continue
+            del self.running[slot]
+            failures = worker.failures + 1 if now - worker.started_at < RESTART_WINDOW_S else 0
+            delay = min(RESTART_BACKOFF_MAX_S, 0.5 * 2 ** (failures - 1)) if failures else 0
+            logger.warning("Worker %d [%d] exited with code %s; restarting in %.1fs",
+                           slot, worker.process.pid, worker.process.exitcode, delay)
+            self.waiting[slot] = (now + delay, failures)
+        for slot, (start_at, failures) in list(self.waiting.items()):
+            if start_at <= now:
+                del self.waiting[slot]
+                self.start_worker(slot, failures)
+
+    def rolling_restart(self):
+        logger.info("Restarting workers one at a time")
+        for slot in sorted(self.running):
+            if self.should_exit.is_set():
+                return
+            worker = self.running.pop(slot)
+            self.stop_worker(worker)
+            worker.process.join(self.drain_timeout_s + 5)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+            self.start_worker(slot)
+
+    def drain(self):
+        logger.info("Draining %d workers", len(self.running))
+        for worker in self.running.values():
+            self.stop_worker(worker)
+        # uvicorn cancels what is left after its own timeout; this covers a stuck worker
+        deadline = time.monotonic() + self.drain_timeout_s + 5
+        for worker in self.running.values():
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                logger.warning("Worker %d [%d] did not drain in time; killing it", worker.slot, worker.process.pid)
+                worker.process.kill()
+                worker.process.join()
+        self.running.clear()
+
+    def handle_exit(self, signum, frame):
+        self.should_exit.set()
+
+    def handle_restart(self, signum, frame):
+        self.should_restart = True
+
+    def run(self):
+        config = uvicorn.Config(APP, **self.config_kwargs)
+        self.sock = config.bind_socket()
+        signal.signal(signal.SIGINT, self.handle_exit)
+        signal.signal(signal.SIGTERM, self.handle_exit)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self.handle_restart)
+
+        logger.info("Supervisor [%d] starting %d workers", os.getpid(), self.workers)
+        try:
+            for slot in range(self.workers):
+                self.start_worker(slot)
+            while not self.should_exit.wait(CHECK_INTERVAL_S):
+                if self.should_restart:
+                    self.should_restart = False
+                    self.rolling_restart()
+                self.reap()
+        finally:
+            self.drain()
+            self.sock.close()
+        logger.info("Supervisor [%d] stopped", os.getpid())
+
+
+def serve(workers: int = BACKEND_WORKERS, host: str = "0.0.0.0", port: int = 5000,
+          log_level: str = "info", drain_timeout_s: float = DRAIN_TIMEOUT_S):
+    config_kwargs = {"host": host, "port": port, "log_level": log_level}
+    Supervisor(max(1, workers), config_kwargs, drain_timeout_s).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=BACKEND_WORKERS)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--drain-timeout", type=float, default=DRAIN_TIMEOUT_S)
+    args = parser.parse_args()
+    serve(args.workers, args.host, args.port, args.log_level, args.drain_timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""In-process routing over a road graph loaded from a file.
+
+The graph file is JSON::
+
+    {
+      "nodes": [[lon, lat], ...],
+      "edges": [[from, to, distance_m, duration_s, oneway], ...]
+    }
+
+Nodes are referenced by their position in ``nodes``.  ``oneway`` is optional
+and defaults to false, in which case the edge is usable in both directions.
+Routes minimise travel time; the reported distance is the length of that
+fastest route.
+"""
+import asyncio
+import heapq
+import json
+import math
+from collections import defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+from routing import Router, RouteNotFound, parse_point
+
+# Snapped points further than this from any graph node are rejected
+MAX_SNAP_DISTANCE_M = 2000.0
+# Size of a cell of the nearest-node grid, in degrees
+SNAP_CELL_DEG = 0.01
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def haversine_m(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class NodeLocator:
+    """Grid index answering nearest-node queries for coordinate snapping."""
+
+    def __init__(self, lons: Sequence[float], lats: Sequence[float], cell_deg: float = SNAP_CELL_DEG):
+        self.lons = lons
+        self.lats = lats
+        self.cell_deg = cell_deg
+        self._cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        for node, (lon, lat) in enumerate(zip(lons, lats)):
+            self._cells[self._cell(lon, lat)].append(node)
+
+    def _cell(self, lon, lat):
+        return int(math.floor(lon / self.cell_deg)), int(math.floor(lat / self.cell_deg))
+
+    def nearest(self, lon: float, lat: float, max_distance_m: float = MAX_SNAP_DISTANCE_M) -> int:
+        cx, cy = self._cell(lon, lat)
+        # Cells are narrowest east-west, by cos(latitude) of ~111 km per degree
+        cell_m = self.cell_deg * 111000.0 * max(math.cos(math.radians(lat)), 0.01)
+        max_ring = int(max_distance_m / cell_m) + 1
+        best, best_d = -1, float("inf")
+        for ring in range(max_ring + 1):
+            for x in range(cx - ring, cx + ring + 1):
+                for y in range(cy - ring, cy + ring + 1):
+                    if max(abs(x - cx), abs(y - cy)) != ring:
+                        continue
+                    for node in self._cells.get((x, y), ()):
+                        d = haversine_m(lon, lat, self.lons[node], self.lats[node])
+                        if d < best_d:
+                            best, best_d = node, d
+            # Anything in the next ring is at least ``ring`` cells away
+            if best >= 0 and best_d <= ring * cell_m:
+                break
+        if best < 0 or best_d > max_distance_m:
+            raise RouteNotFound(f"no road within {max_distance_m:.0f} m of {lon},{lat}")
+        return best
+
+
+class RoadGraph:
+    """Directed road graph with forward and backward adjacency lists.
+
+    Each adjacency entry is ``(neighbour, duration_s, distance_m)``.
+    """
+
+    def __init__(self, lons: List[float], lats: List[float]):
+        self.lons = lons
+        self.lats = lats
+        self.forward: List[List[Tuple[int, float, float]]] = [[] for _ in lons]
+        self.backward: List[List[Tuple[int, float, float]]] = [[] for _ in lons]
+
+    def __len__(self):
+        return len(self.lons)
+
+    def add_edge(self, u: int, v: int, distance_m: float, duration_s: float, oneway: bool = False):
+        self.forward[u].append((v, duration_s, distance_m))
+        self.backward[v].append((u, duration_s, distance_m))
+        if not oneway:
+            self.forward[v].append((u, duration_s, distance_m))
+            self.backward[u].append((v, duration_s, distance_m))
+
+    def edge_count(self) -> int:
+        return sum(len(adj) for adj in self.forward)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RoadGraph":
+        graph = cls([float(n[0]) for n in data["nodes"]], [float(n[1]) for n in data["nodes"]])
+        for edge in data["edges"]:
+            u, v, distance_m, duration_s = edge[:4]
+            oneway = bool(edge[4]) if len(edge) > 4 else False
+            graph.add_edge(int(u), int(v), float(distance_m), float(duration_s), oneway)
+        return graph
+
+    @classmethod
+    def load(cls, path: str) -> "RoadGraph":
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def bidirectional_dijkstra(graph: RoadGraph, source: int, target: int) -> Tuple[float, float]:
+    """Return ``(distance_m, duration_s)`` of the fastest route from source to target.
+
+    Searches forward from the source and backward from the target at the same
+    time and stops once the two frontiers together cannot improve on the best
+    meeting point, which settles far fewer nodes than a one-sided search.
+    """
+    if source == target:
+        return 0.0, 0.0
+
+    time_f, time_b = {source: 0.0}, {target: 0.0}
+    dist_f, dist_b = {source: 0.0}, {target: 0.0}
+    settled_f, settled_b = set(), set()
+    heap_f, heap_b = [(0.0, source)], [(0.0, target)]
+    best_time, best_dist = float("inf"), float("inf")
+
+    while heap_f or heap_b:
+        # An exhausted side is final, so it adds nothing to the lower bound
+        bound = (heap_f[0][0] if heap_f else 0.0) + (heap_b[0][0] if heap_b else 0.0)
+        if bound >= best_time:
+            break
+        # Expand the smaller frontier
+        if heap_f and (not heap_b or len(heap_f) <= len(heap_b)):
+            heap, times, dists, settled = heap_f, time_f, dist_f, settled_f
+            other_times, other_dists, adjacency = time_b, dist_b, graph.forward
+        else:
+            heap, times, dists, settled = heap_b, time_b, dist_b, settled_b
+            other_times, other_dists, adjacency = time_f, dist_f, graph.backward
+
+        t, node = heapq.heappop(heap)
+        if node in settled:
+            continue
+        settled.add(node)
+        for neighbour, duration, length in adjacency[node]:
+            nt = t + duration
+            if nt < times.get(neighbour, float("inf")):
+                times[neighbour] = nt
+                dists[neighbour] = dists[node] + length
+                heapq.heappush(heap, (nt, neighbour))
+            if neighbour in other_times:
+                total = times[neighbour] + other_times[neighbour]
+                if total < best_time:
+                    best_time = total
+                    best_dist = dists[neighbour] + other_dists[neighbour]
+
+    if best_time == float("inf"):
+        raise RouteNotFound("no route between the given points")
+    return best_dist, best_time
+
+
+class LocalRouter(Router):
+    """Router answering from an in-memory road graph, with no network access."""
+
+    def __init__(self, graph: RoadGraph):
+        self.graph = graph
+        self.locator = NodeLocator(graph.lons, graph.lats)
+
+    @classmethod
+    def from_file(cls, path: str) -> "LocalRouter":
+        return cls(RoadGraph.load(path))
+
+    def route_sync(self, pickup: str, dropoff: str) -> Tuple[float, float]:
+        source = self.locator.nearest(*parse_point(pickup))
+        target = self.locator.nearest(*parse_point(dropoff))
+        return bidirectional_dijkstra(self.graph, source, target)
+
+    async def route(self, pickup: str, dropoff: str) -> Tuple[float, float]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.route_sync, pickup, dropoff)
@@ -0,0 +1,244 @@
+"""Request, database, routing and bcrypt timings in Prometheus text format.
+
+Every thread records into its own shard of each metric, so recording never
+takes a lock and never loses an update. Event loop requests, the bcrypt pool
+and dispatch rounds all run on different threads. A lock is taken only when
+a thread records its first value. ``/metrics`` adds the shards up when
+scraped.
+
+Requests are labelled with their route template, such as
+``/rides/{ride_id}``, rather than the raw path, so the number of series
+stays bounded. Requests that match no route share the ``unmatched`` label.
+"""
+import bisect
+import contextvars
+import functools
+import os
+import threading
+import time
+from typing import List, Optional, Sequence
+
+from sqlalchemy import event
+
+# --- CONFIG ---
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# --------------
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_metrics: List["Metric"] = []
+
+# [queries, seconds] of the request being served; None outside a request
+_request_db: contextvars.ContextVar = contextvars.ContextVar("request_db", default=None)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._shards = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _merged(self) -> dict:
+        """Sum of every thread's series, by label values."""
+        with self._lock:
+            shards = list(self._shards)
+        merged = {}
+        for shard in shards:
+            # list() copies in one step, so a thread adding a series cannot break the loop
+            for labels, series in list(shard.items()):
+                total = merged.get(labels)
+                if total is None:
+                    merged[labels] = list(series)
+                else:
+                    merged[labels] = [a + b for a, b in zip(total, series)]
+        return merged
+
+    def _labels(self, values, extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, series in sorted(self._merged().items()):
+            lines.extend(self._render_series(labels, series))
+        return lines
+
+    def _render_series(self, labels, series) -> List[str]:
+        return [f"{self.name}{self._labels(labels)} {_number(series[0])}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        shard = self._shard()
+        series = shard.get(labels)
+        if series is None:
+            series = shard[labels] = [0]
+        series[0] += amount
+
+
+class Gauge(Metric):
+    """A value set from the event loop thread only, so it needs no shards."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self.value = 0
+
+    def _merged(self) -> dict:
+        return {(): [self.value]}
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str):
+        shard = self._shard()
+        series = shard.get(labels)
+        if series is None:
+            # One count per bucket plus +Inf, then the sum
+            series = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def _render_series(self, labels, series) -> List[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), series):
+            cumulative += count
+            le = 'le="%s"' % _number(bound)
+            lines.append(f"{self.name}_bucket{self._labels(labels, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{self._labels(labels)} {_number(series[-1])}")
+        lines.append(f"{self.name}_count{self._labels(labels)} {cumulative}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# Its _count series doubles as the request counter
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Time to serve a request, by route and status.",
+                            ("method", "route", "status"))
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being served right now.")
+DB_QUERIES_PER_REQUEST = Histogram("db_queries_per_request", "SQL statements run while serving a request.",
+                                   ("method", "route"), COUNT_BUCKETS)
+DB_TIME_PER_REQUEST = Histogram("db_time_per_request_seconds", "Time spent in SQL while serving a request.", ("method", "route"))
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "Time of one SQL statement.")
+ROUTING_LATENCY = Histogram("routing_upstream_duration_seconds", "Route lookups that reached the router, by outcome.", ("outcome",))
+BCRYPT_LATENCY = Histogram("bcrypt_duration_seconds", "Time of one bcrypt hash or check.", ("operation",))
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware, which is cheaper per request than BaseHTTPMiddleware."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        db = [0, 0.0]
+        token = _request_db.set(db)
+        REQUESTS_IN_FLIGHT.value += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.value -= 1
+            _request_db.reset(token)
+            # The router stores the matched route in the shared scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            REQUEST_LATENCY.observe(elapsed, method, route, str(status_code))
+            DB_QUERIES_PER_REQUEST.observe(db[0], method, route)
+            DB_TIME_PER_REQUEST.observe(db[1], method, route)
+
+
+def instrument_engine(engine):
+    """Time every statement ``engine`` runs and charge it to the current request."""
+    if not METRICS_ENABLED:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        if METRICS_ENABLED:
+            context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        # Checked on every call so benchmarks can switch metrics off at runtime
+        if not METRICS_ENABLED or not hasattr(context, "_metrics_start"):
+            return
+        elapsed = time.perf_counter() - context._metrics_start
+        DB_QUERY_LATENCY.observe(elapsed)
+        db = _request_db.get()
+        if db is not None:
+            db[0] += 1
+            db[1] += elapsed
+
+
+def timed(histogram: Histogram, *labels: str):
+    """Decorator that observes the run time of a plain function."""
+    def wrap(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def timed_fn(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, *labels)
+        return timed_fn
+    return wrap
+
+
+def render(metrics: Optional[List[Metric]] = None) -> str:
+    lines = []
+    for metric in _metrics if metrics is None else metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
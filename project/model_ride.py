@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Index, text
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -17,5 +17,19 @@ class Ride(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     driver_id = Column(Integer, nullable=True)
     driver_name = Column(String, nullable=True)
+    version = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    pickup_lon = Column(Float)
+    pickup_lat = Column(Float)
+    dropoff_lon = Column(Float)
+    dropoff_lat = Column(Float)
+    pickup_band = Column(Integer)
     
-    user = relationship("User", back_populates="rides")
\ No newline at end of file
+    user = relationship("User", back_populates="rides")
+
+    __table_args__ = (
+        Index("ix_rides_created_id", "created_at", "id"),
+        Index("ix_rides_status_created_id", "status", "created_at", "id"),
+        Index("ix_rides_user_created_id", "user_id", "created_at", "id"),
+        Index("ix_rides_driver_status", "driver_id", "status"),
+        Index("ix_rides_status_band_lon", "status", "pickup_band", "pickup_lon", "pickup_lat"),
+    )
\ No newline at end of file
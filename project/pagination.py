@@ -0,0 +1,55 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import tuple_
+
+# --- CONFIG ---
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# --------------
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for anything malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+
+
+def keyset_query(query, created_col, id_col, limit: int, cursor: Optional[str] = None, descending: bool = False):
+    """``query`` narrowed to the page after ``cursor``, plus one row to detect a next page.
+
+    The cursor holds the sort key of the last row already returned, so the
+    next page is a range scan that starts right after it instead of an
+    OFFSET that re-reads every earlier row.
+
+    Works on a ``select()`` as well as a legacy ``Query``, so async sessions
+    can run it; pass the rows to ``split_page``.
+    """
+    key = tuple_(created_col, id_col)
+    if cursor is not None:
+        after = decode_cursor(cursor)
+        query = query.filter(key < after if descending else key > after)
+    if descending:
+        query = query.order_by(created_col.desc(), id_col.desc())
+    else:
+        query = query.order_by(created_col, id_col)
+    return query.limit(limit + 1)
+
+
+def split_page(rows, limit: int):
+    """``(rows, next_cursor)`` from the ``limit + 1`` rows ``keyset_query`` fetched."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.created_at, last.id)
@@ -0,0 +1,78 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+# --- CONFIG ---
+# 0 runs bcrypt inline on the event loop (the old behaviour, kept for benchmarks)
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_POOL_MAX_QUEUE = int(os.getenv("PASSWORD_POOL_MAX_QUEUE", "32"))
+# --------------
+
+
+class PoolSaturated(Exception):
+    """Every worker is busy and the wait queue is full."""
+
+
+class PasswordPool:
+    """Bounded thread pool for bcrypt hashing and verification.
+
+    bcrypt releases the GIL while it works, so a few threads keep password
+    checks off the event loop.  At most ``workers + max_queue`` jobs are
+    accepted at once; beyond that ``run`` raises PoolSaturated immediately so
+    a login storm fails fast instead of queueing without bound.
+    """
+
+    def __init__(self, workers: int = PASSWORD_POOL_WORKERS, max_queue: int = PASSWORD_POOL_MAX_QUEUE):
+        self.workers = workers
+        self.capacity = workers + max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt") if workers > 0 else None
+        # Only touched from the event loop thread
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, fn, *args):
+        if self._executor is None:
+            self.completed += 1
+            return fn(*args)
+        if self.in_flight >= self.capacity:
+            self.rejected += 1
+            raise PoolSaturated(f"{self.in_flight} password jobs already queued")
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+_pool: Optional[PasswordPool] = None
+
+
+def get_password_pool() -> PasswordPool:
+    """Return the process-wide password pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        _pool = PasswordPool()
+    return _pool
+
+
+def close_password_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
@@ -0,0 +1,124 @@
+"""Client-side copy of the pending ride list, kept current from ``/rides/stream``.
+
+The driver screens use this instead of polling ``/rides/pending``. The list is
+loaded once, and again only when the server sends ``resync``. After that,
+ride-created, ride-accepted and ride-completed events are applied as they
+arrive. ``on_change`` is called from the background thread after every change.
+"""
+import json
+import threading
+
+import requests
+
+import conditional_get
+
+RECONNECT_DELAY_S = 1
+MAX_RECONNECT_DELAY_S = 30
+
+
+class PendingRidesView:
+    def __init__(self, api, token=None, on_change=None):
+        self.api = api
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self.on_change = on_change
+        self.last_event_id = None
+        self.error = None
+        self._rides = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._response = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._response is not None:
+            self._response.close()
+
+    def rides(self):
+        """Pending rides, oldest first."""
+        with self._lock:
+            return sorted(self._rides.values(), key=lambda r: (r["created_at"], r["id"]))
+
+    def reload(self):
+        """Replace the local copy with a fresh /rides/pending listing."""
+        rides, cursor = {}, None
+        while True:
+            params = {"limit": 200}
+            if cursor:
+                params["cursor"] = cursor
+            resp = conditional_get.get(f"{self.api}/rides/pending", params=params, headers=self.headers, timeout=10)
+            resp.raise_for_status()
+            for ride in resp.json():
+                rides[ride["id"]] = ride
+            cursor = resp.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        with self._lock:
+            self._rides = rides
+        self._changed()
+
+    def apply(self, event_type, data):
+        with self._lock:
+            if event_type == "ride-created":
+                self._rides[data["id"]] = data
+            elif event_type in ("ride-accepted", "ride-completed"):
+                self._rides.pop(data["id"], None)
+            else:
+                return
+        self._changed()
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+    def _run(self):
+        delay = RECONNECT_DELAY_S
+        while not self._stop.is_set():
+            try:
+                self._listen()
+                delay = RECONNECT_DELAY_S
+            except Exception as ex:
+                # stop() closes the response under the reader; that is not an error
+                if self._stop.is_set():
+                    break
+                self.error = str(ex)
+                self._changed()
+                delay = min(delay * 2, MAX_RECONNECT_DELAY_S)
+            self._stop.wait(delay)
+
+    def _listen(self):
+        headers = dict(self.headers)
+        if self.last_event_id:
+            headers["Last-Event-ID"] = self.last_event_id
+        # The server sends a keepalive every 15 s, so a silent minute means a dead connection
+        with requests.get(f"{self.api}/rides/stream", headers=headers, stream=True, timeout=(10, 60)) as resp:
+            resp.raise_for_status()
+            self._response = resp
+            self.error = None
+            event_id, event_type, data = None, None, []
+            for line in resp.iter_lines(decode_unicode=True):
+                if self._stop.is_set():
+                    return
+                if line:
+                    field, _, value = line.partition(":")
+                    value = value[1:] if value.startswith(" ") else value
+                    if field == "id":
+                        event_id = value
+                    elif field == "event":
+                        event_type = value
+                    elif field == "data":
+                        data.append(value)
+                    continue
+                # A blank line ends the event
+                if event_type == "resync":
+                    self.reload()
+                elif event_type:
+                    self.apply(event_type, json.loads("\n".join(data)))
+                if event_id:
+                    self.last_event_id = event_id
+                event_id, event_type, data = None, None, []
@@ -0,0 +1,326 @@
+"""Slow-query log and N+1 detection on the SQLAlchemy engine.
+
+Every statement is timed from execute until its cursor is closed, so SQLite's
+row stepping during fetches is included. Rows are counted as they are
+fetched, because SQLite reports no row count for SELECT. Statements are
+grouped by shape: their SQL with whitespace collapsed and expanded IN lists
+folded into one placeholder. For each shape the module keeps count, time,
+rows and the project line that ran it first.
+
+A statement slower than ``SLOW_QUERY_MS`` is logged with its call site.
+``TracedAsyncSession`` remembers who awaited each AsyncSession call, as its
+statements run in a greenlet whose stack does not reach the caller. A
+request that runs one shape ``N_PLUS_ONE_THRESHOLD`` times is logged once as
+a likely N+1, such as lazy loads of ``Ride.user`` in a loop over rides.
+``/debug/slow_queries`` lists the slowest shapes.
+"""
+import functools
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# --- CONFIG ---
+QUERY_LOG_ENABLED = os.getenv("QUERY_LOG_ENABLED", "1") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+QUERY_STATS_MAX_SHAPES = int(os.getenv("QUERY_STATS_MAX_SHAPES", "500"))
+# --------------
+
+logger = logging.getLogger("query_log")
+
+THIS_FILE = os.path.abspath(__file__)
+PROJECT_DIR = os.path.dirname(THIS_FILE)
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+# (label, Counter of shapes) for the request being served; None outside one
+_request: ContextVar = ContextVar("query_log_request", default=None)
+# Frame of the code awaiting the current TracedAsyncSession call; None outside one
+_caller: ContextVar = ContextVar("query_log_caller", default=None)
+
+
+class ShapeStats:
+    __slots__ = ("count", "total_s", "max_s", "rows", "call_site", "n_plus_one")
+
+    def __init__(self, call_site: str):
+        self.count = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self.rows = 0
+        self.call_site = call_site
+        self.n_plus_one = 0
+
+    def as_dict(self, shape: str) -> dict:
+        return {
+            "statement": shape,
+            "count": self.count,
+            "total_ms": round(self.total_s * 1000, 3),
+            "mean_ms": round(self.total_s / self.count * 1000, 3) if self.count else None,
+            "max_ms": round(self.max_s * 1000, 3),
+            "rows": self.rows,
+            "call_site": self.call_site,
+            "n_plus_one": self.n_plus_one,
+        }
+
+
+class QueryLog:
+    def __init__(self, slow_ms: float = SLOW_QUERY_MS, n_plus_one: int = N_PLUS_ONE_THRESHOLD,
+                 max_shapes: int = QUERY_STATS_MAX_SHAPES):
+        self.slow_s = slow_ms / 1000
+        self.n_plus_one = n_plus_one
+        self.max_shapes = max_shapes
+        self.slow = 0
+        self.untracked = 0
+        self._stats = {}
+        self._shapes = {}
+        # Dispatch rounds run statements on executor threads too
+        self._lock = threading.Lock()
+
+    def shape_of(self, statement: str) -> str:
+        shape = self._shapes.get(statement)
+        if shape is None:
+            shape = _IN_LIST.sub("(?)", _SPACE.sub(" ", statement).strip())
+            if len(self._shapes) >= 4 * self.max_shapes:
+                self._shapes.clear()
+            self._shapes[statement] = shape
+        return shape
+
+    def record(self, statement: str, elapsed: float, rows: int):
+        shape = self.shape_of(statement)
+        with self._lock:
+            stats = self._stats.get(shape)
+            if stats is None:
+                if len(self._stats) >= self.max_shapes:
+                    self.untracked += 1
+                    stats = None
+                else:
+                    stats = self._stats[shape] = ShapeStats(call_site())
+            if stats is not None:
+                stats.count += 1
+                stats.total_s += elapsed
+                stats.max_s = max(stats.max_s, elapsed)
+                stats.rows += max(rows, 0)
+
+        if elapsed >= self.slow_s:
+            self.slow += 1
+            logger.warning("slow query %.1f ms, %d rows, at %s: %s", elapsed * 1000, rows, call_site(), shape)
+
+        request = _request.get()
+        if request is not None:
+            label, counts = request
+            counts[shape] += 1
+            if counts[shape] == self.n_plus_one:
+                if stats is not None:
+                    with self._lock:
+                        stats.n_plus_one += 1
+                logger.warning("possible N+1: %s ran the same statement %d times, at %s: %s",
+                               label, self.n_plus_one, call_site(), shape)
+
+    def top(self, limit: int = 20, order: str = "max") -> List[dict]:
+        key = {
+            "max": lambda item: item[1].max_s,
+            "total": lambda item: item[1].total_s,
+            "mean": lambda item: item[1].total_s / item[1].count if item[1].count else 0,
+            "count": lambda item: item[1].count,
+        }[order]
+        with self._lock:
+            items = sorted(self._stats.items(), key=key, reverse=True)[:limit]
+            return [stats.as_dict(shape) for shape, stats in items]
+
+    def summary(self) -> dict:
+        return {
+            "slow_query_ms": self.slow_s * 1000,
+            "n_plus_one_threshold": self.n_plus_one,
+            "shapes": len(self._stats),
+            "slow_queries": self.slow,
+            "untracked_statements": self.untracked,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.slow = 0
+            self.untracked = 0
+
+
+def call_site() -> str:
+    """The innermost project frame outside this module, as ``file:line in function``."""
+    site = _project_frame(sys._getframe(1))
+    if site is None:
+        site = _project_frame(_caller.get())
+    return site or "?"
+
+
+def _project_frame(frame) -> Optional[str]:
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        # Generated code is named like "<string>"; project modules imported
+        # from the working directory can carry relative paths
+        filename = "" if filename.startswith("<") else os.path.abspath(filename)
+        if filename.startswith(PROJECT_DIR + os.sep) and filename != THIS_FILE:
+            return f"{os.path.relpath(filename, PROJECT_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def _traced(method):
+    @functools.wraps(method)
+    async def traced(self, *args, **kwargs):
+        token = _caller.set(sys._getframe(1))
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            _caller.reset(token)
+    return traced
+
+
+class TracedAsyncSession(AsyncSession):
+    """AsyncSession whose statements are logged with the line that awaited them."""
+
+    execute = _traced(AsyncSession.execute)
+    scalar = _traced(AsyncSession.scalar)
+    scalars = _traced(AsyncSession.scalars)
+    get = _traced(AsyncSession.get)
+    stream = _traced(AsyncSession.stream)
+    refresh = _traced(AsyncSession.refresh)
+    flush = _traced(AsyncSession.flush)
+    commit = _traced(AsyncSession.commit)
+
+
+class CountingCursor(sqlite3.Cursor):
+    """Counts fetched rows and fetch time, and reports the statement when closed."""
+    pending = None
+    rows = 0
+    fetch_s = 0.0
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.fetch_s += time.perf_counter() - start
+        if row is not None:
+            self.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        start = time.perf_counter()
+        rows = super().fetchmany(*args, **kwargs)
+        self.fetch_s += time.perf_counter() - start
+        self.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.fetch_s += time.perf_counter() - start
+        self.rows += len(rows)
+        return rows
+
+    def close(self):
+        pending, self.pending = self.pending, None
+        if pending is not None:
+            query_log, statement, execute_s = pending
+            rows = self.rows if self.description is not None else self.rowcount
+            query_log.record(statement, execute_s + self.fetch_s, rows)
+        elif self.connection.tally is not None:
+            self.connection.tally.rows = self.rows
+        super().close()
+
+
+class RowTally:
+    """Rows fetched by the last cursor closed on one async SQLite connection.
+
+    aiosqlite fetches and closes its cursor inside execute, on its own thread,
+    so the count is handed over here rather than reported on close.
+    """
+    rows = 0
+
+
+class CountingConnection(sqlite3.Connection):
+    tally: Optional[RowTally] = None
+
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+
+def tallying_connection(tally: RowTally):
+    """A sqlite3 connection factory whose cursors report rows to ``tally``."""
+    def connect(*args, **kwargs):
+        conn = CountingConnection(*args, **kwargs)
+        conn.tally = tally
+        return conn
+    return connect
+
+
+def instrument_engine(engine, query_log: Optional[QueryLog] = None):
+    """Record every statement ``engine`` runs in ``query_log``.
+
+    Must run before the engine opens its first connection, so SQLite
+    connections are made with the row-counting cursor.
+    """
+    if not QUERY_LOG_ENABLED:
+        return
+    query_log = query_log or get_query_log()
+
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "do_connect")
+        def counting_cursors(dialect, conn_rec, cargs, cparams):
+            if dialect.is_async:
+                # cparams is shared by every connect, so each one sets its own factory
+                tally = conn_rec.info["query_log_tally"] = RowTally()
+                cparams["factory"] = tallying_connection(tally)
+            else:
+                cparams.setdefault("factory", CountingConnection)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        context._query_log_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_log_start
+        if isinstance(cursor, CountingCursor):
+            # Rows are fetched after this returns; the cursor reports on close
+            cursor.pending = (query_log, statement, elapsed)
+            cursor.rows, cursor.fetch_s = 0, 0.0
+        elif cursor.description is not None and "query_log_tally" in conn.info:
+            # aiosqlite has already fetched every row, into a counting cursor
+            query_log.record(statement, elapsed, conn.info["query_log_tally"].rows)
+        else:
+            query_log.record(statement, elapsed, cursor.rowcount)
+
+
+class QueryLogMiddleware:
+    """Groups statements by request so repeated shapes can be spotted."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not QUERY_LOG_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        token = _request.set((f"{scope['method']} {scope['path']}", Counter()))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request.reset(token)
+
+
+_query_log: Optional[QueryLog] = None
+
+
+def get_query_log() -> QueryLog:
+    global _query_log
+    if _query_log is None:
+        _query_log = QueryLog()
+    return _query_log
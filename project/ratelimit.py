@@ -0,0 +1,210 @@
+"""Token-bucket rate limits for the expensive endpoints.
+
+Each limit class has its own budget, written ``"capacity/seconds"``: a
+bucket holds up to ``capacity`` tokens and refills at ``capacity`` per
+``seconds``, so a client may burst to ``capacity`` requests and then keeps
+that average rate. Buckets are keyed by user id or client address, and a
+bucket is two numbers, updated in constant time per request.
+
+``RATE_LIMIT_STORE=memory`` keeps buckets per worker. ``sqlite`` keeps them
+in the file ``RATE_LIMIT_DB_PATH`` so every worker on the machine shares
+the same budgets.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+# --- CONFIG ---
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "ratelimit.db")
+# Ride requests per user; each ride of a batch takes a token
+RATE_LIMIT_RIDES = os.getenv("RATE_LIMIT_RIDES", "30/60")
+# /register, /token and /login per client address
+RATE_LIMIT_AUTH = os.getenv("RATE_LIMIT_AUTH", "10/60")
+# Buckets kept in memory; the least recently used start over full
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# --------------
+
+
+class RateLimited(Exception):
+    def __init__(self, limit_class: str, retry_after: float):
+        super().__init__(f"{limit_class} rate limit exceeded")
+        self.retry_after = retry_after
+
+
+class Limit(NamedTuple):
+    capacity: float
+    period_s: float
+
+    @property
+    def refill_per_s(self) -> float:
+        return self.capacity / self.period_s
+
+
+def parse_limit(spec: str) -> Optional[Limit]:
+    """Parse ``"capacity/seconds"``; ``"0"`` or an empty string means no limit."""
+    if not spec or spec.strip() == "0":
+        return None
+    capacity, _, period = spec.partition("/")
+    limit = Limit(float(capacity), float(period or 1))
+    if limit.capacity <= 0 or limit.period_s <= 0:
+        raise ValueError(f"invalid rate limit {spec!r}")
+    return limit
+
+
+def refill(tokens: float, elapsed_s: float, limit: Limit, cost: float) -> Tuple[float, float]:
+    """Return ``(tokens left, seconds to wait)`` after trying to take ``cost`` tokens.
+
+    Nothing is taken when the wait is above zero.
+    """
+    tokens = min(limit.capacity, tokens + max(0.0, elapsed_s) * limit.refill_per_s)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / limit.refill_per_s
+
+
+class MemoryBucketStore:
+    """Buckets in this process, least recently used dropped beyond ``max_keys``."""
+
+    blocking = False
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str, limit: Limit, cost: float) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (limit.capacity, now))
+        tokens, wait = refill(tokens, now - updated, limit, cost)
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def close(self):
+        pass
+
+
+class SqliteBucketStore:
+    """Buckets in a SQLite file shared by the workers of one machine.
+
+    Each take is one short write transaction. Timestamps are wall-clock time,
+    because monotonic clocks are not comparable across processes.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=OFF")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def take(self, key: str, limit: Limit, cost: float) -> float:
+        with self._lock:
+            # IMMEDIATE takes the write lock first, so two workers cannot both spend the same tokens
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute(
+                    "SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens, updated = row if row else (limit.capacity, now)
+                tokens, wait = refill(tokens, now - updated, limit, cost)
+                self._conn.execute("INSERT OR REPLACE INTO rate_buckets VALUES (?, ?, ?)", (key, tokens, now))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def purge_idle(self, idle_s: float) -> int:
+        """Drop buckets untouched for ``idle_s``; a full bucket needs no row."""
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM rate_buckets WHERE updated_at < ?", (time.time() - idle_s,)
+            ).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RateLimiter:
+    """Named limit classes over one bucket store."""
+
+    def __init__(self, limits: Dict[str, Optional[Limit]], store):
+        self.limits = {name: limit for name, limit in limits.items() if limit is not None}
+        self.store = store
+        self.allowed: Dict[str, int] = {name: 0 for name in self.limits}
+        self.limited: Dict[str, int] = {name: 0 for name in self.limits}
+
+    async def hit(self, limit_class: str, key: str, cost: float = 1):
+        """Take ``cost`` tokens or raise RateLimited; a class without a limit always passes.
+
+        A cost above the bucket's capacity is charged as the whole capacity,
+        so a large batch needs a full bucket and empties it.
+        """
+        limit = self.limits.get(limit_class)
+        if limit is None:
+            return
+        cost = min(cost, limit.capacity)
+        bucket_key = f"{limit_class}:{key}"
+        if self.store.blocking:
+            wait = await asyncio.get_running_loop().run_in_executor(None, self.store.take, bucket_key, limit, cost)
+        else:
+            wait = self.store.take(bucket_key, limit, cost)
+        if wait > 0:
+            self.limited[limit_class] += 1
+            raise RateLimited(limit_class, wait)
+        self.allowed[limit_class] += 1
+
+    def stats(self) -> dict:
+        return {
+            "store": type(self.store).__name__,
+            "limits": {name: f"{limit.capacity:g}/{limit.period_s:g}" for name, limit in self.limits.items()},
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+
+_limiter: Optional[RateLimiter] = None
+
+
+def create_store(kind: str = RATE_LIMIT_STORE):
+    if kind == "memory":
+        return MemoryBucketStore()
+    if kind == "sqlite":
+        return SqliteBucketStore(RATE_LIMIT_DB_PATH)
+    raise ValueError(f"unknown RATE_LIMIT_STORE {kind!r}")
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide rate limiter, creating it on first use."""
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter(
+            {"rides": parse_limit(RATE_LIMIT_RIDES), "auth": parse_limit(RATE_LIMIT_AUTH)},
+            create_store(),
+        )
+        if isinstance(_limiter.store, SqliteBucketStore) and _limiter.limits:
+            # A bucket idle for a whole period is full again, the same as no row
+            _limiter.store.purge_idle(max(limit.period_s for limit in _limiter.limits.values()))
+    return _limiter
+
+
+def close_rate_limiter():
+    global _limiter
+    if _limiter is not None:
+        _limiter.store.close()
+        _limiter = None
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+# --- CONFIG ---
+ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", "10000"))
+ROUTE_CACHE_TTL_S = float(os.getenv("ROUTE_CACHE_TTL_S", "21600"))
+ROUTE_CACHE_PRECISION = int(os.getenv("ROUTE_CACHE_PRECISION", "5"))
+ROUTE_CACHE_DB_PATH = os.getenv("ROUTE_CACHE_DB_PATH", "")
+# Seconds between deletions of expired rows from the persistent tier
+ROUTE_CACHE_PURGE_S = float(os.getenv("ROUTE_CACHE_PURGE_S", "600"))
+# --------------
+
+Route = Tuple[float, float]
+
+
+def route_key(pickup: str, dropoff: str, precision: int = ROUTE_CACHE_PRECISION) -> Optional[str]:
+    """Return the cache key for a pair of ``"lon,lat"`` points, or None if unparseable."""
+    try:
+        coords = [float(v) for v in pickup.split(",") + dropoff.split(",")]
+    except ValueError:
+        return None
+    if len(coords) != 4:
+        return None
+    return ";".join(f"{c:.{precision}f}" for c in coords)
+
+
+class SqliteRouteStore:
+    """Second cache tier kept in a SQLite file so routes survive restarts.
+
+    Expired rows are deleted when the store opens and then by ``put`` at most
+    every ``purge_interval_s``, so the file stays bounded by what is live.
+    """
+
+    def __init__(self, path: str, purge_interval_s: float = ROUTE_CACHE_PURGE_S):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.purge_interval_s = purge_interval_s
+        self.purged = 0
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS route_cache ("
+                " key TEXT PRIMARY KEY, distance_m REAL NOT NULL,"
+                " duration_s REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_route_cache_expires_at ON route_cache (expires_at)"
+            )
+        self.purge_expired()
+
+    def get(self, key: str) -> Optional[Route]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT distance_m, duration_s FROM route_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def put(self, key: str, route: Route, ttl_s: float):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO route_cache VALUES (?, ?, ?, ?)",
+                (key, route[0], route[1], time.time() + ttl_s),
+            )
+        if time.monotonic() >= self._next_purge:
+            self.purge_expired()
+
+    def purge_expired(self) -> int:
+        with self._lock, self._conn:
+            deleted = self._conn.execute(
+                "DELETE FROM route_cache WHERE expires_at <= ?", (time.time(),)
+            ).rowcount
+            self.purged += deleted
+            self._next_purge = time.monotonic() + self.purge_interval_s
+        return deleted
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RouteCache:
+    """Bounded LRU of route lookups with TTL, an optional persistent tier
+    and coalescing of concurrent lookups for the same key."""
+
+    def __init__(
+        self,
+        max_entries: int = ROUTE_CACHE_SIZE,
+        ttl_s: float = ROUTE_CACHE_TTL_S,
+        precision: int = ROUTE_CACHE_PRECISION,
+        store: Optional[SqliteRouteStore] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.precision = precision
+        self.store = store
+        self._entries: "OrderedDict[str, Tuple[float, Route]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get_or_fetch(self, pickup: str, dropoff: str,
+                           fetch: Callable[[str, str], Awaitable[Route]]) -> Route:
+        key = route_key(pickup, dropoff, self.precision)
+        if key is None:
+            return await fetch(pickup, dropoff)
+
+        route = self._get(key)
+        if route is not None:
+            self.hits += 1
+            return route
+
+        lookup = self._inflight.get(key)
+        if lookup is not None:
+            self.coalesced += 1
+        else:
+            # Its own task, so a caller that is cancelled does not cancel it for the others
+            lookup = asyncio.ensure_future(self._load(key, pickup, dropoff, fetch))
+            self._inflight[key] = lookup
+            lookup.add_done_callback(lambda task: self._lookup_done(key, task))
+        return await asyncio.shield(lookup)
+
+    def _lookup_done(self, key: str, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved when every caller went away
+            task.exception()
+
+    async def _load(self, key, pickup, dropoff, fetch) -> Route:
+        loop = asyncio.get_running_loop()
+        if self.store is not None:
+            route = await loop.run_in_executor(None, self.store.get, key)
+            if route is not None:
+                self.store_hits += 1
+                self._put(key, route)
+                return route
+
+        self.misses += 1
+        route = await fetch(pickup, dropoff)
+        self._put(key, route)
+        if self.store is not None:
+            await loop.run_in_executor(None, self.store.put, key, route, self.ttl_s)
+        return route
+
+    def _get(self, key: str) -> Optional[Route]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, route = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return route
+
+    def _put(self, key: str, route: Route):
+        self._entries[key] = (time.monotonic() + self.ttl_s, route)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.store_hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else None,
+            "persistent": self.store is not None,
+            "store_purged": self.store.purged if self.store is not None else 0,
+        }
+
+
+_cache: Optional[RouteCache] = None
+
+
+def get_route_cache() -> RouteCache:
+    """Return the process-wide route cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        store = SqliteRouteStore(ROUTE_CACHE_DB_PATH) if ROUTE_CACHE_DB_PATH else None
+        _cache = RouteCache(store=store)
+    return _cache
+
+
+def close_route_cache():
+    global _cache
+    if _cache is not None and _cache.store is not None:
+        _cache.store.close()
+    _cache = None
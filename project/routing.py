@@ -0,0 +1,147 @@
+import asyncio
+import os
+from typing import Optional, Tuple
+
+import httpx
+
+# --- CONFIG ---
+ROUTER_BACKEND = os.getenv("ROUTER_BACKEND", "osrm")
+ROAD_GRAPH_PATH = os.getenv("ROAD_GRAPH_PATH", "road_graph.json")
+CH_PATH = os.getenv("CH_PATH", "road_graph.ch")
+OSRM_URL = os.getenv("OSRM_URL", "http://router.project-osrm.org")
+ROUTING_TIMEOUT_S = float(os.getenv("ROUTING_TIMEOUT_S", "10"))
+ROUTING_MAX_CONNECTIONS = int(os.getenv("ROUTING_MAX_CONNECTIONS", "20"))
+ROUTING_MAX_KEEPALIVE = int(os.getenv("ROUTING_MAX_KEEPALIVE", "10"))
+ROUTING_MAX_CONCURRENCY = int(os.getenv("ROUTING_MAX_CONCURRENCY", "20"))
+# --------------
+
+
+class RoutingError(Exception):
+    """Base class for routing failures."""
+
+
+class RoutingUnavailable(RoutingError):
+    """The routing service answered with a non-200 status."""
+
+
+class RouteNotFound(RoutingError):
+    """The routing service could not build a route between the points."""
+
+
+def parse_point(point: str) -> Tuple[float, float]:
+    """Parse a ``"lon,lat"`` string into floats, raising RouteNotFound if malformed."""
+    try:
+        lon, lat = (float(v) for v in point.split(","))
+    except ValueError:
+        raise RouteNotFound(f"invalid coordinates: {point!r}")
+    return lon, lat
+
+
+class Router:
+    """Interface shared by the routing backends selected with ROUTER_BACKEND."""
+
+    async def route(self, pickup: str, dropoff: str) -> Tuple[float, float]:
+        """Return ``(distance_m, duration_s)`` between two ``"lon,lat"`` points."""
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+
+class OSRMRouter(Router):
+    """Non-blocking OSRM client with a shared keep-alive connection pool.
+
+    Every call is bounded by a deadline that covers both waiting for a
+    concurrency slot and the HTTP round trip, so a slow upstream can never
+    hold a caller for longer than ``timeout`` seconds.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OSRM_URL,
+        timeout: float = ROUTING_TIMEOUT_S,
+        max_connections: int = ROUTING_MAX_CONNECTIONS,
+        max_keepalive: int = ROUTING_MAX_KEEPALIVE,
+        max_concurrency: int = ROUTING_MAX_CONCURRENCY,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+            ),
+        )
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def route(self, pickup: str, dropoff: str, timeout: Optional[float] = None) -> Tuple[float, float]:
+        try:
+            return await asyncio.wait_for(
+                self._route(pickup, dropoff),
+                timeout=self.timeout if timeout is None else timeout,
+            )
+        except asyncio.TimeoutError:
+            raise RoutingError("routing request timed out")
+        except httpx.HTTPError as e:
+            raise RoutingError(str(e) or type(e).__name__)
+
+    async def _route(self, pickup: str, dropoff: str) -> Tuple[float, float]:
+        async with self._slots:
+            response = await self._http.get(
+                f"/route/v1/driving/{pickup};{dropoff}",
+                params={"overview": "false"},
+            )
+
+        if response.status_code != 200:
+            raise RoutingUnavailable(f"routing service returned {response.status_code}")
+
+        try:
+            data = response.json()
+        except ValueError:
+            raise RoutingUnavailable("routing service returned a body that is not JSON")
+        if not isinstance(data, dict):
+            raise RoutingUnavailable("routing service returned an unexpected body")
+        if data.get("code") != "Ok" or not data.get("routes"):
+            raise RouteNotFound(data.get("message", "no route"))
+
+        try:
+            route = data["routes"][0]
+            return route["distance"], route["duration"]
+        except (KeyError, IndexError, TypeError):
+            raise RoutingUnavailable("routing service returned a route without distance or duration")
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+_router: Optional[Router] = None
+
+
+def create_router(backend: str = ROUTER_BACKEND) -> Router:
+    if backend == "osrm":
+        from routing_guard import GuardedRouter
+        return GuardedRouter(OSRMRouter())
+    if backend == "local":
+        from local_router import LocalRouter
+        return LocalRouter.from_file(ROAD_GRAPH_PATH)
+    if backend == "ch":
+        from contraction import CHRouter
+        return CHRouter.from_file(CH_PATH)
+    raise ValueError(f"unknown ROUTER_BACKEND {backend!r}")
+
+
+def get_router() -> Router:
+    """Return the process-wide router, creating it on first use."""
+    global _router
+    if _router is None:
+        _router = create_router()
+    return _router
+
+
+async def close_router():
+    global _router
+    if _router is not None:
+        await _router.aclose()
+        _router = None
@@ -0,0 +1,243 @@
+"""Protection for the backend against a slow or failing routing service.
+
+``GuardedRouter`` wraps the OSRM router with three guards:
+
+* Admission control: at most ``ROUTING_MAX_IN_FLIGHT`` lookups, hedges
+  included, are in flight per worker. Beyond that a lookup fails at once
+  with ``RoutingOverloaded`` instead of queueing behind a slow upstream.
+* Circuit breaker: after ``ROUTING_BREAKER_FAILURES`` failed lookups in a
+  row, lookups fail at once with ``CircuitOpen`` for ``ROUTING_BREAKER_RESET_S``
+  seconds. Then one trial lookup is let through; it closes the circuit if it
+  succeeds and opens it again if not. A route that does not exist is an
+  answer, not a failure.
+* Hedging: a lookup still running after the ``ROUTING_HEDGE_PERCENTILE``
+  latency of recent lookups gets a second attempt, and the first answer
+  wins. Hedges are paid for from a budget that grows by
+  ``ROUTING_HEDGE_BUDGET`` per lookup, so they add at most that share of
+  extra load even when every lookup is slow.
+
+Both rejections carry ``retry_after``, the seconds a client should wait.
+A value of ``0`` turns the matching guard off.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Optional, Tuple
+
+from routing import Router, RouteNotFound, RoutingError, RoutingUnavailable, ROUTING_TIMEOUT_S
+
+# --- CONFIG ---
+ROUTING_MAX_IN_FLIGHT = int(os.getenv("ROUTING_MAX_IN_FLIGHT", "100"))
+ROUTING_BREAKER_FAILURES = int(os.getenv("ROUTING_BREAKER_FAILURES", "5"))
+ROUTING_BREAKER_RESET_S = float(os.getenv("ROUTING_BREAKER_RESET_S", "10"))
+ROUTING_HEDGE_PERCENTILE = float(os.getenv("ROUTING_HEDGE_PERCENTILE", "95"))
+ROUTING_HEDGE_MIN_S = float(os.getenv("ROUTING_HEDGE_MIN_S", "0.05"))
+ROUTING_HEDGE_BUDGET = float(os.getenv("ROUTING_HEDGE_BUDGET", "0.1"))
+# --------------
+
+# Recent latencies the hedge delay is taken from, and how many it needs first
+LATENCY_WINDOW = 256
+MIN_LATENCY_SAMPLES = 20
+# Unspent hedges kept, so a quiet spell cannot save up a burst of them
+MAX_HEDGE_TOKENS = 10.0
+
+Route = Tuple[float, float]
+
+
+class RoutingShed(RoutingUnavailable):
+    """A lookup refused without asking the routing service."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RoutingOverloaded(RoutingShed):
+    """ROUTING_MAX_IN_FLIGHT lookups are already running."""
+
+
+class CircuitOpen(RoutingShed):
+    """The routing service failed too often lately."""
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, max_failures: int = ROUTING_BREAKER_FAILURES, reset_s: float = ROUTING_BREAKER_RESET_S):
+        self.max_failures = max_failures
+        self.reset_s = reset_s
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.opened = 0
+        self.rejected = 0
+
+    def before_call(self):
+        """Raise CircuitOpen unless a lookup may go ahead now."""
+        if self.max_failures <= 0 or self.state == self.CLOSED:
+            return
+        remaining = self.opened_at + self.reset_s - time.monotonic()
+        if self.state == self.OPEN and remaining <= 0:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self.trial_running:
+            self.trial_running = True
+            return
+        self.rejected += 1
+        raise CircuitOpen("routing service is failing, not calling it for now", max(remaining, 1.0))
+
+    def abandon(self):
+        """Forget a lookup that was cancelled, so a half-open circuit can try again."""
+        self.trial_running = False
+
+    def record_success(self):
+        self.failures = 0
+        self.trial_running = False
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_running = False
+        if self.max_failures > 0 and (self.state == self.HALF_OPEN or self.failures >= self.max_failures):
+            if self.state != self.OPEN:
+                self.opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self.failures, "opened": self.opened, "rejected": self.rejected}
+
+
+class GuardedRouter(Router):
+    """Router that sheds, breaks and hedges in front of another one."""
+
+    def __init__(
+        self,
+        inner: Router,
+        timeout: float = ROUTING_TIMEOUT_S,
+        max_in_flight: int = ROUTING_MAX_IN_FLIGHT,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge_percentile: float = ROUTING_HEDGE_PERCENTILE,
+        hedge_min_s: float = ROUTING_HEDGE_MIN_S,
+        hedge_budget: float = ROUTING_HEDGE_BUDGET,
+    ):
+        self.inner = inner
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_s = hedge_min_s
+        self.hedge_budget = hedge_budget
+        self._latencies: "deque[float]" = deque(maxlen=LATENCY_WINDOW)
+        self._hedge_delay: Optional[float] = None
+        self._hedge_tokens = MAX_HEDGE_TOKENS
+        # Only touched from the event loop thread
+        self.in_flight = 0
+        self.shed = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """The hedge delay, or None while hedging is off or has too few samples."""
+        if self.hedge_percentile <= 0 or len(self._latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        if self._hedge_delay is None:
+            ordered = sorted(self._latencies)
+            index = min(len(ordered) - 1, math.ceil(len(ordered) * self.hedge_percentile / 100) - 1)
+            self._hedge_delay = max(self.hedge_min_s, ordered[index])
+        return self._hedge_delay
+
+    def _admit(self):
+        if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+            self.shed += 1
+            raise RoutingOverloaded(f"{self.in_flight} route lookups already in flight", 1.0)
+
+    def _release(self, task=None):
+        self.in_flight -= 1
+
+    async def route(self, pickup: str, dropoff: str) -> Route:
+        self._admit()
+        self.breaker.before_call()
+        start = time.monotonic()
+        # Counted before the first await, so callers arriving together are limited too
+        self.in_flight += 1
+        try:
+            route = await self._hedged(pickup, dropoff, start + self.timeout)
+        except RouteNotFound:
+            self.breaker.record_success()
+            raise
+        except asyncio.CancelledError:
+            # The caller went away, which says nothing about the service
+            self.breaker.abandon()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        finally:
+            self._release()
+        self.breaker.record_success()
+        self._latencies.append(time.monotonic() - start)
+        self._hedge_delay = None
+        return route
+
+    async def _hedged(self, pickup: str, dropoff: str, deadline: float) -> Route:
+        """First answer of the lookup and its hedge, if any, by ``deadline``.
+
+        The first attempt ends by the deadline on its own, as the inner router
+        has the same timeout. Only a hedge is cut short.
+        """
+        self._hedge_tokens = min(MAX_HEDGE_TOKENS, self._hedge_tokens + self.hedge_budget)
+        first = asyncio.ensure_future(self.inner.route(pickup, dropoff))
+        delay = self.hedge_delay()
+        attempts = [first]
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(attempts, timeout=delay)
+                if not done and self._hedge_tokens >= 1 and (
+                        self.max_in_flight <= 0 or self.in_flight < self.max_in_flight):
+                    self._hedge_tokens -= 1
+                    self.hedged += 1
+                    self.in_flight += 1
+                    hedge = asyncio.ensure_future(self.inner.route(pickup, dropoff))
+                    hedge.add_done_callback(self._release)
+                    attempts.append(hedge)
+            pending = set(attempts)
+            while True:
+                timeout = max(0.0, deadline - time.monotonic()) if first.done() else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise RoutingError("routing request timed out")
+                # A route or a missing route is final; other errors wait for the other attempt
+                for task in done:
+                    error = task.exception()
+                    if error is None or isinstance(error, RouteNotFound):
+                        if task is not first and error is None:
+                            self.hedge_wins += 1
+                        return task.result()
+                if not pending:
+                    return done.pop().result()
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # Mark a losing attempt's error as retrieved
+                    task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "shed": self.shed,
+            "breaker": self.breaker.stats(),
+            "hedge_delay_s": self.hedge_delay(),
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+        }
+
+    async def aclose(self):
+        await self.inner.aclose()
@@ -0,0 +1,168 @@
+"""Route lookups for new rides, done after the ride is stored.
+
+With ``RIDE_ROUTING_MODE=background``, ``/rides/request`` stores the ride
+with status ``routing`` and returns at once. ``ROUTING_WORKERS`` asyncio
+tasks take jobs from a queue and route them. A lookup that fails for a
+transient reason, such as a timeout or the router being down, is tried again
+after a delay that doubles each time, up to ``ROUTING_MAX_ATTEMPTS`` tries.
+A job waiting for its retry does not hold a worker. A route that cannot
+exist (``RouteNotFound``) is not retried.
+
+At most ``ROUTING_QUEUE_SIZE`` jobs are queued, waiting for a retry, or
+running. The endpoint checks ``has_room`` before it stores a ride, and sheds
+load instead of storing rides it will not route for a long time; ``submit``
+itself never refuses a job, as its ride is already stored.
+Jobs live in memory only; rides still in ``routing`` after a restart are
+queued again at startup.
+"""
+import asyncio
+import os
+import random
+from typing import Awaitable, Callable, List, NamedTuple, Set, Tuple
+
+from routing import RouteNotFound
+
+# --- CONFIG ---
+# "inline" routes inside the request, as before; "background" uses this queue
+RIDE_ROUTING_MODE = os.getenv("RIDE_ROUTING_MODE", "inline")
+ROUTING_WORKERS = int(os.getenv("ROUTING_WORKERS", "8"))
+ROUTING_QUEUE_SIZE = int(os.getenv("ROUTING_QUEUE_SIZE", "1000"))
+ROUTING_MAX_ATTEMPTS = int(os.getenv("ROUTING_MAX_ATTEMPTS", "5"))
+ROUTING_RETRY_BASE_S = float(os.getenv("ROUTING_RETRY_BASE_S", "0.5"))
+ROUTING_RETRY_MAX_S = float(os.getenv("ROUTING_RETRY_MAX_S", "30"))
+# --------------
+
+
+class RoutingJob(NamedTuple):
+    ride_id: int
+    pickup: str
+    dropoff: str
+    attempt: int = 1
+
+
+Route = Tuple[float, float]
+
+
+class RoutingJobQueue:
+    """Bounded queue of ride routing jobs served by a pool of asyncio tasks.
+
+    ``route`` looks up one route. ``on_routed(job, route)`` stores the result;
+    ``on_failed(job, reason)`` is called once a job is given up on. Both run
+    in the worker. An exception from ``on_routed`` is retried like a failed
+    lookup.
+    """
+
+    def __init__(
+        self,
+        route: Callable[[str, str], Awaitable[Route]],
+        on_routed: Callable[[RoutingJob, Route], Awaitable[None]],
+        on_failed: Callable[[RoutingJob, str], Awaitable[None]],
+        workers: int = ROUTING_WORKERS,
+        max_queue: int = ROUTING_QUEUE_SIZE,
+        max_attempts: int = ROUTING_MAX_ATTEMPTS,
+        retry_base_s: float = ROUTING_RETRY_BASE_S,
+        retry_max_s: float = ROUTING_RETRY_MAX_S,
+    ):
+        self.route = route
+        self.on_routed = on_routed
+        self.on_failed = on_failed
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.retry_base_s = retry_base_s
+        self.retry_max_s = retry_max_s
+        # Unbounded; the bound is checked by has_room before a ride is stored, so a retry always fits
+        self._queue: "asyncio.Queue[RoutingJob]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._retries: Set[asyncio.Task] = set()
+        # Only touched from the event loop thread
+        self.waiting_retry = 0
+        self.running = 0
+        self.routed = 0
+        self.retried = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @property
+    def size(self) -> int:
+        return self._queue.qsize() + self.waiting_retry + self.running
+
+    def has_room(self, count: int = 1) -> bool:
+        return self.size + count <= self.max_queue
+
+    def submit(self, job: RoutingJob):
+        """Queue ``job``, whose ride the caller stored after checking ``has_room``."""
+        self._queue.put_nowait(job)
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        tasks = self._tasks + list(self._retries)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+    def retry_delay(self, attempt: int) -> float:
+        """Exponential backoff with jitter, so retries after an outage do not arrive together."""
+        delay = min(self.retry_max_s, self.retry_base_s * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            self.running += 1
+            try:
+                await self._run(job)
+            finally:
+                self.running -= 1
+
+    async def _run(self, job: RoutingJob):
+        try:
+            route = await self.route(job.pickup, job.dropoff)
+            await self.on_routed(job, route)
+            self.routed += 1
+        except asyncio.CancelledError:
+            raise
+        except RouteNotFound as e:
+            await self._give_up(job, f"no route: {e}")
+        except Exception as e:
+            if job.attempt >= self.max_attempts:
+                await self._give_up(job, f"gave up after {job.attempt} attempts: {e}")
+                return
+            self.retried += 1
+            self.waiting_retry += 1
+            # A router that shed the lookup says how long to stay away
+            delay = max(self.retry_delay(job.attempt), getattr(e, "retry_after", 0))
+            task = asyncio.create_task(self._retry_later(delay, job._replace(attempt=job.attempt + 1)))
+            self._retries.add(task)
+            task.add_done_callback(self._retries.discard)
+
+    async def _retry_later(self, delay: float, job: RoutingJob):
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.waiting_retry -= 1
+        self._queue.put_nowait(job)
+
+    async def _give_up(self, job: RoutingJob, reason: str):
+        self.failed += 1
+        try:
+            await self.on_failed(job, reason)
+        except Exception as e:
+            print(f"Could not mark ride {job.ride_id} as failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "mode": RIDE_ROUTING_MODE,
+            "workers": self.workers,
+            "capacity": self.max_queue,
+            "queued": self._queue.qsize(),
+            "waiting_retry": self.waiting_retry,
+            "running": self.running,
+            "routed": self.routed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,151 @@
+"""State the backend workers share through the database.
+
+Each worker process has its own memory, so with ``--workers`` above 1 a
+logout, a driver's availability or a ride event would only reach the
+worker that happened to handle it. These tables carry them instead:
+
+* ``token_revocations``: logged-out tokens and per-user cut-offs. Every
+  worker copies new rows into its own RevocationList each
+  ``SHARED_STATE_POLL_S``, so checking a token stays an in-memory lookup.
+* ``ride_events``: ride events, written in the transaction that changes the
+  ride. Every worker hands the rows other workers wrote to its own stream
+  subscribers.
+* ``available_drivers``: drivers waiting for a ride. Dispatch claims a
+  driver by deleting the row in the transaction that assigns the ride, so
+  two workers cannot give one driver two rides.
+
+Expired rows are deleted every ``SHARED_STATE_PRUNE_S``.
+"""
+import json
+import os
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from dispatch import AvailableDriver
+
+# --- CONFIG ---
+# Seconds between reads of other workers' revocations and events; 0 turns it off
+SHARED_STATE_POLL_S = float(os.getenv("SHARED_STATE_POLL_S", "0.5"))
+SHARED_STATE_PRUNE_S = float(os.getenv("SHARED_STATE_PRUNE_S", "60"))
+# Events kept for workers that fall behind in polling
+SHARED_EVENT_RETENTION_S = float(os.getenv("SHARED_EVENT_RETENTION_S", "300"))
+# --------------
+
+metadata = MetaData()
+
+token_revocations = Table(
+    "token_revocations", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    # Either one token, or every token of user_id issued up to cutoff
+    Column("jti", String, nullable=True),
+    Column("user_id", Integer, nullable=True),
+    Column("cutoff", Float, nullable=True),
+    Column("expires_at", Float, nullable=False, index=True),
+)
+
+ride_events = Table(
+    "ride_events", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    # The broadcaster boot id of the worker that wrote it
+    Column("origin", String, nullable=False),
+    Column("type", String, nullable=False),
+    Column("data", Text, nullable=False),
+    Column("created_at", Float, nullable=False, index=True),
+)
+
+available_drivers = Table(
+    "available_drivers", metadata,
+    Column("driver_id", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("lon", Float, nullable=False),
+    Column("lat", Float, nullable=False),
+    Column("expires_at", Float, nullable=False),
+)
+
+
+def record_token_revocation(db: Session, jti: str, expires_at: float):
+    db.execute(insert(token_revocations).values(jti=jti, expires_at=expires_at))
+
+
+def record_user_revocation(db: Session, user_id: int, cutoff: float, token_lifetime_s: float):
+    db.execute(insert(token_revocations).values(
+        user_id=user_id, cutoff=cutoff, expires_at=cutoff + token_lifetime_s
+    ))
+
+
+def revocations_after(db: Session, after_id: int):
+    """Unexpired revocations with an id above ``after_id``, oldest first."""
+    return db.execute(
+        select(token_revocations.c.id, token_revocations.c.jti, token_revocations.c.user_id,
+               token_revocations.c.cutoff, token_revocations.c.expires_at)
+        .where(token_revocations.c.id > after_id, token_revocations.c.expires_at > time.time())
+        .order_by(token_revocations.c.id)
+    ).all()
+
+
+def record_events(db: Session, origin: str, events: Iterable[Tuple[str, dict]]):
+    """Store ride events, inside the transaction that made them happen."""
+    now = time.time()
+    rows = [{"origin": origin, "type": event_type, "data": json.dumps(data), "created_at": now}
+            for event_type, data in events]
+    if rows:
+        db.execute(insert(ride_events), rows)
+
+
+def last_event_id(db: Session) -> int:
+    return db.execute(select(func.coalesce(func.max(ride_events.c.id), 0))).scalar()
+
+
+def events_after(db: Session, after_id: int, origin: str) -> Tuple[int, List[Tuple[str, dict]]]:
+    """``(last id seen, events)`` written by other workers since ``after_id``.
+
+    SQLite commits one writer at a time, so ids become visible in order.
+    """
+    rows = db.execute(
+        select(ride_events.c.id, ride_events.c.origin, ride_events.c.type, ride_events.c.data)
+        .where(ride_events.c.id > after_id)
+        .order_by(ride_events.c.id)
+    ).all()
+    if not rows:
+        return after_id, []
+    return rows[-1].id, [(row.type, json.loads(row.data)) for row in rows if row.origin != origin]
+
+
+def report_driver(db: Session, driver: AvailableDriver, expires_at: float):
+    db.execute(delete(available_drivers).where(available_drivers.c.driver_id == driver.id))
+    db.execute(insert(available_drivers).values(
+        driver_id=driver.id, name=driver.name, lon=driver.lon, lat=driver.lat, expires_at=expires_at
+    ))
+
+
+def remove_driver(db: Session, driver_id: int):
+    db.execute(delete(available_drivers).where(available_drivers.c.driver_id == driver_id))
+
+
+def claim_driver(db: Session, driver_id: int) -> Optional[float]:
+    """Take a driver out of the pool for a ride; their expiry, or None if someone else did first."""
+    return db.execute(
+        delete(available_drivers)
+        .where(available_drivers.c.driver_id == driver_id, available_drivers.c.expires_at > time.time())
+        .returning(available_drivers.c.expires_at)
+    ).scalar()
+
+
+def drivers_available(db: Session) -> List[AvailableDriver]:
+    rows = db.execute(
+        select(available_drivers.c.driver_id, available_drivers.c.name,
+               available_drivers.c.lon, available_drivers.c.lat)
+        .where(available_drivers.c.expires_at > time.time())
+    ).all()
+    return [AvailableDriver(*row) for row in rows]
+
+
+def prune(db: Session, now: Optional[float] = None):
+    """Delete expired revocations and drivers, and events past their retention."""
+    now = time.time() if now is None else now
+    db.execute(delete(token_revocations).where(token_revocations.c.expires_at <= now))
+    db.execute(delete(available_drivers).where(available_drivers.c.expires_at <= now))
+    db.execute(delete(ride_events).where(ride_events.c.created_at < now - SHARED_EVENT_RETENTION_S))